@@ -0,0 +1,357 @@
+from datetime import date, datetime, timedelta
+from itertools import chain
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+# Orders in this status are left out of sales (but still counted by status)
+CANCELLED = 'cancelled'
+DASHBOARD_DAYS = 30
+TOP_PRODUCTS = 10
+
+# Columns the flush hook reads from each table
+TRACKED = {
+    'order': ('shop_id', 'status', 'total_amount', 'created_at'),
+    'order_item': ('order_id', 'product_id', 'quantity', 'price'),
+    'negotiation': ('status',),
+}
+# Stored values of changed columns that were expired when set, read before the flush
+OLD_VALUES = 'analytics_old_values'
+
+ANALYTICS_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS shop_daily_sales (
+        shop_id INTEGER NOT NULL,
+        day DATE NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue FLOAT NOT NULL DEFAULT 0,
+        PRIMARY KEY (shop_id, day)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS shop_order_status (
+        shop_id INTEGER NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (shop_id, status)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS product_sales (
+        product_id INTEGER PRIMARY KEY,
+        shop_id INTEGER NOT NULL,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue FLOAT NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS product_negotiation_stats (
+        product_id INTEGER PRIMARY KEY,
+        shop_id INTEGER NOT NULL,
+        negotiations INTEGER NOT NULL DEFAULT 0,
+        accepted INTEGER NOT NULL DEFAULT 0,
+        discount_total FLOAT NOT NULL DEFAULT 0
+    )''',
+    'CREATE INDEX IF NOT EXISTS ix_product_sales_shop_units ON product_sales (shop_id, units)',
+    'CREATE INDEX IF NOT EXISTS ix_product_negotiation_stats_shop ON product_negotiation_stats (shop_id)',
+]
+
+# Every write is a signed delta folded into the row with an upsert, so
+# concurrent writers never read-modify-write an aggregate
+ADD_DAILY_SALES = text(
+    'INSERT INTO shop_daily_sales (shop_id, day, orders, revenue) VALUES (:shop_id, :day, :orders, :revenue) '
+    'ON CONFLICT (shop_id, day) DO UPDATE SET orders = shop_daily_sales.orders + excluded.orders, '
+    'revenue = shop_daily_sales.revenue + excluded.revenue'
+)
+ADD_STATUS = text(
+    'INSERT INTO shop_order_status (shop_id, status, orders) VALUES (:shop_id, :status, :orders) '
+    'ON CONFLICT (shop_id, status) DO UPDATE SET orders = shop_order_status.orders + excluded.orders'
+)
+ADD_PRODUCT_SALES = text(
+    'INSERT INTO product_sales (product_id, shop_id, units, revenue) '
+    'SELECT id, shop_id, :units, :revenue FROM product WHERE id = :product_id '
+    'ON CONFLICT (product_id) DO UPDATE SET units = product_sales.units + excluded.units, '
+    'revenue = product_sales.revenue + excluded.revenue'
+)
+# Discount is the accepted price's percentage off the asking price
+ADD_NEGOTIATIONS = text(
+    'INSERT INTO product_negotiation_stats (product_id, shop_id, negotiations, accepted, discount_total) '
+    'SELECT n.product_id, p.shop_id, :opened, :accepted, :accepted * COALESCE('
+    '(n.initial_price - COALESCE(n.final_price, n.offered_price)) * 100.0 / NULLIF(n.initial_price, 0), 0) '
+    'FROM negotiation n JOIN product p ON p.id = n.product_id WHERE n.id = :id '
+    'ON CONFLICT (product_id) DO UPDATE SET '
+    'negotiations = product_negotiation_stats.negotiations + excluded.negotiations, '
+    'accepted = product_negotiation_stats.accepted + excluded.accepted, '
+    'discount_total = product_negotiation_stats.discount_total + excluded.discount_total'
+)
+ORDER_ITEMS = text('SELECT product_id, quantity, price FROM order_item WHERE order_id = :order_id')
+
+def ensure_analytics_tables(conn):
+    for statement in ANALYTICS_TABLES:
+        conn.execute(text(statement))
+
+def _day(created_at):
+    return (created_at or datetime.utcnow()).date().isoformat()
+
+def record_order(conn, shop_id, created_at, status, total, sign=1):
+    """Count a placed order (sign=-1 uncounts a deleted one)"""
+    conn.execute(ADD_STATUS, {'shop_id': shop_id, 'status': status, 'orders': sign})
+    if status != CANCELLED:
+        conn.execute(ADD_DAILY_SALES, {'shop_id': shop_id, 'day': _day(created_at),
+                                       'orders': sign, 'revenue': sign * (total or 0)})
+
+def record_status_change(conn, order_id, shop_id, created_at, old, new, total):
+    """Move an order between status counts; cancelling takes it and its items out of sales"""
+    conn.execute(ADD_STATUS, [{'shop_id': shop_id, 'status': old, 'orders': -1},
+                              {'shop_id': shop_id, 'status': new, 'orders': 1}])
+    if CANCELLED in (old, new) and old != new:
+        sign = -1 if new == CANCELLED else 1
+        conn.execute(ADD_DAILY_SALES, {'shop_id': shop_id, 'day': _day(created_at),
+                                       'orders': sign, 'revenue': sign * (total or 0)})
+        record_items(conn, conn.execute(ORDER_ITEMS, {'order_id': order_id}).mappings().all(), sign)
+
+def record_revenue_change(conn, shop_id, created_at, delta):
+    if delta:
+        conn.execute(ADD_DAILY_SALES, {'shop_id': shop_id, 'day': _day(created_at), 'orders': 0, 'revenue': delta})
+
+def record_items(conn, items, sign=1):
+    """Add order items ({product_id, quantity, price}) to their products' sales"""
+    if items:
+        conn.execute(ADD_PRODUCT_SALES, [
+            {'product_id': item['product_id'], 'units': sign * item['quantity'],
+             'revenue': sign * item['quantity'] * item['price']}
+            for item in items
+        ])
+
+def record_negotiations(conn, opened=(), accepted=(), unaccepted=(), removed=()):
+    """Count new, accepted and removed negotiations, by negotiation id, from their stored rows"""
+    params = [{'id': n, 'opened': 1, 'accepted': 0} for n in opened]
+    params += [{'id': n, 'opened': -1, 'accepted': 0} for n in removed]
+    params += [{'id': n, 'opened': 0, 'accepted': 1} for n in accepted]
+    params += [{'id': n, 'opened': 0, 'accepted': -1} for n in unaccepted]
+    if params:
+        conn.execute(ADD_NEGOTIATIONS, params)
+
+def refresh_status_counts(conn, order_ids):
+    """Recount the status rows of the shops owning these orders, after a bulk status UPDATE"""
+    if not order_ids:
+        return
+    shop_ids = [row[0] for row in conn.execute(text(
+        'SELECT DISTINCT shop_id FROM "order" WHERE id IN :ids'
+    ).bindparams(bindparam('ids', expanding=True)), {'ids': list(order_ids)})]
+    _rebuild_status(conn, shop_ids)
+
+def _rebuild_status(conn, shop_ids=None):
+    where = 'WHERE shop_id IN :shop_ids' if shop_ids is not None else ''
+    params = {'shop_ids': list(shop_ids)} if shop_ids is not None else {}
+    statements = [
+        f'DELETE FROM shop_order_status {where}',
+        f'INSERT INTO shop_order_status (shop_id, status, orders) '
+        f'SELECT shop_id, status, COUNT(*) FROM "order" {where} GROUP BY shop_id, status',
+    ]
+    for statement in statements:
+        statement = text(statement)
+        if shop_ids is not None:
+            statement = statement.bindparams(bindparam('shop_ids', expanding=True))
+        conn.execute(statement, params)
+
+def rebuild_analytics(conn):
+    """Recompute every aggregate from order, order_item and negotiation; returns the order count"""
+    ensure_analytics_tables(conn)
+    for table in ('shop_daily_sales', 'product_sales', 'product_negotiation_stats'):
+        conn.execute(text(f'DELETE FROM {table}'))
+    _rebuild_status(conn)
+    conn.execute(text(
+        'INSERT INTO shop_daily_sales (shop_id, day, orders, revenue) '
+        'SELECT shop_id, DATE(created_at), COUNT(*), COALESCE(SUM(total_amount), 0) FROM "order" '
+        'WHERE status != :cancelled GROUP BY shop_id, DATE(created_at)'
+    ), {'cancelled': CANCELLED})
+    conn.execute(text(
+        'INSERT INTO product_sales (product_id, shop_id, units, revenue) '
+        'SELECT oi.product_id, p.shop_id, SUM(oi.quantity), SUM(oi.quantity * oi.price) '
+        'FROM order_item oi JOIN "order" o ON o.id = oi.order_id JOIN product p ON p.id = oi.product_id '
+        'WHERE o.status != :cancelled GROUP BY oi.product_id, p.shop_id'
+    ), {'cancelled': CANCELLED})
+    conn.execute(text(
+        'INSERT INTO product_negotiation_stats (product_id, shop_id, negotiations, accepted, discount_total) '
+        'SELECT n.product_id, p.shop_id, COUNT(*), '
+        "SUM(CASE WHEN n.status = 'accepted' THEN 1 ELSE 0 END), "
+        "COALESCE(SUM(CASE WHEN n.status = 'accepted' THEN "
+        '(n.initial_price - COALESCE(n.final_price, n.offered_price)) * 100.0 / NULLIF(n.initial_price, 0) '
+        'END), 0) '
+        'FROM negotiation n JOIN product p ON p.id = n.product_id GROUP BY n.product_id, p.shop_id'
+    ))
+    return conn.execute(text('SELECT COUNT(*) FROM "order"')).scalar()
+
+def shop_analytics(conn, shop_id, days=DASHBOARD_DAYS, today=None):
+    """
+    Dashboard figures for one shop, read from the aggregate tables: one
+    row per day with sales, one per status, and the top products. Cost
+    grows with days and products shown, not with orders placed.
+    """
+    from .pagination import ORDER_STATUSES
+
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    sales = {
+        date.fromisoformat(str(day)[:10]): (orders, revenue)
+        for day, orders, revenue in conn.execute(text(
+            'SELECT day, orders, revenue FROM shop_daily_sales '
+            'WHERE shop_id = :shop_id AND day >= :since ORDER BY day'
+        ), {'shop_id': shop_id, 'since': since.isoformat()})
+    }
+    daily = []
+    for offset in range(days):
+        day = since + timedelta(days=offset)
+        orders, revenue = sales.get(day, (0, 0.0))
+        daily.append({'day': day.isoformat(), 'orders': orders, 'revenue': round(revenue, 2)})
+
+    status_counts = dict.fromkeys(ORDER_STATUSES, 0)
+    status_counts.update(conn.execute(text(
+        'SELECT status, orders FROM shop_order_status WHERE shop_id = :shop_id'
+    ), {'shop_id': shop_id}).fetchall())
+
+    top_products = [dict(row) for row in conn.execute(text(
+        'SELECT ps.product_id, p.name, ps.units, ps.revenue FROM product_sales ps '
+        'JOIN product p ON p.id = ps.product_id WHERE ps.shop_id = :shop_id AND ps.units > 0 '
+        'ORDER BY ps.units DESC LIMIT :limit'
+    ), {'shop_id': shop_id, 'limit': TOP_PRODUCTS}).mappings()]
+
+    negotiations = []
+    for row in conn.execute(text(
+        'SELECT ns.product_id, p.name, ns.negotiations, ns.accepted, ns.discount_total '
+        'FROM product_negotiation_stats ns JOIN product p ON p.id = ns.product_id '
+        'WHERE ns.shop_id = :shop_id AND ns.negotiations > 0 ORDER BY ns.negotiations DESC'
+    ), {'shop_id': shop_id}):
+        negotiations.append({
+            'product_id': row.product_id,
+            'name': row.name,
+            'negotiations': row.negotiations,
+            'acceptance_rate': round(row.accepted * 100.0 / row.negotiations, 1),
+            'average_discount': round(row.discount_total / row.accepted, 1) if row.accepted else None,
+        })
+
+    return {
+        'daily': daily,
+        'orders': sum(day['orders'] for day in daily),
+        'revenue': round(sum(day['revenue'] for day in daily), 2),
+        'status_counts': status_counts,
+        'top_products': top_products,
+        'negotiations': negotiations,
+    }
+
+def _read_old_values(session, flush_context, instances):
+    """
+    Attributes set after a commit expired them have no old value in their
+    history; read those columns while the row still holds them. Deleted
+    rows are loaded now, before their DELETE runs.
+    """
+    old_values = {}
+    for obj in chain(session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table not in TRACKED:
+            continue
+        if obj in session.deleted:
+            for name in TRACKED[table]:
+                getattr(obj, name)
+            if table == 'negotiation':
+                # The stats are computed from the row, which is gone after the flush
+                record_negotiations(session.connection(), removed=[obj.id],
+                                    unaccepted=[obj.id] if obj.status == 'accepted' else [])
+            continue
+        attrs = inspect(obj).attrs
+        unknown = [name for name in TRACKED[table]
+                   if attrs[name].history.added and not attrs[name].history.deleted]
+        if unknown:
+            row = session.connection().execute(text(
+                f'SELECT {", ".join(unknown)} FROM "{table}" WHERE id = :id'
+            ), {'id': obj.id}).one()
+            old_values[(table, obj.id)] = dict(zip(unknown, row))
+    session.info[OLD_VALUES] = old_values
+
+def _history(session, obj, name):
+    """(old, new) for a changed attribute, else None"""
+    history = inspect(obj).attrs[name].history
+    if not history.has_changes():
+        return None
+    if history.deleted:
+        old = history.deleted[0]
+    else:
+        old = session.info.get(OLD_VALUES, {}).get((obj.__tablename__, obj.id), {}).get(name)
+    new = history.added[0] if history.added else None
+    return old, new
+
+def _update_aggregates(session, flush_context):
+    try:
+        _fold_flush(session)
+    finally:
+        session.info.pop(OLD_VALUES, None)
+
+def _prior_statuses(session, conn, orders, items):
+    """Each touched order's status before this flush"""
+    prior = {}
+    for obj in orders:
+        status = _history(session, obj, 'status')
+        prior[obj.id] = status[0] if status and obj not in session.new else obj.status
+    unseen = {obj.order_id for obj in items} - set(prior)
+    if unseen:
+        prior.update(conn.execute(text(
+            'SELECT id, status FROM "order" WHERE id IN :ids'
+        ).bindparams(bindparam('ids', expanding=True)), {'ids': sorted(unseen)}).fetchall())
+    return prior
+
+def _fold_flush(session):
+    touched = {table: [] for table in TRACKED}
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table in touched:
+            touched[table].append(obj)
+    if not any(touched.values()):
+        return
+    conn = session.connection()
+    # Item and total deltas count while the order did; a cancel (or undo)
+    # then moves the order's stored items and total out of (or into) sales
+    prior = _prior_statuses(session, conn, touched['order'], touched['order_item'])
+
+    for obj in touched['order']:
+        if obj in session.new or obj in session.deleted:
+            record_order(conn, obj.shop_id, obj.created_at, obj.status, obj.total_amount,
+                         sign=-1 if obj in session.deleted else 1)
+            continue
+        total = _history(session, obj, 'total_amount')
+        if total and prior[obj.id] != CANCELLED:
+            record_revenue_change(conn, obj.shop_id, obj.created_at, (total[1] or 0) - (total[0] or 0))
+        status = _history(session, obj, 'status')
+        if status and status[0] is not None and status[0] != status[1]:
+            record_status_change(conn, obj.id, obj.shop_id, obj.created_at, status[0], status[1],
+                                 obj.total_amount)
+
+    for obj in touched['order_item']:
+        if prior.get(obj.order_id) == CANCELLED:
+            continue
+        item = {'product_id': obj.product_id, 'quantity': obj.quantity or 0, 'price': obj.price or 0}
+        if obj in session.new or obj in session.deleted:
+            record_items(conn, [item], sign=-1 if obj in session.deleted else 1)
+            continue
+        quantity, price = _history(session, obj, 'quantity'), _history(session, obj, 'price')
+        if quantity or price:
+            record_items(conn, [dict(item, quantity=quantity[0] if quantity else item['quantity'],
+                                     price=price[0] if price else item['price'])], sign=-1)
+            record_items(conn, [item])
+
+    for obj in touched['negotiation']:
+        if obj in session.new:
+            record_negotiations(conn, opened=[obj.id], accepted=[obj.id] if obj.status == 'accepted' else [])
+        elif obj not in session.deleted:
+            status = _history(session, obj, 'status')
+            if status and status[0] != status[1] and 'accepted' in status:
+                if status[1] == 'accepted':
+                    record_negotiations(conn, accepted=[obj.id])
+                else:
+                    record_negotiations(conn, unaccepted=[obj.id])
+
+def _analytics_context():
+    def shop_analytics_for(shop_id, days=DASHBOARD_DAYS):
+        from .. import db
+        return shop_analytics(db.session.connection(), shop_id, days)
+    return {'shop_analytics': shop_analytics_for}
+
+def init_analytics(app):
+    """Fold order, order item and negotiation writes into the shop analytics tables as they flush"""
+    if not event.contains(Session, 'after_flush', _update_aggregates):
+        event.listen(Session, 'before_flush', _read_old_values)
+        event.listen(Session, 'after_flush', _update_aggregates)
+    app.context_processor(_analytics_context)
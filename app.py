@@ -1,13 +1,16 @@
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from flask_mail import Mail
+from ecommerce.config import config
 from ecommerce.models.shop import Shop
 
 # Initialize extensions
 db = SQLAlchemy()
 login_manager = LoginManager()
+mail = Mail()
 
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__, 
         template_folder='ecommerce/templates',
         static_folder='ecommerce/static')
@@ -16,19 +19,98 @@ def create_app():
     app.config['SECRET_KEY'] = 'your-secret-key-here'
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///instance/ecommerce.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config_name:
+        app.config.from_object(config[config_name])
+
+    # Engine profile for the configured database (pool, pragmas, replica)
+    from ecommerce.utils.db_engine import configure_engines, init_db_engine
+    configure_engines(app)
 
     # Initialize Flask extensions
     db.init_app(app)
+    init_db_engine(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
+    mail.init_app(app)
 
     # Register blueprints
     from ecommerce.routes.auth import auth_bp
     from ecommerce.routes.shop import shop_bp
+    from ecommerce.routes.tracking import tracking_bp
+    from ecommerce.routes.search import search_bp
+    from ecommerce.routes.shipping import shipping_bp
+    from ecommerce.routes.cart import cart_bp
+    from ecommerce.routes.notification_settings import notification_settings_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(shop_bp)
+    app.register_blueprint(tracking_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(shipping_bp)
+    app.register_blueprint(cart_bp)
+    app.register_blueprint(notification_settings_bp)
+
+    # Keep the in-process spatial index in step with shop/courier moves
+    from ecommerce.utils.spatial_index import init_spatial_index
+    init_spatial_index(app)
+
+    # Push courier moves to live tracking streams
+    from ecommerce.utils.location_stream import init_location_stream
+    init_location_stream(app)
+
+    # Buffer courier GPS fixes and write them in periodic bulk updates
+    from ecommerce.utils.location_ingest import init_location_ingest
+    init_location_ingest(app)
+
+    # Incrementally maintained product/shop suggestion index
+    from ecommerce.utils.search_index import init_search_index
+    init_search_index(app)
+
+    # Send notification fan-outs over pooled SMTP connections
+    from ecommerce.utils.mail_dispatch import init_mail_dispatcher
+    init_mail_dispatcher(app, mail)
+
+    # Compile email templates once instead of on first use per worker
+    from ecommerce.utils.email_render import init_email_templates
+    init_email_templates(app)
+
+    # Collapse order status emails per order and into admin digests
+    from ecommerce.utils.notification_digest import init_notification_digest
+    init_notification_digest(app)
+
+    # Drop cached negotiation bots when their product or order changes
+    from ecommerce.utils.ai.negotiation_session import init_negotiation_sessions
+    init_negotiation_sessions(app)
+
+    # Cache delivery fee quotes until the shop moves
+    from ecommerce.utils.delivery_quote import init_delivery_quotes
+    init_delivery_quotes(app)
+
+    # Courier loads reused by batched ETA estimates
+    from ecommerce.utils.eta import init_eta
+    init_eta(app)
+
+    # Cached order list totals for keyset-paginated pages
+    from ecommerce.utils.pagination import init_pagination
+    init_pagination(app)
+
+    # Request, SQL and template timings, served at /metrics
+    from ecommerce.utils.metrics import init_metrics
+    init_metrics(app)
+
+    # Rendered pages and fragments, dropped on shop/product writes
+    from ecommerce.utils.page_cache import cached_page, init_page_cache
+    init_page_cache(app)
+
+    # Cart versions for the summary ETag, and the cached navbar badge count
+    from ecommerce.utils.cart_summary import init_cart_summary
+    init_cart_summary(app)
+
+    # Daily sales, status counts and per-product figures for shop dashboards
+    from ecommerce.utils.analytics import init_analytics
+    init_analytics(app)
 
     @app.route('/')
+    @cached_page('shops')
     def home():
         featured_shops = Shop.query.filter_by(is_active=True).limit(6).all()
         return render_template('main/home.html', featured_shops=featured_shops)
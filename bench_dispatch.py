@@ -0,0 +1,104 @@
+"""
+Benchmark: assigning pending orders to couriers around Dhaka in one pass.
+Times the greedy matcher at 5k orders x 1k couriers, the full
+load-plan-commit cycle against SQLite, and optimal vs greedy on a
+zone-sized batch.
+
+    python bench_dispatch.py
+"""
+import os
+import tempfile
+import time
+import numpy as np
+from sqlalchemy import create_engine, text
+from ecommerce.utils.analytics import ensure_analytics_tables
+from ecommerce.utils.distance import distance_matrix
+from ecommerce.utils.dispatch import (
+    MAX_ACTIVE_DELIVERIES, MAX_PICKUP_DISTANCE_KM, dispatch_orders, greedy_assign, optimal_assign
+)
+
+DHAKA = (23.7808, 90.4093)
+SPREAD_DEG = 0.15  # roughly +/- 16 km
+
+def points(rng, count):
+    return DHAKA[0] + rng.uniform(-SPREAD_DEG, SPREAD_DEG, count), DHAKA[1] + rng.uniform(-SPREAD_DEG, SPREAD_DEG, count)
+
+def timed(fn, repeat=3):
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+def bench_matching(rng, orders, couriers):
+    order_lats, order_lngs = points(rng, orders)
+    courier_lats, courier_lngs = points(rng, couriers)
+    capacity = MAX_ACTIVE_DELIVERIES - rng.integers(0, MAX_ACTIVE_DELIVERIES + 1, couriers)
+
+    matrix_time, distances = timed(lambda: distance_matrix(order_lats, order_lngs, courier_lats, courier_lngs))
+    greedy_time, result = timed(lambda: greedy_assign(distances, capacity, MAX_PICKUP_DISTANCE_KM))
+    assigned = result >= 0
+    print(f"{orders} orders x {couriers} couriers: distance matrix {matrix_time * 1000:.1f} ms, "
+          f"greedy {greedy_time * 1000:.1f} ms, assigned {assigned.sum()} "
+          f"(capacity {capacity.sum()}), mean pickup {distances[assigned, result[assigned]].mean():.2f} km")
+
+def bench_zone(rng, orders, couriers):
+    order_lats, order_lngs = points(rng, orders)
+    courier_lats, courier_lngs = points(rng, couriers)
+    distances = distance_matrix(order_lats, order_lngs, courier_lats, courier_lngs)
+    capacity = np.full(couriers, 2)
+    for name, assign in (('greedy', greedy_assign), ('optimal', optimal_assign)):
+        elapsed, result = timed(lambda: assign(distances, capacity, MAX_PICKUP_DISTANCE_KM), repeat=1)
+        assigned = result >= 0
+        print(f"  zone {orders}x{couriers} {name:>7}: {elapsed * 1000:8.1f} ms, assigned {assigned.sum()}, "
+              f"total pickup {distances[assigned, result[assigned]].sum():.1f} km")
+
+def bench_database(rng, orders, couriers):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        with engine.begin() as conn:
+            conn.execute(text('CREATE TABLE shop (id INTEGER PRIMARY KEY, location_lat FLOAT, location_lng FLOAT)'))
+            conn.execute(text(
+                'CREATE TABLE "user" (id INTEGER PRIMARY KEY, role VARCHAR(20), is_active BOOLEAN, '
+                'location_lat FLOAT, location_lng FLOAT)'
+            ))
+            conn.execute(text(
+                'CREATE TABLE "order" (id INTEGER PRIMARY KEY, shop_id INTEGER, delivery_person_id INTEGER, '
+                'status VARCHAR(20), updated_at DATETIME)'
+            ))
+            conn.execute(text('CREATE INDEX ix_order_status ON "order" (status, delivery_person_id)'))
+            ensure_analytics_tables(conn)
+            shop_lats, shop_lngs = points(rng, 500)
+            conn.execute(text('INSERT INTO shop VALUES (:id, :lat, :lng)'), [
+                {'id': i + 1, 'lat': lat, 'lng': lng} for i, (lat, lng) in enumerate(zip(shop_lats, shop_lngs))
+            ])
+            courier_lats, courier_lngs = points(rng, couriers)
+            conn.execute(text("INSERT INTO \"user\" VALUES (:id, 'delivery', 1, :lat, :lng)"), [
+                {'id': i + 1, 'lat': lat, 'lng': lng} for i, (lat, lng) in enumerate(zip(courier_lats, courier_lngs))
+            ])
+            conn.execute(text("INSERT INTO \"order\" (shop_id, status) VALUES (:shop_id, 'confirmed')"), [
+                {'shop_id': int(shop_id)} for shop_id in rng.integers(1, 501, orders)
+            ])
+
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            assignments = dispatch_orders(conn)
+        elapsed = time.perf_counter() - started
+        print(f"SQLite load + plan + bulk commit, {orders} orders x {couriers} couriers: "
+              f"{elapsed * 1000:.1f} ms, {len(assignments)} assigned")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+def main():
+    rng = np.random.default_rng(2024)
+    bench_matching(rng, 5000, 1000)
+    bench_database(rng, 5000, 1000)
+    print("Optimal vs greedy on a zone-sized batch:")
+    bench_zone(rng, 300, 100)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Microbenchmark: cost of rendering a notification fan-out as the number of
+recipients grows, per-recipient render_template vs. render_fanout.
+
+    python bench_email_render.py
+"""
+import time
+from types import SimpleNamespace
+from flask import Flask, render_template
+from jinja2 import DictLoader
+from ecommerce.utils.email_render import init_email_templates, render_fanout
+
+TEMPLATES = {
+    'email/base_email.html': '''<!DOCTYPE html>
+<html><head><style>
+body { font-family: Arial, sans-serif; line-height: 1.6; }
+.container { max-width: 600px; margin: 0 auto; padding: 20px; }
+</style></head>
+<body><div class="container">{% block content %}{% endblock %}
+<p class="footer">&copy; {{ config.SITE_NAME }}</p></div></body></html>''',
+    'email/general_notification.html': '''{% extends "email/base_email.html" %}
+{% block content %}
+<div style="padding: 20px; background-color: #ffffff; border-radius: 10px;">
+    <h2>Notification</h2>
+    <p>Hello {{ recipient.username }},</p>
+    <div style="margin: 20px 0; padding: 15px; background-color: #f8f9fa;">
+        {{ message }}
+        <ul>{% for line in details %}<li>{{ line }}</li>{% endfor %}</ul>
+    </div>
+    <p>Best regards,<br>{{ config.SITE_NAME }}</p>
+</div>
+{% endblock %}''',
+}
+
+RECIPIENT_COUNTS = [1, 10, 100, 1000, 5000]
+
+def make_app():
+    app = Flask(__name__)
+    app.config['SITE_NAME'] = 'QuickShop'
+    app.jinja_loader = DictLoader(TEMPLATES)
+    init_email_templates(app)
+    return app
+
+def timed(fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main():
+    app = make_app()
+    context = {
+        'message': 'Heavy rain expected in Mirpur and Uttara this evening; plan routes accordingly.',
+        'details': [f'Zone {i}: expect delays of up to {5 * i} minutes' for i in range(1, 15)]
+    }
+    print(f"{'recipients':>10} {'per-recipient ms':>17} {'fan-out ms':>11} {'speedup':>8}")
+    with app.test_request_context():
+        for count in RECIPIENT_COUNTS:
+            recipients = [SimpleNamespace(username=f'courier{i}') for i in range(count)]
+
+            def per_recipient():
+                return [
+                    render_template('email/general_notification.html', recipient=recipient, **context)
+                    for recipient in recipients
+                ]
+
+            def fan_out():
+                return render_fanout('email/general_notification.html', recipients, **context)
+
+            assert per_recipient() == fan_out()
+            before = timed(per_recipient)
+            after = timed(fan_out)
+            print(f"{count:>10} {before * 1000:>17.2f} {after * 1000:>11.2f} {before / after:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Benchmark: the main customer flows driven through the Flask test client
+against a deterministic synthetic dataset around Dhaka. Records
+throughput, p50/p99 latency and SQL statements per request for each
+flow and writes them as JSON, so runs on different commits can be
+compared.
+
+    python bench_flows.py [--scale 1.0] [--requests 200] [--output bench_flows.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import text
+from ecommerce import create_app, db
+from ecommerce.config import TestingConfig, config
+from ecommerce.utils.analytics import rebuild_analytics
+from ecommerce.utils.migrations import run_migrations
+from ecommerce.utils.query_counter import QueryCounter
+
+DHAKA = (23.7808, 90.4093)
+SPREAD_DEG = 0.08  # standard deviation; most points within ~20 km of the centre
+SEED = 2024
+
+# Rows generated at --scale 1.0
+BASE_COUNTS = {'users': 2000, 'shops': 200, 'products': 10000, 'orders': 20000, 'negotiations': 5000}
+
+PRODUCT_NAMES = [
+    ('Miniket Rice 5kg', 'Grocery', 420), ('Chinigura Rice 1kg', 'Grocery', 160),
+    ('Masoor Dal 1kg', 'Grocery', 135), ('Soybean Oil 2L', 'Grocery', 340),
+    ('Fresh Milk 1L', 'Dairy', 90), ('Mishti Doi', 'Dairy', 120), ('Hilsa Fish 1kg', 'Fish', 1400),
+    ('Rui Fish 1kg', 'Fish', 380), ('Broiler Chicken 1kg', 'Meat', 210), ('Beef 1kg', 'Meat', 780),
+    ('Potato 1kg', 'Vegetables', 45), ('Onion 1kg', 'Vegetables', 70), ('Green Chili 250g', 'Vegetables', 30),
+    ('Tea 400g', 'Beverages', 230), ('Mango 1kg', 'Fruits', 150), ('Banana Dozen', 'Fruits', 110),
+]
+SHOP_WORDS = ['Dhaka', 'Gulshan', 'Dhanmondi', 'Mirpur', 'Uttara', 'Banani', 'Mohakhali', 'Motijheel']
+SHOP_KINDS = ['Fresh Mart', 'Grocery', 'Bazar', 'Super Shop', 'Store']
+ORDER_STATUSES = ['pending', 'confirmed', 'delivering', 'completed', 'completed', 'completed', 'cancelled']
+
+class BenchmarkConfig(TestingConfig):
+    WTF_CSRF_ENABLED = False
+    MAIL_SUPPRESS_SEND = True
+    NOTIFICATION_COALESCE_WINDOW = 0
+    SLOW_REQUEST_THRESHOLD = 0
+
+def scaled_counts(scale):
+    return {name: max(int(count * scale), 1) for name, count in BASE_COUNTS.items()}
+
+def points(rng, count):
+    return (np.clip(rng.normal(DHAKA[0], SPREAD_DEG, count), 23.5, 24.1),
+            np.clip(rng.normal(DHAKA[1], SPREAD_DEG, count), 90.2, 90.7))
+
+def generate(conn, rng, counts):
+    """Insert users, shops, products, orders and negotiations; same seed, same rows"""
+    now = datetime(2025, 6, 1)
+    users, shops, products = counts['users'], counts['shops'], counts['products']
+    couriers = max(users // 20, 1)
+    lats, lngs = points(rng, users)
+    roles = ['delivery'] * couriers + ['shop_owner'] * shops + ['user'] * (users - couriers - shops)
+    conn.execute(text(
+        'INSERT INTO "user" (id, username, email, role, location_lat, location_lng, address, '
+        'created_at, updated_at, is_active) '
+        'VALUES (:id, :username, :email, :role, :lat, :lng, :address, :created_at, :created_at, 1)'
+    ), [
+        {'id': n + 1, 'username': f'user{n + 1}', 'email': f'user{n + 1}@example.com', 'role': roles[n],
+         'lat': float(lats[n]), 'lng': float(lngs[n]), 'address': f'House {n % 90 + 1}, Road {n % 27 + 1}, Dhaka',
+         'created_at': now - timedelta(days=int(rng.integers(30, 720)))}
+        for n in range(users)
+    ])
+    owner_ids = list(range(couriers + 1, couriers + shops + 1))
+    customer_ids = np.arange(couriers + shops + 1, users + 1)
+
+    lats, lngs = points(rng, shops)
+    conn.execute(text(
+        'INSERT INTO shop (id, name, description, owner_id, location_lat, location_lng, address, created_at, is_active) '
+        'VALUES (:id, :name, :name, :owner_id, :lat, :lng, :address, :created_at, 1)'
+    ), [
+        {'id': n + 1, 'name': f'{SHOP_WORDS[n % len(SHOP_WORDS)]} {SHOP_KINDS[n % len(SHOP_KINDS)]} {n + 1}',
+         'owner_id': owner_ids[n], 'lat': float(lats[n]), 'lng': float(lngs[n]),
+         'address': f'Shop {n + 1}, Dhaka', 'created_at': now - timedelta(days=365)}
+        for n in range(shops)
+    ])
+
+    catalog = rng.integers(0, len(PRODUCT_NAMES), products)
+    product_shops = rng.integers(1, shops + 1, products)
+    prices = [round(PRODUCT_NAMES[i][2] * float(rng.uniform(0.9, 1.2)), 2) for i in catalog]
+    conn.execute(text(
+        'INSERT INTO product (id, name, description, price, stock, shop_id, category, created_at, '
+        'min_price, max_discount_percentage, continue_iteration) '
+        'VALUES (:id, :name, :name, :price, :stock, :shop_id, :category, :created_at, :min_price, 20, 1)'
+    ), [
+        {'id': n + 1, 'name': PRODUCT_NAMES[i][0], 'category': PRODUCT_NAMES[i][1], 'price': prices[n],
+         'stock': 100000, 'shop_id': int(product_shops[n]), 'min_price': round(prices[n] * 0.8, 2),
+         'created_at': now - timedelta(days=200)}
+        for n, i in enumerate(catalog)
+    ])
+
+    orders = counts['orders']
+    order_customers = rng.choice(customer_ids, orders)
+    order_products = rng.integers(1, products + 1, (orders, 3))
+    lats, lngs = points(rng, orders)
+    order_rows, item_rows = [], []
+    for n in range(orders):
+        status = ORDER_STATUSES[n % len(ORDER_STATUSES)]
+        items = [int(p) for p in order_products[n][:int(rng.integers(1, 4))]]
+        quantities = rng.integers(1, 4, len(items))
+        created = now - timedelta(minutes=int(rng.integers(0, 180 * 24 * 60)))
+        total = sum(prices[p - 1] * int(q) for p, q in zip(items, quantities))
+        order_rows.append({
+            'id': n + 1, 'customer_id': int(order_customers[n]), 'shop_id': int(product_shops[items[0] - 1]),
+            'courier': int(rng.integers(1, couriers + 1)) if status in ('delivering', 'completed') else None,
+            'status': status, 'total': round(total, 2), 'fee': 60.0, 'address': 'Dhaka',
+            'lat': float(lats[n]), 'lng': float(lngs[n]), 'created_at': created
+        })
+        item_rows += [{'order_id': n + 1, 'product_id': p, 'quantity': int(q), 'price': prices[p - 1]}
+                      for p, q in zip(items, quantities)]
+    conn.execute(text(
+        'INSERT INTO "order" (id, customer_id, shop_id, delivery_person_id, status, total_amount, delivery_fee, '
+        'delivery_address, delivery_lat, delivery_lng, created_at, updated_at) '
+        'VALUES (:id, :customer_id, :shop_id, :courier, :status, :total, :fee, :address, :lat, :lng, '
+        ':created_at, :created_at)'
+    ), order_rows)
+    conn.execute(text(
+        'INSERT INTO order_item (order_id, product_id, quantity, price) '
+        'VALUES (:order_id, :product_id, :quantity, :price)'
+    ), item_rows)
+
+    negotiated = rng.integers(1, products + 1, counts['negotiations'])
+    conn.execute(text(
+        'INSERT INTO negotiation (product_id, customer_id, initial_price, offered_price, status, rounds, '
+        'created_at, updated_at) VALUES (:product_id, :customer_id, :price, :offer, :status, 1, :at, :at)'
+    ), [
+        {'product_id': int(p), 'customer_id': int(rng.choice(customer_ids)), 'price': prices[p - 1],
+         'offer': round(prices[p - 1] * 0.9, 2), 'status': 'pending',
+         'at': now - timedelta(days=int(rng.integers(0, 60)))}
+        for p in negotiated
+    ])
+    return customer_ids
+
+class FlowStats:
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def report(self):
+        latencies = np.array(self.latencies) * 1000
+        elapsed = latencies.sum() / 1000
+        return {
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'throughput_rps': round(len(self.latencies) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'mean_queries': round(float(np.mean(self.queries)), 1),
+            'max_queries': int(max(self.queries)),
+        }
+
+class FlowRunner:
+    """Times requests per flow, counting the SQL each one runs"""
+    def __init__(self, app):
+        self.app = app
+        self.stats = {}
+        with app.app_context():
+            self.engine = db.engine
+
+    def call(self, flow, client, method, url, **kwargs):
+        stats = self.stats.setdefault(flow, FlowStats())
+        with QueryCounter(self.engine) as counter:
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            elapsed = time.perf_counter() - started
+        stats.latencies.append(elapsed)
+        stats.queries.append(counter.count)
+        if response.status_code >= 400:
+            stats.errors += 1
+        return response
+
+def logged_in_client(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+def run_flows(app, rng, customer_ids, product_count, requests):
+    runner = FlowRunner(app)
+    with app.test_request_context():
+        from flask import url_for
+        nearby_url = url_for('user.nearby_shops', distance=10)
+        orders_url = url_for('user.orders')
+    anonymous = app.test_client()
+    clients = [logged_in_client(app, int(user_id)) for user_id in rng.choice(customer_ids, 20, replace=False)]
+    prefixes = [name[:n] for name, _, _ in PRODUCT_NAMES for n in (2, 3, 5)]
+
+    for n in range(requests):
+        client = clients[n % len(clients)]
+        product_id = int(rng.integers(1, product_count + 1))
+        runner.call('home', anonymous, 'GET', '/')
+        runner.call('nearby_shops', client, 'GET', nearby_url)
+        runner.call('search_suggestions', anonymous, 'GET',
+                    f'/api/search/suggestions?q={prefixes[n % len(prefixes)]}')
+        runner.call('negotiate', client, 'POST', f'/api/negotiate/{product_id}',
+                    json={'offered_price': 1})
+        runner.call('cart_add', client, 'POST', '/api/add', json={'product_id': product_id, 'quantity': 1})
+        items = runner.call('cart_items', client, 'GET', '/api/cart/items').get_json(silent=True) or {}
+        summary = runner.call('cart_summary', client, 'GET', '/api/cart/summary')
+        runner.call('cart_summary_revalidate', client, 'GET', '/api/cart/summary',
+                    headers={'If-None-Match': summary.headers.get('ETag', '')})
+        runner.call('shipping_quotes', client, 'POST', '/api/cart/shipping-quotes', json={})
+        item_ids = [item['id'] for item in items.get('items', [])]
+        runner.call('checkout', client, 'POST', '/api/cart/checkout',
+                    json={'selected_items': item_ids, 'special_instructions': ''})
+        runner.call('order_listing', client, 'GET', orders_url)
+    return {flow: stats.report() for flow, stats in runner.stats.items()}
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the generated row counts')
+    parser.add_argument('--requests', type=int, default=200, help='iterations of every flow')
+    parser.add_argument('--output', default='bench_flows.json')
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    BenchmarkConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{path}'
+    config['benchmark'] = BenchmarkConfig
+    app = create_app('benchmark')
+    try:
+        rng = np.random.default_rng(SEED)
+        counts = scaled_counts(args.scale)
+        with app.app_context():
+            db.create_all()
+            with db.engine.begin() as conn:
+                customer_ids = generate(conn, rng, counts)
+            run_migrations(db.engine)
+            with db.engine.begin() as conn:
+                rebuild_analytics(conn)
+
+        started = time.perf_counter()
+        flows = run_flows(app, rng, customer_ids, counts['products'], args.requests)
+        report = {
+            'commit': git_commit(),
+            'generated_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'seed': SEED,
+            'counts': counts,
+            'requests_per_flow': args.requests,
+            'wall_seconds': round(time.perf_counter() - started, 2),
+            'flows': flows,
+        }
+    finally:
+        with app.app_context():
+            db.engine.dispose()
+        os.remove(path)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"{'flow':20} {'rps':>8} {'p50 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}")
+    for flow, stats in flows.items():
+        print(f"{flow:20} {stats['throughput_rps'] or 0:8.1f} {stats['p50_ms']:8.2f} {stats['p99_ms']:8.2f} "
+              f"{stats['mean_queries']:8.1f} {stats['errors']:7d}")
+    print(f"Report written to {args.output}")
+
+if __name__ == '__main__':
+    main()
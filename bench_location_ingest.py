@@ -0,0 +1,73 @@
+"""
+Benchmark: courier GPS fixes from a fleet of phones around Dhaka, fed to
+the location ingestor from several threads for a few seconds against a
+file-backed SQLite database. Reports fixes accepted per second and the
+commits and rows the bulk flushes needed.
+
+    python bench_location_ingest.py
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from ecommerce.utils.location_ingest import LocationIngestor
+
+COURIERS = 1000
+PHONE_THREADS = 4
+LOAD_SECONDS = 3.0
+FLUSH_INTERVAL = 0.5
+DHAKA = (23.78, 90.41)
+
+def phone_fleet(ingestor, seed, deadline):
+    rng = random.Random(seed)
+    base = datetime.utcnow() - timedelta(hours=1)
+    tick = 0
+    while time.monotonic() < deadline:
+        tick += 1
+        ingestor.submit(rng.randint(1, COURIERS),
+                        DHAKA[0] + rng.uniform(-0.2, 0.2), DHAKA[1] + rng.uniform(-0.2, 0.2),
+                        base + timedelta(microseconds=tick * PHONE_THREADS + seed))
+
+def main():
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    engine = create_engine(f'sqlite:///{path}')
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE "user" (id INTEGER PRIMARY KEY, location_lat FLOAT, location_lng FLOAT, '
+                'geo_cell VARCHAR(32), location_recorded_at DATETIME)'
+            ))
+            conn.execute(text('INSERT INTO "user" (id) VALUES (:id)'), [{'id': i} for i in range(1, COURIERS + 1)])
+
+        commits = 0
+
+        @event.listens_for(engine, 'commit')
+        def count_commit(conn):
+            nonlocal commits
+            commits += 1
+
+        ingestor = LocationIngestor(engine, flush_interval=FLUSH_INTERVAL)
+        ingestor.start()
+        started = time.monotonic()
+        threads = [threading.Thread(target=phone_fleet, args=(ingestor, seed, started + LOAD_SECONDS))
+                   for seed in range(PHONE_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ingestor.stop()
+        elapsed = time.monotonic() - started
+
+        print(f"{ingestor.fixes_received} fixes from {PHONE_THREADS} threads in {elapsed:.1f}s "
+              f"({ingestor.fixes_received / elapsed:,.0f} fixes/s), {commits} commits, "
+              f"{ingestor.fixes_written} rows written")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+from flask import Blueprint, jsonify, make_response, request
+from flask_login import current_user, login_required
+from ecommerce import db
+from ecommerce.models.order import Order
+from ecommerce.utils.cart_summary import build_summary, cart_state, summary_etag
+from ecommerce.utils.checkout import OutOfStock, checkout
+from ecommerce.utils.loading import with_profile
+from ecommerce.utils.notifications import notify_shop_owner_new_order
+
+cart_bp = Blueprint('cart', __name__)
+
+@cart_bp.route('/api/cart/summary')
+@login_required
+def cart_summary():
+    """
+    Items, counts, delivery address and shipping quotes for the cart page
+    in one response. The ETag is the cart's version, so revalidating an
+    unchanged cart costs one primary-key lookup and returns 304.
+    """
+    conn = db.session.connection()
+    state = cart_state(conn, current_user.id)
+    etag = summary_etag(state)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify({'status': 'success', **build_summary(conn, current_user.id, state)})
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@cart_bp.route('/api/cart/checkout', methods=['POST'])
+@login_required
+def checkout_cart():
+    """
+    Place the selected cart items as one order per shop. Stock is taken
+    with conditional updates, so concurrent buyers of the last units
+    cannot oversell; the loser gets 409 and keeps their cart.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        item_ids = [int(item_id) for item_id in data.get('selected_items') or []]
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid cart items'}), 400
+    if not item_ids:
+        return jsonify({'status': 'error', 'message': 'Please select items to checkout'}), 400
+    if not current_user.address:
+        return jsonify({'status': 'error', 'message': 'Please select a delivery address'}), 400
+
+    try:
+        placed = checkout(db.engine, current_user.id, item_ids, current_user.address,
+                          current_user.location_lat, current_user.location_lng,
+                          (data.get('special_instructions') or '').strip())
+    except OutOfStock as e:
+        return jsonify({'status': 'error', 'message': str(e), 'product_id': e.product_id}), 409
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+
+    orders = with_profile(Order.query.filter(Order.id.in_([order.id for order in placed])), 'order_email').all()
+    for order in orders:
+        notify_shop_owner_new_order(order)
+    return jsonify({
+        'status': 'success',
+        'orders': [order._asdict() for order in placed],
+        'total': round(sum(order.total_amount + order.delivery_fee for order in placed), 2)
+    })
@@ -0,0 +1,169 @@
+import hashlib
+from itertools import chain
+
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+from .delivery_quote import quote_delivery
+from .page_cache import page_cache
+
+# Fields the summary shows; changing one bumps the version of every cart holding the product
+PRODUCT_FIELDS = ('name', 'price', 'image_url', 'shop_id')
+SHOP_FIELDS = ('name', 'location_lat', 'location_lng')
+
+# Users whose cart rows changed in a session, for dropping cached counts on commit
+PENDING_CARTS = 'cart_summary_users'
+
+CART_STATE = text('SELECT cart_version, address, location_lat, location_lng FROM "user" WHERE id = :user_id')
+CART_ROWS = text(
+    'SELECT ci.id, ci.product_id, ci.quantity, p.name, p.price, p.image_url, '
+    's.id AS shop_id, s.name AS shop_name, s.location_lat, s.location_lng '
+    'FROM cart_item ci JOIN product p ON p.id = ci.product_id JOIN shop s ON s.id = p.shop_id '
+    'WHERE ci.user_id = :user_id ORDER BY s.name, ci.id'
+)
+CART_COUNTS = text('SELECT COUNT(*), COALESCE(SUM(quantity), 0) FROM cart_item WHERE user_id = :user_id')
+
+BUMP_USERS = text(
+    'UPDATE "user" SET cart_version = cart_version + 1 WHERE id IN :ids'
+).bindparams(bindparam('ids', expanding=True))
+BUMP_PRODUCT_CARTS = text(
+    'UPDATE "user" SET cart_version = cart_version + 1 '
+    'WHERE id IN (SELECT user_id FROM cart_item WHERE product_id IN :ids)'
+).bindparams(bindparam('ids', expanding=True))
+BUMP_SHOP_CARTS = text(
+    'UPDATE "user" SET cart_version = cart_version + 1 WHERE id IN ('
+    'SELECT ci.user_id FROM cart_item ci JOIN product p ON p.id = ci.product_id WHERE p.shop_id IN :ids)'
+).bindparams(bindparam('ids', expanding=True))
+
+def cart_scope(user_id):
+    return f'cart:{user_id}'
+
+def cart_counts(conn, user_id, cached=True):
+    """
+    (items, total quantity) for the navbar badge, cached until the cart is
+    written. The cache is shared by all workers with CACHE_REDIS_URL; the
+    in-process one is only used where PAGE_CACHE_ENABLED allows it.
+    """
+    key = entry = None
+    if cached:
+        key, entry = page_cache.lookup('cart-count', [cart_scope(user_id)])
+    if entry is None:
+        count, quantity = conn.execute(CART_COUNTS, {'user_id': user_id}).one()
+        entry = {'count': count, 'quantity': int(quantity)}
+        page_cache.store(key, entry)
+    return entry['count'], entry['quantity']
+
+def cart_state(conn, user_id):
+    """(cart_version, address, lat, lng): everything the summary's ETag depends on, by primary key"""
+    return conn.execute(CART_STATE, {'user_id': user_id}).one()
+
+def summary_etag(state):
+    return hashlib.sha1(repr(tuple(state)).encode()).hexdigest()[:20]
+
+def build_summary(conn, user_id, state):
+    """Items, per-shop delivery quotes and totals from a single joined query"""
+    _, address, lat, lng = state
+    items = []
+    shops = {}
+    for row in conn.execute(CART_ROWS, {'user_id': user_id}):
+        subtotal = row.price * row.quantity
+        items.append({
+            'id': row.id,
+            'product_id': row.product_id,
+            'name': row.name,
+            'price': row.price,
+            'quantity': row.quantity,
+            'subtotal': round(subtotal, 2),
+            'image_url': row.image_url,
+            'shop_id': row.shop_id,
+            'shop_name': row.shop_name,
+        })
+        shop = shops.get(row.shop_id)
+        if shop is None:
+            quote = quote_delivery(row.shop_id, row.location_lat, row.location_lng, lat, lng)
+            shop = shops[row.shop_id] = {
+                'shop_id': row.shop_id,
+                'shop_name': row.shop_name,
+                'subtotal': 0.0,
+                'distance_km': round(quote.distance_km, 2) if quote.distance_km is not None else None,
+                'fee': round(quote.base_fee, 2),
+                'min_fee': round(quote.min_fee, 2),
+            }
+        shop['subtotal'] += subtotal
+
+    for shop in shops.values():
+        shop['subtotal'] = round(shop['subtotal'], 2)
+    subtotal = round(sum(item['subtotal'] for item in items), 2)
+    shipping_fee = round(sum(shop['fee'] for shop in shops.values()), 2)
+    return {
+        'items': items,
+        'shops': list(shops.values()),
+        'count': len(items),
+        'quantity': sum(item['quantity'] for item in items),
+        'address': address,
+        'subtotal': subtotal,
+        'shipping_fee': shipping_fee,
+        'total': round(subtotal + shipping_fee, 2),
+    }
+
+def touch_carts(conn, user_ids=(), product_ids=(), shop_ids=()):
+    """
+    Bump the cart versions of these users and of everyone holding these
+    products or products of these shops. Writes that bypass the ORM (raw
+    UPDATEs, bulk deletes) call this themselves, in the same transaction.
+    """
+    if user_ids:
+        conn.execute(BUMP_USERS, {'ids': sorted(user_ids)})
+    if product_ids:
+        conn.execute(BUMP_PRODUCT_CARTS, {'ids': sorted(product_ids)})
+    if shop_ids:
+        conn.execute(BUMP_SHOP_CARTS, {'ids': sorted(shop_ids)})
+
+def _touched(obj, fields):
+    attrs = inspect(obj).attrs
+    return any(attrs[name].history.has_changes() for name in fields if name in attrs)
+
+def _bump_cart_versions(session, flush_context):
+    users, products, shops = set(), set(), set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table == 'cart_item':
+            users.add(obj.user_id)
+        elif table == 'product' and (obj in session.deleted or _touched(obj, PRODUCT_FIELDS)):
+            if obj not in session.new:
+                products.add(obj.id)
+        elif table == 'shop' and obj in session.dirty and _touched(obj, SHOP_FIELDS):
+            shops.add(obj.id)
+    if users or products or shops:
+        # Same transaction as the write, so the version never runs ahead of the data
+        touch_carts(session.connection(), users, products, shops)
+    if users:
+        session.info.setdefault(PENDING_CARTS, set()).update(users)
+
+def _drop_committed_counts(session):
+    users = session.info.pop(PENDING_CARTS, None)
+    if users:
+        page_cache.invalidate(*(cart_scope(user_id) for user_id in sorted(users)))
+
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_CARTS, None)
+
+def _badge_context():
+    def cart_count():
+        from flask import current_app
+        from flask_login import current_user
+        from .. import db
+
+        if not current_user.is_authenticated:
+            return 0
+        cached = current_app.config.get('PAGE_CACHE_ENABLED', True)
+        return cart_counts(db.session.connection(), current_user.id, cached)[0]
+    return {'cart_count': cart_count}
+
+def init_cart_summary(app):
+    """Version carts on every write the summary shows; serve the navbar badge from cache"""
+    if not event.contains(Session, 'after_flush', _bump_cart_versions):
+        event.listen(Session, 'after_flush', _bump_cart_versions)
+        event.listen(Session, 'after_commit', _drop_committed_counts)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
+    app.context_processor(_badge_context)
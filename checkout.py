@@ -0,0 +1,137 @@
+import random
+import time
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import DBAPIError
+
+from .analytics import record_items, record_order
+from .cart_summary import cart_scope, touch_carts
+from .delivery_quote import quote_delivery
+from .page_cache import page_cache, shop_scope
+
+CHECKOUT_RETRIES = 3
+RETRY_BACKOFF = 0.02  # seconds, doubled per attempt and jittered
+# Postgres serialization failure and deadlock; both are safe to retry
+RETRYABLE_SQLSTATES = ('40001', '40P01')
+
+PlacedOrder = namedtuple('PlacedOrder', ['id', 'shop_id', 'total_amount', 'delivery_fee'])
+
+class OutOfStock(ValueError):
+    def __init__(self, product_id, name, available):
+        super().__init__(f"Only {available} left of {name}")
+        self.product_id = product_id
+        self.available = available
+
+SELECTED_ITEMS = text(
+    'SELECT ci.id, ci.product_id, ci.quantity, p.price, p.shop_id, s.location_lat, s.location_lng '
+    'FROM cart_item ci JOIN product p ON p.id = ci.product_id JOIN shop s ON s.id = p.shop_id '
+    'WHERE ci.user_id = :user_id AND ci.id IN :item_ids ORDER BY ci.id'
+).bindparams(bindparam('item_ids', expanding=True))
+# Only succeeds while enough stock is left; the row lock it takes serializes
+# concurrent buyers of the same product without any read-then-write window
+TAKE_STOCK = text('UPDATE product SET stock = stock - :quantity WHERE id = :product_id AND stock >= :quantity')
+STOCK_LEFT = text('SELECT name, stock FROM product WHERE id = :product_id')
+INSERT_ORDER = text(
+    'INSERT INTO "order" (customer_id, shop_id, status, total_amount, delivery_fee, delivery_address, '
+    'delivery_lat, delivery_lng, special_instructions, created_at, updated_at) '
+    'VALUES (:customer_id, :shop_id, :status, :total_amount, :delivery_fee, :delivery_address, '
+    ':delivery_lat, :delivery_lng, :special_instructions, :now, :now) RETURNING id'
+)
+INSERT_ORDER_ITEM = text(
+    'INSERT INTO order_item (order_id, product_id, quantity, price) '
+    'VALUES (:order_id, :product_id, :quantity, :price)'
+)
+DELETE_CART_ITEMS = text(
+    'DELETE FROM cart_item WHERE user_id = :user_id AND id IN :item_ids'
+).bindparams(bindparam('item_ids', expanding=True))
+
+def place_orders(conn, user_id, item_ids, address, lat, lng, special_instructions=''):
+    """
+    Turn the selected cart items into one pending order per shop inside
+    the caller's transaction. The cart rows are claimed first, so a
+    double-submitted checkout places nothing twice. Stock is taken with
+    conditional UPDATEs in product id order (concurrent checkouts lock rows
+    in the same order), items are inserted in one executemany, and each
+    order's total is written with it. Raises ValueError (OutOfStock when
+    stock ran out), after which the caller must roll back.
+    """
+    rows = conn.execute(SELECTED_ITEMS, {'user_id': user_id, 'item_ids': list(item_ids)}).fetchall()
+    if not rows:
+        raise ValueError("No cart items selected")
+    claimed = conn.execute(DELETE_CART_ITEMS, {'user_id': user_id, 'item_ids': [row.id for row in rows]})
+    if claimed.rowcount != len(rows):
+        raise ValueError("Your cart changed during checkout")
+
+    quantities = {}
+    for row in rows:
+        quantities[row.product_id] = quantities.get(row.product_id, 0) + row.quantity
+    for product_id in sorted(quantities):
+        taken = conn.execute(TAKE_STOCK, {'product_id': product_id, 'quantity': quantities[product_id]})
+        if taken.rowcount != 1:
+            name, stock = conn.execute(STOCK_LEFT, {'product_id': product_id}).one()
+            raise OutOfStock(product_id, name, stock)
+
+    by_shop = {}
+    for row in rows:
+        by_shop.setdefault(row.shop_id, []).append(row)
+    now = datetime.utcnow()
+    orders, items = [], []
+    for shop_id in sorted(by_shop):
+        shop_rows = by_shop[shop_id]
+        quote = quote_delivery(shop_id, shop_rows[0].location_lat, shop_rows[0].location_lng, lat, lng)
+        total = round(sum(row.price * row.quantity for row in shop_rows), 2)
+        order_id = conn.execute(INSERT_ORDER, {
+            'customer_id': user_id,
+            'shop_id': shop_id,
+            'status': 'pending',
+            'total_amount': total,
+            'delivery_fee': round(quote.base_fee, 2),
+            'delivery_address': address,
+            'delivery_lat': lat,
+            'delivery_lng': lng,
+            'special_instructions': special_instructions,
+            'now': now,
+        }).scalar_one()
+        orders.append(PlacedOrder(order_id, shop_id, total, round(quote.base_fee, 2)))
+        items += [{'order_id': order_id, 'product_id': row.product_id, 'quantity': row.quantity,
+                   'price': row.price} for row in shop_rows]
+    conn.execute(INSERT_ORDER_ITEM, items)
+
+    # Raw writes skip the ORM hooks that version the cart and count sales
+    touch_carts(conn, user_ids={user_id})
+    for order in orders:
+        record_order(conn, order.shop_id, now, 'pending', order.total_amount)
+    record_items(conn, items)
+    return orders
+
+def _retryable(error):
+    if getattr(error.orig, 'pgcode', None) in RETRYABLE_SQLSTATES:
+        return True
+    # SQLite: the write lock was still held when busy_timeout ran out
+    return 'database is locked' in str(error.orig)
+
+def checkout(engine, user_id, item_ids, address, lat, lng, special_instructions='', retries=CHECKOUT_RETRIES):
+    """
+    place_orders in a transaction of its own, retried with backoff on
+    serialization failures and lock timeouts. Drops the caches the raw
+    writes bypass once committed. Returns the PlacedOrders.
+    """
+    from .pagination import count_cache
+
+    for attempt in range(retries + 1):
+        try:
+            with engine.begin() as conn:
+                orders = place_orders(conn, user_id, item_ids, address, lat, lng, special_instructions)
+            break
+        except DBAPIError as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt * random.random())
+
+    page_cache.invalidate(cart_scope(user_id), *(shop_scope(order.shop_id) for order in orders))
+    count_cache.invalidate(('order', 'customer_id', user_id))
+    for order in orders:
+        count_cache.invalidate(('order', 'shop_id', order.shop_id))
+    return orders
@@ -7,6 +7,21 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev-secret-key')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///ecommerce.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')  # read-only queries that tolerate lag
+
+    # SQLite connection settings, applied to every pooled connection
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # readers never block the writer
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # durable under WAL except on power loss
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # ms to wait for the write lock
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', 20000))  # KiB of page cache per connection
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))  # bytes
+    
+    # Connection pool for Postgres (and other server databases)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))  # per worker process
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds
+    DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 15000))  # ms, Postgres only
     
     # File upload configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'ecommerce', 'static', 'images')
@@ -18,6 +33,36 @@ class Config:
     MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', True)
     MAIL_USERNAME = os.getenv('MAIL_USERNAME')
     MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DISPATCH_POOL_SIZE = int(os.getenv('MAIL_DISPATCH_POOL_SIZE', 2))  # SMTP worker threads
+    MAIL_QUEUE_DEPTH = int(os.getenv('MAIL_QUEUE_DEPTH', 200))  # queued batches of up to 50 messages
+    MAIL_QUEUE_PUT_TIMEOUT = float(os.getenv('MAIL_QUEUE_PUT_TIMEOUT', 0.5))  # seconds before spilling
+    MAIL_OUTBOX_ENABLED = os.getenv('MAIL_OUTBOX_ENABLED', 'True') == 'True'
+    EMAIL_BASE_URL = os.getenv('EMAIL_BASE_URL', 'http://localhost:5000')  # host for links in background emails
+    
+    # Order status email coalescing (0 sends every change immediately)
+    NOTIFICATION_COALESCE_WINDOW = int(os.getenv('NOTIFICATION_COALESCE_WINDOW', 60))  # seconds
+    NOTIFICATION_MAX_DELAY = int(os.getenv('NOTIFICATION_MAX_DELAY', 300))  # seconds
+    NOTIFICATION_FLUSH_INTERVAL = float(os.getenv('NOTIFICATION_FLUSH_INTERVAL', 15))  # seconds
+    
+    # Courier location ingestion
+    LOCATION_FLUSH_INTERVAL = float(os.getenv('LOCATION_FLUSH_INTERVAL', 2.0))  # seconds
+    LOCATION_HISTORY_ENABLED = os.getenv('LOCATION_HISTORY_ENABLED', 'False') == 'True'
+    SPATIAL_INDEX_RELOAD = int(os.getenv('SPATIAL_INDEX_RELOAD', 60))  # seconds; picks up other workers' moves
+    # Live tracking streams per worker process; each holds a thread (or greenlet) while open, so
+    # keep this below the worker's thread count. Refused trackers fall back to polling.
+    LOCATION_STREAM_LIMIT = int(os.getenv('LOCATION_STREAM_LIMIT', 50))
+    
+    # Rendered page and fragment cache (in-process LRU unless Redis is configured; the LRU is
+    # only correct with a single worker process, so production leaves it off without Redis)
+    PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', 'True') == 'True'
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')  # e.g. redis://localhost:6379/1, shared by all workers
+    PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 300))  # seconds
+    PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 512))  # entries per worker without Redis
+    
+    # Instrumentation
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'  # Prometheus text at /metrics
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')  # scrapers send it as a Bearer token; set it in production
+    SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 1.0))  # seconds; 0 disables the log
     
     # Google Maps configuration
     GOOGLE_MAPS_API_KEY = os.getenv('GOOGLE_MAPS_API_KEY')
@@ -35,6 +80,9 @@ class DevelopmentConfig(Config):
 
 class ProductionConfig(Config):
     DEBUG = False
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 15000))  # several workers share one file
+    # Each worker's in-process cache misses the others' invalidations, so cache only with Redis
+    PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', str(bool(Config.CACHE_REDIS_URL))) == 'True'
 
 class TestingConfig(Config):
     TESTING = True
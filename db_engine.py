@@ -0,0 +1,99 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Defaults for the settings in config.Config
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_BUSY_TIMEOUT = 5000  # ms
+SQLITE_CACHE_SIZE = 20000  # KiB per connection
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # bytes
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 20
+DB_POOL_TIMEOUT = 30  # seconds
+DB_POOL_RECYCLE = 1800  # seconds
+DB_STATEMENT_TIMEOUT = 15000  # ms
+
+REPLICA_BIND = 'replica'
+
+def engine_options(uri, config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the database at `uri`.
+    SQLite connections wait busy_timeout for the write lock rather than
+    failing; server databases get a sized, pre-pinged pool and a
+    statement timeout so one runaway query cannot hold a connection.
+    """
+    backend = make_url(uri).get_backend_name()
+    if backend == 'sqlite':
+        return {
+            'connect_args': {
+                'timeout': config.get('SQLITE_BUSY_TIMEOUT', SQLITE_BUSY_TIMEOUT) / 1000,
+                # Pooled connections are handed between request threads
+                'check_same_thread': False,
+            }
+        }
+
+    options = {
+        'pool_size': config.get('DB_POOL_SIZE', DB_POOL_SIZE),
+        'max_overflow': config.get('DB_MAX_OVERFLOW', DB_MAX_OVERFLOW),
+        'pool_timeout': config.get('DB_POOL_TIMEOUT', DB_POOL_TIMEOUT),
+        'pool_recycle': config.get('DB_POOL_RECYCLE', DB_POOL_RECYCLE),
+        'pool_pre_ping': True,
+    }
+    if backend == 'postgresql':
+        timeout = config.get('DB_STATEMENT_TIMEOUT', DB_STATEMENT_TIMEOUT)
+        options['connect_args'] = {'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+def sqlite_pragmas(config):
+    """PRAGMA statements run on every new SQLite connection"""
+    return [
+        f"PRAGMA journal_mode = {config.get('SQLITE_JOURNAL_MODE', SQLITE_JOURNAL_MODE)}",
+        f"PRAGMA synchronous = {config.get('SQLITE_SYNCHRONOUS', SQLITE_SYNCHRONOUS)}",
+        f"PRAGMA busy_timeout = {int(config.get('SQLITE_BUSY_TIMEOUT', SQLITE_BUSY_TIMEOUT))}",
+        # Negative sizes are in KiB rather than pages
+        f"PRAGMA cache_size = -{int(config.get('SQLITE_CACHE_SIZE', SQLITE_CACHE_SIZE))}",
+        f"PRAGMA mmap_size = {int(config.get('SQLITE_MMAP_SIZE', SQLITE_MMAP_SIZE))}",
+    ]
+
+def apply_sqlite_pragmas(engine, config):
+    """Run sqlite_pragmas on each connection the engine opens"""
+    statements = sqlite_pragmas(config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+    return set_pragmas
+
+def configure_engines(app):
+    """
+    Fill SQLALCHEMY_ENGINE_OPTIONS, and a read replica bind when
+    DATABASE_REPLICA_URL is set. Call before db.init_app.
+    """
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+    replica = config.get('DATABASE_REPLICA_URL')
+    if replica:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = dict(engine_options(replica, config), url=replica)
+        config['SQLALCHEMY_BINDS'] = binds
+
+def init_db_engine(app):
+    """Apply SQLite pragmas to every engine the app uses. Call after db.init_app."""
+    from .. import db
+
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            apply_sqlite_pragmas(engine, app.config)
+
+def read_engine():
+    """Engine for read-only queries that tolerate replica lag; the primary without a replica"""
+    from .. import db
+    return db.engines.get(REPLICA_BIND, db.engine)
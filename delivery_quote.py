@@ -0,0 +1,141 @@
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from sqlalchemy import event, inspect, text
+
+from .distance import calculate_distance
+
+# Delivery points are snapped to a grid this fine (~110 m) before quoting,
+# so nearby customers of one shop share a cached quote
+QUANTUM_DEG = 0.001
+CACHE_SIZE = 8192
+CACHE_TTL = 600  # seconds; bounds staleness from shop moves in other workers
+
+# Fees used when either end of the trip has no coordinates
+DEFAULT_BASE_FEE = 5.00
+DEFAULT_MIN_FEE = 3.00
+
+Quote = namedtuple('Quote', ['shop_id', 'distance_km', 'base_fee', 'min_fee'])
+
+def fee_bounds(distance_km):
+    """(base_fee, min_fee) for a trip; the standard fee and the floor for negotiation"""
+    base_fee = max(5.00, 3.00 + (distance_km * 0.75))  # $3 base + $0.75 per km
+    min_fee = max(3.00, 2.00 + (distance_km * 0.50))  # $2 base + $0.50 per km
+    return base_fee, min_fee
+
+def quantize(lat, lng):
+    return round(lat / QUANTUM_DEG), round(lng / QUANTUM_DEG)
+
+class QuoteCache:
+    """
+    LRU cache of quotes keyed by (shop_id, quantized delivery point).
+    Each entry remembers the shop position it was computed from, so a quote
+    is never served for a shop that has since moved; invalidate_shop drops
+    a moved shop's entries eagerly.
+    """
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, shop_position):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == shop_position and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, key, shop_position, quote):
+        with self._lock:
+            self._entries[key] = (shop_position, time.monotonic(), quote)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate_shop(self, shop_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == shop_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+quote_cache = QuoteCache()
+
+def quote_delivery(shop_id, shop_lat, shop_lng, lat, lng, cache=quote_cache):
+    """
+    Quote delivery from a shop to a point.
+    The distance is measured to the snapped delivery point, so every
+    customer in a grid square gets the same fee. Without a shop_id the
+    quote is computed but not cached.
+    """
+    if None in (shop_lat, shop_lng, lat, lng):
+        return Quote(shop_id, None, DEFAULT_BASE_FEE, DEFAULT_MIN_FEE)
+
+    cell = quantize(lat, lng)
+    key = (shop_id,) + cell
+    shop_position = (shop_lat, shop_lng)
+    if shop_id is not None and cache is not None:
+        quote = cache.get(key, shop_position)
+        if quote is not None:
+            return quote
+
+    distance = calculate_distance(shop_lat, shop_lng, cell[0] * QUANTUM_DEG, cell[1] * QUANTUM_DEG)
+    quote = Quote(shop_id, distance, *fee_bounds(distance))
+    if shop_id is not None and cache is not None:
+        cache.put(key, shop_position, quote)
+    return quote
+
+def shop_positions(conn, shop_ids):
+    """{shop_id: (lat, lng)} from the in-process shop index, falling back to one query"""
+    from .spatial_index import shop_position
+
+    positions = {}
+    missing = []
+    for shop_id in shop_ids:
+        position = shop_position(shop_id)
+        if position:
+            positions[shop_id] = position
+        else:
+            missing.append(shop_id)
+    if missing:
+        placeholders = ', '.join(f':s{i}' for i in range(len(missing)))
+        rows = conn.execute(text(
+            f'SELECT id, location_lat, location_lng FROM shop WHERE id IN ({placeholders})'
+        ), {f's{i}': shop_id for i, shop_id in enumerate(missing)})
+        for shop_id, shop_lat, shop_lng in rows:
+            positions[shop_id] = (shop_lat, shop_lng)
+    return positions
+
+def quote_shops(conn, shop_ids, lat, lng, cache=quote_cache):
+    """Quotes for delivering from each shop to one point, in the order given"""
+    positions = shop_positions(conn, shop_ids)
+    return [
+        quote_delivery(shop_id, *positions.get(shop_id, (None, None)), lat, lng, cache=cache)
+        for shop_id in shop_ids
+    ]
+
+def _drop_moved_shop(mapper, connection, target):
+    state = inspect(target)
+    if (state.attrs.location_lat.history.has_changes()
+            or state.attrs.location_lng.history.has_changes()):
+        quote_cache.invalidate_shop(target.id)
+
+def _drop_deleted_shop(mapper, connection, target):
+    quote_cache.invalidate_shop(target.id)
+
+def init_delivery_quotes(app):
+    """Forget cached quotes for shops that move"""
+    from ..models.shop import Shop
+
+    if not event.contains(Shop, 'after_update', _drop_moved_shop):
+        event.listen(Shop, 'after_update', _drop_moved_shop)
+        event.listen(Shop, 'after_delete', _drop_deleted_shop)
@@ -0,0 +1,257 @@
+import math
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import bindparam, text
+
+from .analytics import refresh_status_counts
+from .distance import EARTH_RADIUS_KM, distance_matrix
+
+# Orders a courier may carry at once, counting those already delivering
+MAX_ACTIVE_DELIVERIES = 3
+# Couriers further than this from the pickup shop are never assigned
+MAX_PICKUP_DISTANCE_KM = 10
+# Nearest couriers considered per order in the first greedy pass
+CANDIDATES_PER_ORDER = 16
+
+Assignment = namedtuple('Assignment', ['order_id', 'courier_id', 'distance_km'])
+
+PENDING_ORDERS = '''
+    SELECT o.id, s.location_lat, s.location_lng
+    FROM "order" o JOIN shop s ON s.id = o.shop_id
+    WHERE o.status = 'confirmed' AND o.delivery_person_id IS NULL
+'''
+AVAILABLE_COURIERS = '''
+    SELECT u.id, u.location_lat, u.location_lng, COUNT(o.id) AS active
+    FROM "user" u
+    LEFT JOIN "order" o ON o.delivery_person_id = u.id AND o.status = 'delivering'
+    WHERE u.role = 'delivery' AND u.is_active = :active
+      AND u.location_lat IS NOT NULL AND u.location_lng IS NOT NULL
+'''
+ASSIGN_ORDER = text(
+    'UPDATE "order" SET delivery_person_id = :courier_id, status = \'delivering\', updated_at = :now '
+    "WHERE id = :order_id AND delivery_person_id IS NULL AND status = 'confirmed'"
+)
+ASSIGNED_COURIERS = text(
+    'SELECT id, delivery_person_id FROM "order" WHERE id IN :ids AND status = \'delivering\''
+).bindparams(bindparam('ids', expanding=True))
+
+def greedy_assign(distances, capacity, max_distance=None):
+    """
+    Closest pair first: repeatedly take the shortest remaining
+    (order, courier) distance whose courier still has capacity.
+    Returns the courier index for each order, -1 where none was found.
+    """
+    distances = np.asarray(distances, dtype=float)
+    remaining = np.maximum(np.array(capacity, dtype=int), 0)
+    n_orders, n_couriers = distances.shape
+    result = np.full(n_orders, -1)
+    pending = np.arange(n_orders)
+    k = min(CANDIDATES_PER_ORDER, n_couriers)
+
+    while pending.size and remaining.sum() > 0 and k > 0:
+        rows = distances[pending]
+        if k < n_couriers:
+            # Only each order's k nearest couriers; widened below if they fill up
+            candidates = np.argpartition(rows, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(n_couriers), rows.shape)
+        pair_orders = np.repeat(pending, candidates.shape[1])
+        pair_couriers = candidates.ravel()
+        pair_distances = np.take_along_axis(rows, candidates, axis=1).ravel()
+
+        keep = remaining[pair_couriers] > 0
+        if max_distance is not None:
+            keep &= pair_distances <= max_distance
+        ranked = np.argsort(pair_distances[keep], kind='stable')
+        pair_orders = pair_orders[keep][ranked]
+        pair_couriers = pair_couriers[keep][ranked]
+
+        free = remaining.sum()
+        for order, courier in zip(pair_orders.tolist(), pair_couriers.tolist()):
+            if result[order] == -1 and remaining[courier] > 0:
+                result[order] = courier
+                remaining[courier] -= 1
+                free -= 1
+                if free == 0:
+                    break
+
+        if k == n_couriers:
+            break
+        pending = pending[result[pending] == -1]
+        k = min(k * 4, n_couriers)
+    return result
+
+def _hungarian(cost):
+    """Minimum-cost assignment of every row to a distinct column (rows <= columns)"""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=int)  # row (1-based) matched to each column, 0 if none
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            u[match[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    rows = np.full(n, -1)
+    columns = np.nonzero(match[1:])[0]
+    rows[match[1:][columns] - 1] = columns
+    return rows
+
+def optimal_assign(distances, capacity, max_distance=None):
+    """
+    Assignment minimising total pickup distance (Hungarian method), with
+    each courier expanded into one slot per unit of capacity. Assigns as
+    many orders as capacity and max_distance allow. Cost grows roughly
+    with orders x slots x min(orders, slots), so this suits one zone's
+    batch rather than a whole city; use greedy_assign for that.
+    """
+    distances = np.asarray(distances, dtype=float)
+    n_orders = distances.shape[0]
+    result = np.full(n_orders, -1)
+    slots = np.repeat(np.arange(distances.shape[1]), np.maximum(np.asarray(capacity, dtype=int), 0))
+    if not n_orders or not slots.size:
+        return result
+
+    cost = distances[:, slots]
+    # Infeasible pairs cost more than any whole feasible assignment, so the
+    # solver only uses one when no feasible pair is left
+    limit = cost.max() if max_distance is None else max_distance
+    infeasible = limit * (n_orders + slots.size) + 1
+    if max_distance is not None:
+        cost = np.where(cost <= max_distance, cost, infeasible)
+
+    if n_orders <= slots.size:
+        matched = _hungarian(cost)
+        orders = np.arange(n_orders)
+    else:
+        matched_orders = _hungarian(cost.T)
+        orders = matched_orders
+        matched = np.arange(slots.size)
+    ok = cost[orders, matched] < infeasible
+    result[orders[ok]] = slots[matched[ok]]
+    return result
+
+def _zone_bounds(zone):
+    lat, lng, radius_km = zone
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return {'min_lat': lat - dlat, 'max_lat': lat + dlat, 'min_lng': lng - dlng, 'max_lng': lng + dlng}
+
+def load_dispatch_state(conn, zone=None):
+    """
+    Pending orders (id, pickup lat/lng) and available couriers
+    (id, lat/lng, active delivering count), each in one query. `zone` is an
+    optional (lat, lng, radius_km) restricting both to a bounding box.
+    """
+    order_sql, courier_sql = PENDING_ORDERS, AVAILABLE_COURIERS
+    params = {'active': True}
+    if zone is not None:
+        params.update(_zone_bounds(zone))
+        order_sql += (' AND s.location_lat BETWEEN :min_lat AND :max_lat'
+                      ' AND s.location_lng BETWEEN :min_lng AND :max_lng')
+        courier_sql += (' AND u.location_lat BETWEEN :min_lat AND :max_lat'
+                        ' AND u.location_lng BETWEEN :min_lng AND :max_lng')
+    courier_sql += ' GROUP BY u.id, u.location_lat, u.location_lng'
+
+    orders = conn.execute(text(order_sql + ' ORDER BY o.id'), params).fetchall()
+    couriers = conn.execute(text(courier_sql), params).fetchall()
+    return orders, couriers
+
+def plan_dispatch(orders, couriers, method='greedy', max_distance=MAX_PICKUP_DISTANCE_KM,
+                  max_active=MAX_ACTIVE_DELIVERIES):
+    """Match orders to couriers; returns [Assignment] without touching the database"""
+    if not orders or not couriers:
+        return []
+    distances = distance_matrix(
+        [row[1] for row in orders], [row[2] for row in orders],
+        [row[1] for row in couriers], [row[2] for row in couriers]
+    )
+    capacity = max_active - np.array([row[3] for row in couriers], dtype=int)
+    assign = optimal_assign if method == 'optimal' else greedy_assign
+    matched = assign(distances, capacity, max_distance)
+    return [
+        Assignment(orders[i][0], couriers[j][0], float(distances[i, j]))
+        for i, j in enumerate(matched.tolist()) if j >= 0
+    ]
+
+def commit_dispatch(conn, assignments):
+    """
+    Write assignments in one executemany. Each UPDATE only applies while the
+    order is still confirmed and unassigned, so a courier who accepted an
+    order by hand meanwhile keeps it. Returns the assignments that were
+    applied.
+    """
+    if not assignments:
+        return []
+    now = datetime.utcnow()
+    conn.execute(ASSIGN_ORDER, [
+        {'order_id': assignment.order_id, 'courier_id': assignment.courier_id, 'now': now}
+        for assignment in assignments
+    ])
+    # Orders this UPDATE skipped were unassigned before it, so a courier
+    # other than ours means someone else took the order
+    couriers = dict(conn.execute(ASSIGNED_COURIERS, {'ids': [a.order_id for a in assignments]}).fetchall())
+    applied = [a for a in assignments if couriers.get(a.order_id) == a.courier_id]
+    # Assigned orders moved to delivering behind the ORM's back
+    refresh_status_counts(conn, [assignment.order_id for assignment in applied])
+    return applied
+
+def dispatch_orders(conn, zone=None, method='greedy', max_distance=MAX_PICKUP_DISTANCE_KM,
+                    max_active=MAX_ACTIVE_DELIVERIES):
+    """Assign every pending order in the zone in one pass; the caller commits and notifies"""
+    orders, couriers = load_dispatch_state(conn, zone)
+    assignments = plan_dispatch(orders, couriers, method, max_distance, max_active)
+    return commit_dispatch(conn, assignments)
+
+def notify_dispatch(assignments):
+    """
+    Email each courier their new orders and tell customers and admins the
+    order is on its way. Call once the dispatch transaction has committed.
+    """
+    from ..models.order import Order
+    from .loading import with_profile
+    from .notifications import (notify_admin_order_status, notify_customer_order_status,
+                                notify_delivery_assignment)
+
+    if not assignments:
+        return
+    orders = with_profile(Order.query.filter(Order.id.in_([a.order_id for a in assignments])),
+                          'order_email').all()
+    for order in orders:
+        change = {'old': 'confirmed', 'new': order.status, 'action': 'Delivery person assigned'}
+        notify_delivery_assignment(order, order.delivery_person)
+        notify_customer_order_status(order, change)
+        notify_admin_order_status(order, change)
+
+def run_dispatch(zone=None, method='greedy'):
+    """Dispatch in a transaction of its own, then notify; returns the applied assignments"""
+    from .. import db
+
+    with db.engine.begin() as conn:
+        assignments = dispatch_orders(conn, zone, method)
+    notify_dispatch(assignments)
+    return assignments
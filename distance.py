@@ -1,39 +1,117 @@
 from math import radians, sin, cos, sqrt, atan2
 
+import numpy as np
+
+EARTH_RADIUS_KM = 6371  # Earth's radius in kilometers
+
+TRAVEL_SPEEDS = {
+    'walk': 5,      # 5 km/h walking speed
+    'bike': 15,     # 15 km/h cycling speed
+    'car': 30       # 30 km/h urban driving speed
+}
+
 def calculate_distance(lat1, lon1, lat2, lon2):
     """
     Calculate distance between two points in kilometers using Haversine formula
     """
-    R = 6371  # Earth's radius in kilometers
-    
+    R = EARTH_RADIUS_KM
+
     lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
     dlat = lat2 - lat1
     dlon = lon2 - lon1
-    
+
     a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     distance = R * c
-    
+
     return distance
 
+def _haversine(lat1, lon1, lat2, lon2):
+    """
+    Vectorized Haversine on radian arrays; inputs broadcast against each other
+    """
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS_KM * c
+
+def calculate_distances(lat, lon, lats, lons):
+    """
+    Calculate distances in kilometers from one point to many points.
+    Returns a float64 array shaped like `lats`.
+    """
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    return _haversine(radians(lat), radians(lon), lats, lons)
+
+def pairwise_distances(lats1, lons1, lats2, lons2):
+    """
+    Calculate distances in kilometers between matching pairs of points,
+    i.e. point i of the first set to point i of the second.
+    """
+    return _haversine(
+        np.radians(np.asarray(lats1, dtype=np.float64)),
+        np.radians(np.asarray(lons1, dtype=np.float64)),
+        np.radians(np.asarray(lats2, dtype=np.float64)),
+        np.radians(np.asarray(lons2, dtype=np.float64))
+    )
+
+def distance_matrix(lats1, lons1, lats2, lons2):
+    """
+    Calculate the full distance matrix in kilometers between two point sets.
+    Returns a float64 array of shape (len(lats1), len(lats2)).
+    """
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))[:, np.newaxis]
+    lons1 = np.radians(np.asarray(lons1, dtype=np.float64))[:, np.newaxis]
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))[np.newaxis, :]
+    lons2 = np.radians(np.asarray(lons2, dtype=np.float64))[np.newaxis, :]
+    return _haversine(lats1, lons1, lats2, lons2)
+
+def rank_by_distance(lat, lon, lats, lons, max_distance=None, limit=None):
+    """
+    Rank points by distance from (lat, lon).
+    Returns (indices, distances) sorted nearest first, optionally filtered to
+    `max_distance` km and truncated to the `limit` nearest points.
+    """
+    distances = calculate_distances(lat, lon, lats, lons)
+    indices = np.arange(distances.size)
+
+    if max_distance is not None:
+        indices = np.flatnonzero(distances <= max_distance)
+
+    if limit is not None and limit < indices.size:
+        # Partial selection first so only `limit` items are fully sorted
+        nearest = np.argpartition(distances[indices], limit - 1)[:limit]
+        indices = indices[nearest]
+
+    indices = indices[np.argsort(distances[indices], kind='stable')]
+    return indices, distances[indices]
+
 def get_formatted_distance(distance):
     """
-    Format distance in a human-readable way
+    Format distance in a human-readable way.
+    Accepts a single distance or an array of distances (returns a list).
     """
+    if np.ndim(distance):
+        return [get_formatted_distance(float(d)) for d in np.ravel(distance)]
+
     if distance < 1:
         return f"{distance * 1000:.0f}m"
     return f"{distance:.1f}km"
 
 def estimate_travel_time(distance, transport_mode='car'):
     """
-    Estimate travel time in minutes based on distance and transport mode
+    Estimate travel time in minutes based on distance and transport mode.
+    Accepts a single distance or an array of distances (returns an int array).
     """
-    speeds = {
-        'walk': 5,      # 5 km/h walking speed
-        'bike': 15,     # 15 km/h cycling speed
-        'car': 30       # 30 km/h urban driving speed
-    }
-    
-    speed = speeds.get(transport_mode, speeds['car'])
+    speed = TRAVEL_SPEEDS.get(transport_mode, TRAVEL_SPEEDS['car'])
+
+    if np.ndim(distance):
+        time_hours = np.asarray(distance, dtype=np.float64) / speed
+        # np.rint rounds half to even, matching the builtin round()
+        return np.rint(time_hours * 60).astype(np.int64)
+
     time_hours = distance / speed
     return round(time_hours * 60)  # Convert to minutes
\ No newline at end of file
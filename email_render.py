@@ -0,0 +1,58 @@
+import re
+
+from flask import current_app, render_template
+from markupsafe import Markup, escape
+
+_MARKER = '<!--recipient:{}-->'
+_MARKER_RE = re.compile(r'<!--recipient:(\w+)-->')
+
+class _RecipientSlot:
+    """
+    Stands in for the recipient while a shared body renders.
+    Every attribute read becomes a marker that render_fanout later replaces
+    with the real recipient's (escaped) value. Only suitable for templates
+    that print recipient fields directly, e.g. a greeting.
+    """
+    def __getattr__(self, name):
+        if name.startswith('_') or name.startswith('jinja_'):
+            raise AttributeError(name)
+        return Markup(_MARKER.format(name))
+
+def init_email_templates(app):
+    """Compile every email template once at startup"""
+    if app.debug or app.config.get('TEMPLATES_AUTO_RELOAD'):
+        # Keep picking up template edits during development
+        return
+    with app.app_context():
+        app.extensions['email_templates'] = {
+            name: app.jinja_env.get_template(name)
+            for name in app.jinja_env.list_templates(filter_func=lambda name: name.startswith('email/'))
+        }
+
+def get_email_template(name):
+    compiled = current_app.extensions.get('email_templates', {})
+    return compiled.get(name) or current_app.jinja_env.get_template(name)
+
+def render_email(template, **context):
+    """render_template for emails, using the precompiled template when there is one"""
+    return render_template(get_email_template(template), **context)
+
+def render_fanout(template, recipients, recipient_var='recipient', **context):
+    """
+    Render one body per recipient while running the template only once.
+    The shared body is rendered with a placeholder for `recipient_var`;
+    each recipient's fields are then spliced into the rendered text.
+    """
+    shared = render_email(template, **{recipient_var: _RecipientSlot()}, **context)
+    parts = _MARKER_RE.split(shared)
+    if len(parts) == 1:
+        return [shared] * len(recipients)
+
+    # parts alternates literal text and field names: [text, field, text, ...]
+    bodies = []
+    for recipient in recipients:
+        pieces = parts[:]
+        for i in range(1, len(pieces), 2):
+            pieces[i] = escape(getattr(recipient, pieces[i]))
+        bodies.append(''.join(pieces))
+    return bodies
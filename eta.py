@@ -0,0 +1,127 @@
+import time
+from threading import Lock
+
+import numpy as np
+from sqlalchemy import event, inspect, text
+
+from .delivery_quote import shop_positions
+from .distance import calculate_distance, pairwise_distances
+
+# How long a courier's active-delivery count may be reused
+LOAD_TTL = 15  # seconds
+
+# Same constants as notifications.estimate_delivery_time
+NO_COORDINATES_MINUTES = 60
+BASE_MINUTES = 15
+MINUTES_PER_KM = 3
+TRAFFIC_BUFFER = 1.2
+MINUTES_PER_ACTIVE_DELIVERY = 10
+
+class CourierLoadCache:
+    """Short-lived cache of how many orders each courier is delivering"""
+    def __init__(self, ttl=LOAD_TTL):
+        self.ttl = ttl
+        self._counts = {}
+        self._lock = Lock()
+
+    def get_many(self, courier_ids):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                courier_id: entry[1]
+                for courier_id, entry in ((courier_id, self._counts.get(courier_id)) for courier_id in courier_ids)
+                if entry and now - entry[0] < self.ttl
+            }
+
+    def put_many(self, counts):
+        now = time.monotonic()
+        with self._lock:
+            for courier_id, count in counts.items():
+                self._counts[courier_id] = (now, count)
+
+    def invalidate(self, courier_id):
+        with self._lock:
+            self._counts.pop(courier_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+courier_load_cache = CourierLoadCache()
+
+def active_delivery_counts(conn, courier_ids, cache=courier_load_cache):
+    """{courier_id: number of orders they are delivering}, from one GROUP BY"""
+    counts = cache.get_many(courier_ids) if cache is not None else {}
+    missing = [courier_id for courier_id in courier_ids if courier_id not in counts]
+    if missing:
+        placeholders = ', '.join(f':c{i}' for i in range(len(missing)))
+        fetched = dict.fromkeys(missing, 0)
+        fetched.update(conn.execute(text(
+            'SELECT delivery_person_id, COUNT(*) FROM "order" '
+            f"WHERE status = 'delivering' AND delivery_person_id IN ({placeholders}) "
+            'GROUP BY delivery_person_id'
+        ), {f'c{i}': courier_id for i, courier_id in enumerate(missing)}).fetchall())
+        if cache is not None:
+            cache.put_many(fetched)
+        counts.update(fetched)
+    return counts
+
+def estimate_delivery_times(orders, conn=None, cache=courier_load_cache):
+    """
+    Estimated delivery minutes for a list of orders, equal to calling
+    notifications.estimate_delivery_time on each. Shop positions and
+    courier loads are fetched once for the whole list instead of per order.
+    """
+    if not orders:
+        return []
+    if conn is None:
+        from .. import db
+        conn = db.session.connection()
+
+    positions = shop_positions(conn, sorted({order.shop_id for order in orders}))
+    shop_lats = np.array([positions.get(order.shop_id, (None, None))[0] or np.nan for order in orders])
+    shop_lngs = np.array([positions.get(order.shop_id, (None, None))[1] or np.nan for order in orders])
+    lats = np.array([order.delivery_lat or np.nan for order in orders])
+    lngs = np.array([order.delivery_lng or np.nan for order in orders])
+    # Zero or missing coordinates fall back to the default, as in the single-order version
+    located = ~np.isnan(shop_lats + shop_lngs + lats + lngs)
+
+    distances = pairwise_distances(shop_lats, shop_lngs, lats, lngs)
+    base_times = (BASE_MINUTES + distances * MINUTES_PER_KM) * TRAFFIC_BUFFER
+
+    # NumPy trig can differ from math's in the last bit; recompute the rare
+    # values sitting on a rounding boundary with the scalar formula
+    borderline = np.flatnonzero(located & (np.abs(base_times % 1 - 0.5) < 1e-9))
+    for i in borderline:
+        distance = calculate_distance(shop_lats[i], shop_lngs[i], lats[i], lngs[i])
+        base_times[i] = (BASE_MINUTES + distance * MINUTES_PER_KM) * TRAFFIC_BUFFER
+
+    courier_ids = sorted({order.delivery_person_id for order in orders if order.delivery_person_id})
+    loads = active_delivery_counts(conn, courier_ids, cache) if courier_ids else {}
+
+    estimates = []
+    for i, order in enumerate(orders):
+        if not located[i]:
+            estimates.append(NO_COORDINATES_MINUTES)
+            continue
+        base_time = float(base_times[i])
+        active = loads.get(order.delivery_person_id, 0) if order.delivery_person_id else 0
+        if active > 0:
+            base_time += active * MINUTES_PER_ACTIVE_DELIVERY
+        estimates.append(round(base_time))
+    return estimates
+
+def _refresh_courier_load(mapper, connection, target):
+    state = inspect(target)
+    history = state.attrs.delivery_person_id.history
+    if history.has_changes() or state.attrs.status.history.has_changes():
+        for courier_id in set(history.deleted or ()) | {target.delivery_person_id}:
+            if courier_id:
+                courier_load_cache.invalidate(courier_id)
+
+def init_eta(app):
+    """Drop cached courier loads when an order changes hands or status"""
+    from ..models.order import Order
+
+    if not event.contains(Order, 'after_update', _refresh_courier_load):
+        event.listen(Order, 'after_update', _refresh_courier_load)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+from ecommerce import db, create_app
+from ecommerce.utils.page_cache import page_cache, shop_scope
+from ecommerce.utils.product_import import import_products
+
+def main():
+    # python import_catalog.py <shop_id> <catalog.csv|catalog.jsonl> [image folder]
+    if len(sys.argv) < 3:
+        print("Usage: python import_catalog.py <shop_id> <catalog.csv|catalog.jsonl> [image folder]")
+        sys.exit(2)
+    shop_id, path = int(sys.argv[1]), sys.argv[2]
+    image_root = sys.argv[3] if len(sys.argv) > 3 else None
+    fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+    app = create_app(os.getenv('FLASK_CONFIG', 'development'))
+    with app.app_context():
+        products_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'products') if image_root else None
+        with open(path, 'rb') as stream, db.engine.begin() as conn:
+            report = import_products(conn, shop_id, stream, fmt=fmt,
+                                     image_root=image_root, products_dir=products_dir)
+        # Bulk inserts skip the ORM hooks that drop cached shop pages
+        page_cache.invalidate(shop_scope(shop_id))
+
+    print(f"Imported {report.inserted} products with {report.images} images")
+    if report.error_count:
+        print(f"Skipped {report.error_count} rows:")
+        for error in report.errors:
+            print(f"  line {error.line}: {error.message}")
+
+if __name__ == '__main__':
+    main()
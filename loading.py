@@ -0,0 +1,36 @@
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+# Relationship paths each view walks. Every hop to a single object is
+# joined into the parent query; every collection costs one extra SELECT
+# ... WHERE id IN (...) however many rows the list has.
+LOADING_PROFILES = {
+    'order_list': ('shop', 'items'),
+    'order_detail': ('shop', 'customer', 'delivery_person', 'items.product'),
+    # What the order emails render: shop owner, customer, courier, line items
+    'order_email': ('shop.owner', 'customer', 'delivery_person', 'items.product'),
+    'negotiation_list': ('product.shop', 'customer'),
+    'cart': ('product.shop',),
+}
+
+def _path_option(model, path):
+    option = None
+    for name in path.split('.'):
+        relationship = inspect(model).relationships[name]
+        loader = selectinload if relationship.uselist else joinedload
+        attribute = getattr(model, name)
+        option = loader(attribute) if option is None else getattr(option, loader.__name__)(attribute)
+        model = relationship.mapper.class_
+    return option
+
+def loading_options(model, profile):
+    """Loader options for a named profile, e.g. query.options(*loading_options(Order, 'order_list'))"""
+    try:
+        paths = LOADING_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown loading profile: {profile}") from None
+    return [_path_option(model, path) for path in paths]
+
+def with_profile(query, profile):
+    """Apply a loading profile to a query over a single model"""
+    return query.options(*loading_options(query.column_descriptions[0]['entity'], profile))
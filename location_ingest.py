@@ -0,0 +1,198 @@
+import atexit
+import logging
+from datetime import datetime, timedelta, timezone
+from threading import Event, Lock, Thread
+
+from sqlalchemy import text
+
+from .location_stream import position_store
+from .spatial_index import cell_key, courier_index
+
+# Seconds between bulk writes of buffered fixes
+FLUSH_INTERVAL = 2.0
+# Largest batch a phone may upload in one request
+MAX_BATCH_SIZE = 500
+# How far ahead of the server a phone's clock may run before its fixes are clamped to now
+MAX_CLOCK_SKEW = timedelta(minutes=2)
+
+# A fix replayed late from an offline phone never moves a courier back.
+# location_recorded_at is the phone's fix time; updated_at is left to profile writes.
+UPDATE_USER_LOCATION = text(
+    'UPDATE "user" SET location_lat = :lat, location_lng = :lng, '
+    'geo_cell = :cell, location_recorded_at = :recorded_at WHERE id = :courier_id '
+    'AND (location_recorded_at IS NULL OR location_recorded_at <= :recorded_at)'
+)
+INSERT_POSITION_HISTORY = text(
+    'INSERT INTO courier_position_history (courier_id, lat, lng, recorded_at) '
+    'VALUES (:courier_id, :lat, :lng, :recorded_at)'
+)
+
+def parse_fix(data):
+    """
+    Build a (lat, lng, recorded_at) fix from a JSON payload.
+    `recorded_at` may be an ISO timestamp or epoch seconds; defaults to now.
+    Timestamps with an offset are converted to naive UTC, like utcnow(), and
+    ones further ahead than MAX_CLOCK_SKEW are clamped to now, so a phone
+    with a wrong clock can't freeze its courier's stored position.
+    Raises ValueError for missing or out-of-range coordinates.
+    """
+    lat = float(data['lat'])
+    lng = float(data['lng'])
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('Coordinates out of range')
+
+    recorded_at = data.get('recorded_at')
+    if recorded_at is None:
+        recorded_at = datetime.utcnow()
+    elif isinstance(recorded_at, (int, float)):
+        try:
+            recorded_at = datetime.utcfromtimestamp(recorded_at)
+        except (OverflowError, OSError) as e:
+            raise ValueError('recorded_at is out of range') from e
+    elif not isinstance(recorded_at, str):
+        raise TypeError('recorded_at must be an ISO timestamp or epoch seconds')
+    else:
+        recorded_at = datetime.fromisoformat(recorded_at.replace('Z', '+00:00'))
+        if recorded_at.tzinfo is not None:
+            recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+    now = datetime.utcnow()
+    if recorded_at > now + MAX_CLOCK_SKEW:
+        recorded_at = now
+    return lat, lng, recorded_at
+
+class LocationIngestor:
+    """
+    Coalesces courier GPS fixes in memory and writes them in bulk.
+    Only the newest fix per courier is kept between flushes, so the
+    database sees at most one UPDATE per courier and one commit per
+    interval, however often phones report. Live trackers and the courier
+    spatial index are updated immediately on submit.
+    """
+    def __init__(self, engine, flush_interval=FLUSH_INTERVAL, keep_history=False, app=None):
+        self.engine = engine
+        self.app = app
+        self.flush_interval = flush_interval
+        self.keep_history = keep_history
+        self._latest = {}   # courier_id -> (lat, lng, recorded_at)
+        self._newest = {}   # courier_id -> newest recorded_at ever accepted
+        self._history = []  # every accepted fix, when keep_history is on
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+        # Counters for monitoring
+        self.fixes_received = 0
+        self.fixes_written = 0
+        self.flushes = 0
+
+    def submit(self, courier_id, lat, lng, recorded_at=None):
+        """Buffer one fix; returns False if a newer fix was already accepted"""
+        recorded_at = recorded_at or datetime.utcnow()
+        with self._lock:
+            self.fixes_received += 1
+            if self.keep_history:
+                self._history.append({
+                    'courier_id': courier_id, 'lat': lat, 'lng': lng, 'recorded_at': recorded_at
+                })
+            newest = self._newest.get(courier_id)
+            if newest and newest > recorded_at:
+                return False
+            self._newest[courier_id] = recorded_at
+            self._latest[courier_id] = (lat, lng, recorded_at)
+
+        courier_index.update(courier_id, lat, lng)
+        position_store.publish(courier_id, lat, lng, recorded_at)
+        return True
+
+    def submit_batch(self, courier_id, fixes):
+        """Buffer several (lat, lng, recorded_at) fixes, e.g. replayed from an offline phone"""
+        accepted = 0
+        for lat, lng, recorded_at in sorted(fixes, key=lambda fix: fix[2]):
+            accepted += self.submit(courier_id, lat, lng, recorded_at)
+        return accepted
+
+    def pending(self):
+        return len(self._latest)
+
+    def flush(self):
+        """Write buffered fixes in one transaction; returns the number of couriers updated"""
+        with self._lock:
+            latest, self._latest = self._latest, {}
+            history, self._history = self._history, []
+        if not latest and not history:
+            return 0
+
+        rows = [
+            {
+                'courier_id': courier_id,
+                'lat': lat,
+                'lng': lng,
+                'cell': cell_key(lat, lng),
+                'recorded_at': recorded_at
+            }
+            for courier_id, (lat, lng, recorded_at) in latest.items()
+        ]
+        try:
+            with self.engine.begin() as conn:
+                if rows:
+                    # A list of parameter sets runs as a single executemany
+                    conn.execute(UPDATE_USER_LOCATION, rows)
+                if history:
+                    conn.execute(INSERT_POSITION_HISTORY, history)
+        except Exception:
+            # Put the fixes back unless newer ones arrived meanwhile
+            with self._lock:
+                for courier_id, fix in latest.items():
+                    current = self._latest.get(courier_id)
+                    if not current or current[2] < fix[2]:
+                        self._latest[courier_id] = fix
+                self._history[:0] = history
+            raise
+
+        self.fixes_written += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    def start(self):
+        """Flush periodically on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='location-ingest', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger = self.app.logger if self.app else logging.getLogger(__name__)
+                logger.exception("Error flushing courier locations")
+
+location_ingestor = None
+
+def init_location_ingest(app):
+    """Create the process-wide ingestor and start its flusher"""
+    global location_ingestor
+    from .. import db
+
+    with app.app_context():
+        location_ingestor = LocationIngestor(
+            db.engine,
+            flush_interval=app.config.get('LOCATION_FLUSH_INTERVAL', FLUSH_INTERVAL),
+            keep_history=app.config.get('LOCATION_HISTORY_ENABLED', False),
+            app=app
+        )
+    location_ingestor.start()
+    atexit.register(location_ingestor.stop)
+    app.extensions['location_ingestor'] = location_ingestor
+    return location_ingestor
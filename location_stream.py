@@ -0,0 +1,219 @@
+import json
+import time
+from datetime import datetime
+from threading import Condition, Lock
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+from .distance import calculate_distance
+
+# Subscribers are only woken when a courier moves further than this
+MOVE_THRESHOLD_KM = 0.015
+# Comment line sent to idle streams so proxies keep the connection open
+KEEPALIVE_SECONDS = 15
+# How stale a position may get before one subscriber re-reads it from the
+# database (covers updates that landed on another worker)
+REFRESH_SECONDS = 30
+
+# Courier moves made in a session, published to trackers once it commits
+PENDING_MOVES = 'location_stream_moves'
+
+# An order being delivered by the courier, placed by or sold by the viewer
+VIEWER_HAS_DELIVERY = text(
+    'SELECT 1 FROM "order" o JOIN shop s ON s.id = o.shop_id '
+    "WHERE o.delivery_person_id = :courier_id AND o.status = 'delivering' "
+    'AND (o.customer_id = :user_id OR s.owner_id = :user_id) LIMIT 1'
+)
+
+class _Channel:
+    """Latest published position of one courier and the condition its subscribers wait on"""
+    __slots__ = ('condition', 'lat', 'lng', 'updated_at', 'version', 'checked_at', 'subscribers')
+
+    def __init__(self):
+        self.condition = Condition(Lock())
+        self.lat = None
+        self.lng = None
+        self.updated_at = None
+        self.version = 0
+        self.checked_at = 0.0
+        self.subscribers = 0
+
+    def payload(self):
+        return {
+            'status': 'success',
+            'location': {
+                'lat': self.lat,
+                'lng': self.lng,
+                'last_updated': self.updated_at.isoformat() if self.updated_at else None
+            }
+        }
+
+class PositionStore:
+    """
+    In-memory latest-position store with per-courier fan-out.
+    A publish touches only the channel for that courier and wakes its
+    subscribers once, however many of them there are.
+    """
+    def __init__(self, threshold_km=MOVE_THRESHOLD_KM):
+        self.threshold_km = threshold_km
+        self.streams = 0  # open subscriber responses in this process
+        self._channels = {}
+        self._lock = Lock()
+
+    def reserve(self, limit=None):
+        """
+        Count a new stream, unless `limit` are already open. Each stream holds
+        a worker thread (or greenlet) for as long as the page stays open.
+        """
+        with self._lock:
+            if limit and self.streams >= limit:
+                return False
+            self.streams += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.streams -= 1
+
+    def _channel(self, courier_id):
+        channel = self._channels.get(courier_id)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.setdefault(courier_id, _Channel())
+        return channel
+
+    def latest(self, courier_id):
+        channel = self._channels.get(courier_id)
+        if channel is None or channel.lat is None:
+            return None
+        return channel.lat, channel.lng, channel.updated_at
+
+    def publish(self, courier_id, lat, lng, updated_at=None):
+        """
+        Record a courier position. Returns True if subscribers were woken,
+        False if the move was below the threshold.
+        """
+        if lat is None or lng is None:
+            return False
+
+        channel = self._channel(courier_id)
+        with channel.condition:
+            channel.checked_at = time.monotonic()
+            if channel.lat is not None and calculate_distance(
+                channel.lat, channel.lng, lat, lng
+            ) < self.threshold_km:
+                return False
+
+            channel.lat = lat
+            channel.lng = lng
+            channel.updated_at = updated_at or datetime.utcnow()
+            channel.version += 1
+            channel.condition.notify_all()
+            return True
+
+    def subscriber_count(self, courier_id):
+        channel = self._channels.get(courier_id)
+        return channel.subscribers if channel else 0
+
+    def subscribe(self, courier_id, loader=None, keepalive=KEEPALIVE_SECONDS,
+                  refresh=REFRESH_SECONDS):
+        """
+        Generate server-sent-event frames for a courier.
+        `loader(courier_id)` returns (lat, lng, updated_at) from the database;
+        it is called at most once per `refresh` seconds per courier, shared by
+        all subscribers of that courier in this process.
+        """
+        channel = self._channel(courier_id)
+        with channel.condition:
+            channel.subscribers += 1
+        try:
+            if loader and channel.lat is None:
+                self._refresh(courier_id, channel, loader, refresh)
+
+            seen = 0
+            while True:
+                with channel.condition:
+                    if channel.version == seen:
+                        channel.condition.wait(timeout=keepalive)
+                    version = channel.version
+                    payload = channel.payload() if version != seen else None
+
+                if payload is not None:
+                    seen = version
+                    yield f"id: {version}\nevent: location\ndata: {json.dumps(payload)}\n\n"
+                else:
+                    yield ": keepalive\n\n"
+
+                if loader and time.monotonic() - channel.checked_at > refresh:
+                    self._refresh(courier_id, channel, loader, refresh)
+        finally:
+            with channel.condition:
+                channel.subscribers -= 1
+
+    def _refresh(self, courier_id, channel, loader, refresh):
+        with channel.condition:
+            # Another subscriber is already refreshing (or just did)
+            if time.monotonic() - channel.checked_at <= refresh:
+                return
+            channel.checked_at = time.monotonic()
+        position = loader(courier_id)
+        if position:
+            self.publish(courier_id, *position)
+
+position_store = PositionStore()
+
+def load_courier_position(courier_id):
+    """Read a courier's stored position; used to seed and refresh streams"""
+    from .. import db
+
+    row = db.session.execute(text(
+        'SELECT location_lat, location_lng, location_recorded_at FROM "user" WHERE id = :id'
+    ), {'id': courier_id}).first()
+    db.session.remove()
+    if not row or row[0] is None or row[1] is None:
+        return None
+    return row[0], row[1], row[2]
+
+def may_track(conn, user_id, role, courier_id):
+    """
+    Whether a user may follow a courier live: the courier themselves, an
+    admin, or the customer or shop owner of an order they are delivering
+    """
+    if role == 'admin' or user_id == courier_id:
+        return True
+    row = conn.execute(VIEWER_HAS_DELIVERY, {'courier_id': courier_id, 'user_id': user_id}).first()
+    return row is not None
+
+def _publish_user_move(mapper, connection, target):
+    if target.role != 'delivery':
+        return
+    state = inspect(target)
+    if not (state.attrs.location_lat.history.has_changes()
+            or state.attrs.location_lng.history.has_changes()):
+        return
+    session = object_session(target)
+    if session is None:
+        position_store.publish(target.id, target.location_lat, target.location_lng)
+    else:
+        session.info.setdefault(PENDING_MOVES, {})[target.id] = (target.location_lat, target.location_lng)
+
+def _publish_committed(session):
+    # Trackers must never see a position that was rolled back
+    moves = session.info.pop(PENDING_MOVES, None)
+    if moves:
+        for courier_id, (lat, lng) in moves.items():
+            position_store.publish(courier_id, lat, lng)
+
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_MOVES, None)
+
+def init_location_stream(app):
+    """Publish courier moves made through the ORM to live trackers"""
+    from ..models.user import User
+
+    if not event.contains(User, 'after_update', _publish_user_move):
+        event.listen(User, 'after_update', _publish_user_move)
+    if not event.contains(Session, 'after_commit', _publish_committed):
+        event.listen(Session, 'after_commit', _publish_committed)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
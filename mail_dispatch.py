@@ -0,0 +1,396 @@
+import atexit
+import json
+import os
+import queue
+import smtplib
+import socket
+import time
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread, get_ident
+
+from flask import current_app
+from flask_mail import Message
+from sqlalchemy import text
+
+# Worker threads, each holding its own SMTP connection while it has work
+POOL_SIZE = 2
+# Fan-outs are split into chunks so large ones spread over the pool
+CHUNK_SIZE = 50
+# Queued chunks held in memory before submit applies backpressure
+QUEUE_DEPTH = 200
+# How long submit waits for room before spilling to the outbox table
+PUT_TIMEOUT = 0.5
+MAX_RETRIES = 3
+RETRY_DELAY = 1.0  # seconds, doubled on each retry
+# Idle workers check the outbox this often
+OUTBOX_POLL = 5.0
+OUTBOX_CLAIM_SIZE = CHUNK_SIZE
+OUTBOX_MAX_ATTEMPTS = 5
+# Claims older than this belong to a worker that died mid-send
+OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=10)
+
+CREATE_OUTBOX_TABLE = '''
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id INTEGER PRIMARY KEY,
+        subject VARCHAR(255) NOT NULL,
+        sender VARCHAR(255),
+        recipients TEXT NOT NULL,
+        html TEXT,
+        body TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_by VARCHAR(64),
+        claimed_at DATETIME,
+        created_at DATETIME NOT NULL
+    )
+'''
+CREATE_OUTBOX_INDEX = 'CREATE INDEX IF NOT EXISTS ix_email_outbox_claimed_by ON email_outbox (claimed_by, id)'
+
+def _is_disconnect(error):
+    # SMTPException subclasses OSError, so socket errors need telling apart
+    return isinstance(error, smtplib.SMTPServerDisconnected) or (
+        isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+    )
+
+def _is_transient(error):
+    """Connection drops and 4xx replies are worth retrying; 5xx are not"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return _is_disconnect(error)
+
+class MailDispatcher:
+    """
+    Sends notification mail off the request thread with bounded resources.
+    A fixed pool of workers each deliver queued batches over one persistent
+    SMTP connection instead of one session per message; failed messages
+    are retried individually, reconnecting when the server dropped us.
+
+    The in-memory queue holds at most `queue_depth` batches. When it is
+    full, submit blocks for up to `put_timeout` seconds and then spills the
+    batch to the email_outbox table (if an engine was given), which idle
+    workers drain. Without an outbox, submit blocks until there is room.
+    """
+    def __init__(self, app, mail, pool_size=POOL_SIZE, chunk_size=CHUNK_SIZE,
+                 max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY,
+                 queue_depth=QUEUE_DEPTH, put_timeout=PUT_TIMEOUT, engine=None,
+                 outbox_poll=OUTBOX_POLL):
+        self.app = app
+        self.mail = mail
+        self.pool_size = pool_size
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue_depth = queue_depth
+        self.put_timeout = put_timeout
+        self.engine = engine
+        self.outbox_poll = outbox_poll
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._workers = []
+        self._stopping = Event()
+        self._lock = Lock()
+
+        # Counters exposed through stats()
+        self.sent = 0
+        self.failed = 0
+        self.spilled = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def submit(self, messages):
+        """Queue messages for delivery; blocks only while the queue is full"""
+        messages = list(messages)
+        for start in range(0, len(messages), self.chunk_size):
+            batch = messages[start:start + self.chunk_size]
+            item = (time.monotonic(), batch)
+            if self.engine is None:
+                self._queue.put(item)
+                continue
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._spill(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self.queue_depth,
+                'workers': len(self._workers),
+                'sent': self.sent,
+                'failed': self.failed,
+                'spilled': self.spilled,
+                'latency_avg': self.latency_total / self.sent if self.sent else 0.0,
+                'latency_max': self.latency_max
+            }
+
+    def start(self):
+        if self._workers:
+            return
+        self._stopping.clear()
+        for i in range(self.pool_size):
+            worker = Thread(target=self._run, name=f'mail-dispatch-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self, timeout=30):
+        """
+        Drain queued batches, then stop the workers. Anything still queued
+        after `timeout` seconds is spilled to the outbox, or logged as lost.
+        """
+        self._stopping.set()
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+
+        leftover = []
+        while True:
+            try:
+                leftover.extend(self._queue.get_nowait()[1])
+                self._queue.task_done()
+            except queue.Empty:
+                break
+        if leftover:
+            if self.engine is not None:
+                self._spill(leftover)
+            else:
+                self.app.logger.error(f"Dropped {len(leftover)} queued emails on shutdown")
+
+    def join(self):
+        """Block until every queued batch has been handled"""
+        self._queue.join()
+
+    def _run(self):
+        poll = self.outbox_poll if self.engine is not None else 0.5
+        while True:
+            try:
+                item = self._queue.get(timeout=poll)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                if self.engine is not None:
+                    self._drain_outbox()
+                continue
+            with self.app.app_context():
+                self._send_batches(item)
+
+    def _send_batches(self, item):
+        """
+        Send a queued batch, and any batches queued behind it, over one SMTP
+        session. The session is closed once the queue runs dry so idle
+        workers hold no connection.
+        """
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self.app.logger.error(f"Error connecting to mail server: {e}")
+            self._set_aside(item[1])
+            self._queue.task_done()
+            return
+
+        try:
+            while True:
+                enqueued_at, batch = item
+                for msg in batch:
+                    if self._send_with_retry(conn, msg):
+                        self._record_latency(time.monotonic() - enqueued_at)
+                self._queue.task_done()
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+        finally:
+            self._close(conn)
+
+    def _send_with_retry(self, conn, msg):
+        """Send one message, retrying transient failures; returns True if sent"""
+        delay = self.retry_delay
+        reconnect = False
+        for attempt in range(self.max_retries + 1):
+            try:
+                if reconnect:
+                    self._reconnect(conn)
+                conn.send(msg)
+                self._count(sent=1)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries or not _is_transient(e):
+                    self._count(failed=1)
+                    self.app.logger.error(f"Error sending email to {msg.recipients}: {e}")
+                    return False
+                reconnect = conn.host is not None and _is_disconnect(e)
+                time.sleep(delay)
+                delay *= 2
+
+    def _connect(self):
+        """Open an SMTP session, retrying with backoff while the server is unreachable"""
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self.mail.connect().__enter__()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay *= 2
+
+    def _set_aside(self, batch):
+        """Keep a batch the server would not take in the outbox; without one it is lost"""
+        if self.engine is not None:
+            try:
+                self._spill(batch)
+                return
+            except Exception as e:
+                self.app.logger.error(f"Error writing email outbox: {e}")
+        self._count(failed=len(batch))
+        self.app.logger.error(f"Dropped {len(batch)} emails the mail server did not accept")
+
+    def _reconnect(self, conn):
+        try:
+            conn.host.close()
+        except Exception:
+            pass
+        conn.host = conn.configure_host()
+
+    def _close(self, conn):
+        try:
+            if conn.host:
+                conn.host.quit()
+        except Exception:
+            pass  # Every message has been handled; a failed QUIT is harmless
+
+    def _count(self, sent=0, failed=0, spilled=0):
+        with self._lock:
+            self.sent += sent
+            self.failed += failed
+            self.spilled += spilled
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+
+    def _spill(self, batch):
+        """Persist a batch to the outbox so it survives overload and restarts"""
+        now = datetime.utcnow()
+        rows = [
+            {
+                'subject': msg.subject,
+                'sender': json.dumps(msg.sender),
+                'recipients': json.dumps(list(msg.recipients)),
+                'html': msg.html,
+                'body': msg.body,
+                'created_at': now
+            }
+            for msg in batch
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'INSERT INTO email_outbox (subject, sender, recipients, html, body, attempts, created_at) '
+                'VALUES (:subject, :sender, :recipients, :html, :body, 0, :created_at)'
+            ), rows)
+        self._count(spilled=len(rows))
+
+    def _claim_outbox(self):
+        """Claim a chunk of outbox rows for this worker; safe across processes"""
+        token = f'{socket.gethostname()}:{os.getpid()}:{get_ident()}'[:64]
+        now = datetime.utcnow()
+        with self.engine.begin() as conn:
+            # Postgres hands concurrent claimers disjoint rows; the outer condition is
+            # re-checked after a blocked UPDATE, so a row claimed meanwhile is left alone
+            skip_locked = ' FOR UPDATE SKIP LOCKED' if conn.dialect.name == 'postgresql' else ''
+            conn.execute(text(
+                'UPDATE email_outbox SET claimed_by = :token, claimed_at = :now '
+                'WHERE (claimed_by IS NULL OR claimed_at < :stale) AND id IN (SELECT id FROM email_outbox '
+                f'WHERE claimed_by IS NULL OR claimed_at < :stale ORDER BY id LIMIT :limit{skip_locked})'
+            ), {'token': token, 'now': now, 'stale': now - OUTBOX_CLAIM_TIMEOUT, 'limit': OUTBOX_CLAIM_SIZE})
+            return conn.execute(text(
+                'SELECT id, subject, sender, recipients, html, body, attempts '
+                'FROM email_outbox WHERE claimed_by = :token ORDER BY id'
+            ), {'token': token}).fetchall()
+
+    def _drain_outbox(self):
+        try:
+            rows = self._claim_outbox()
+        except Exception as e:
+            self.app.logger.error(f"Error reading email outbox: {e}")
+            return
+        if not rows:
+            return
+
+        sent_ids, retry_ids, dead_ids = [], [], []
+        with self.app.app_context():
+            try:
+                conn = self.mail.connect().__enter__()
+            except Exception as e:
+                self.app.logger.error(f"Error connecting to mail server: {e}")
+                conn = None
+            try:
+                for row in rows:
+                    sender = json.loads(row.sender) if row.sender else None
+                    msg = Message(
+                        row.subject,
+                        recipients=json.loads(row.recipients),
+                        html=row.html,
+                        body=row.body,
+                        sender=tuple(sender) if isinstance(sender, list) else sender
+                    )
+                    if conn is not None and self._send_with_retry(conn, msg):
+                        sent_ids.append(row.id)
+                    elif row.attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+                        dead_ids.append(row.id)
+                    else:
+                        retry_ids.append(row.id)
+            finally:
+                if conn is not None:
+                    self._close(conn)
+
+        with self.engine.begin() as db_conn:
+            if sent_ids or dead_ids:
+                db_conn.execute(text('DELETE FROM email_outbox WHERE id = :id'),
+                                [{'id': row_id} for row_id in sent_ids + dead_ids])
+            if retry_ids:
+                db_conn.execute(text(
+                    'UPDATE email_outbox SET attempts = attempts + 1, claimed_by = NULL, '
+                    'claimed_at = NULL WHERE id = :id'
+                ), [{'id': row_id} for row_id in retry_ids])
+        if dead_ids:
+            self.app.logger.error(f"Gave up on {len(dead_ids)} outbox emails after {OUTBOX_MAX_ATTEMPTS} attempts")
+
+def ensure_outbox_table(conn):
+    conn.execute(text(CREATE_OUTBOX_TABLE))
+    conn.execute(text(CREATE_OUTBOX_INDEX))
+
+def init_mail_dispatcher(app, mail):
+    engine = None
+    if app.config.get('MAIL_OUTBOX_ENABLED', True):
+        from .. import db
+        with app.app_context():
+            engine = db.engine
+
+    dispatcher = MailDispatcher(
+        app,
+        mail,
+        pool_size=app.config.get('MAIL_DISPATCH_POOL_SIZE', POOL_SIZE),
+        max_retries=app.config.get('MAIL_DISPATCH_MAX_RETRIES', MAX_RETRIES),
+        queue_depth=app.config.get('MAIL_QUEUE_DEPTH', QUEUE_DEPTH),
+        put_timeout=app.config.get('MAIL_QUEUE_PUT_TIMEOUT', PUT_TIMEOUT),
+        engine=engine
+    )
+    dispatcher.start()
+    atexit.register(dispatcher.stop)
+    app.extensions['mail_dispatcher'] = dispatcher
+    return dispatcher
+
+def dispatch_messages(messages):
+    """Hand messages to the app's dispatcher, or send inline if there is none"""
+    dispatcher = current_app.extensions.get('mail_dispatcher')
+    if dispatcher is not None:
+        dispatcher.submit(messages)
+        return
+
+    mail = current_app.extensions['mail']
+    with mail.connect() as conn:
+        for msg in messages:
+            conn.send(msg)
@@ -0,0 +1,193 @@
+import hmac
+import time
+from bisect import bisect_left
+from threading import Lock, local
+
+from flask import Response, before_render_template, request, template_rendered
+from sqlalchemy import event
+
+# Latency buckets in seconds (the Prometheus client defaults)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Requests slower than this are logged with their statements; 0 disables
+SLOW_REQUEST_THRESHOLD = 1.0  # seconds
+# Statements included in a slow request's log line, slowest first
+SLOW_STATEMENTS_LOGGED = 5
+
+_trace = local()
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class RequestTrace:
+    """SQL and template timings gathered while one request runs"""
+    __slots__ = ('started', 'statements', 'sql_seconds', 'templates')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = []  # (seconds, statement)
+        self.sql_seconds = 0.0
+        self.templates = []  # start times of templates still rendering
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+class Metrics:
+    """
+    Per-process request, SQL and template metrics in Prometheus text format.
+    Each worker process keeps its own counters, so scrape every worker (or
+    sum across them) when running several.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._lock = Lock()
+        self.request_seconds = {}  # (endpoint, method, status) -> Histogram
+        self.sql_statements = {}  # endpoint -> statements run
+        self.sql_seconds = {}  # endpoint -> seconds spent in SQL
+        self.template_seconds = {}  # template -> Histogram
+
+    def observe_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        with self._lock:
+            key = (endpoint, method, status)
+            if key not in self.request_seconds:
+                self.request_seconds[key] = Histogram(self.buckets)
+            self.request_seconds[key].observe(seconds)
+            self.sql_statements[endpoint] = self.sql_statements.get(endpoint, 0) + statements
+            self.sql_seconds[endpoint] = self.sql_seconds.get(endpoint, 0.0) + sql_seconds
+
+    def observe_template(self, template, seconds):
+        with self._lock:
+            if template not in self.template_seconds:
+                self.template_seconds[template] = Histogram(self.buckets)
+            self.template_seconds[template].observe(seconds)
+
+    def _histogram_lines(self, name, label_names, histograms):
+        lines = [f'# TYPE {name} histogram']
+        for values, histogram in sorted(histograms.items()):
+            labels = _labels(label_names, values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return lines
+
+    def render(self):
+        with self._lock:
+            lines = ['# HELP quickshop_request_duration_seconds Time to handle a request']
+            lines += self._histogram_lines('quickshop_request_duration_seconds',
+                                           ('endpoint', 'method', 'status'), self.request_seconds)
+            lines.append('# HELP quickshop_sql_statements_total SQL statements run by requests')
+            lines.append('# TYPE quickshop_sql_statements_total counter')
+            for endpoint, count in sorted(self.sql_statements.items()):
+                lines.append(f'quickshop_sql_statements_total{{{_labels(("endpoint",), (endpoint,))}}} {count}')
+            lines.append('# HELP quickshop_sql_duration_seconds_total Time requests spent in SQL')
+            lines.append('# TYPE quickshop_sql_duration_seconds_total counter')
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'quickshop_sql_duration_seconds_total{{{_labels(("endpoint",), (endpoint,))}}} {seconds!r}')
+            lines.append('# HELP quickshop_template_render_seconds Time to render a template')
+            lines += self._histogram_lines('quickshop_template_render_seconds',
+                                           ('template',), {(name,): h for name, h in self.template_seconds.items()})
+        return '\n'.join(lines) + '\n'
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['metrics_query_start'].pop()
+    trace = getattr(_trace, 'current', None)
+    if trace is not None:
+        seconds = time.perf_counter() - started
+        trace.statements.append((seconds, statement))
+        trace.sql_seconds += seconds
+
+def _statement_failed(exception_context):
+    # after_cursor_execute never fires for a failed statement
+    conn = exception_context.connection
+    if conn is not None and conn.info.get('metrics_query_start'):
+        conn.info['metrics_query_start'].pop()
+
+def _before_template(sender, template, context, **extra):
+    trace = getattr(_trace, 'current', None)
+    if trace is not None:
+        trace.templates.append(time.perf_counter())
+
+def init_metrics(app, engines=None):
+    """Time requests, their SQL and their templates; serve the totals at /metrics"""
+    if not app.config.get('METRICS_ENABLED', False):
+        return None
+    token = app.config.get('METRICS_TOKEN')
+
+    metrics = Metrics()
+    threshold = app.config.get('SLOW_REQUEST_THRESHOLD', SLOW_REQUEST_THRESHOLD)
+
+    if engines is None:
+        from .. import db
+        with app.app_context():
+            engines = list(db.engines.values())
+    for engine in engines:
+        if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _statement_failed)
+
+    def template_done(sender, template, context, **extra):
+        trace = getattr(_trace, 'current', None)
+        if trace is not None and trace.templates:
+            metrics.observe_template(template.name, time.perf_counter() - trace.templates.pop())
+
+    before_render_template.connect(_before_template, app)
+    template_rendered.connect(template_done, app)
+    # Signals hold weak references by default
+    app.extensions['metrics_template_done'] = template_done
+
+    @app.before_request
+    def start_trace():
+        _trace.current = RequestTrace()
+
+    @app.after_request
+    def record_request(response):
+        trace = getattr(_trace, 'current', None)
+        if trace is None or request.endpoint == 'metrics':
+            return response
+        seconds = time.perf_counter() - trace.started
+        endpoint = request.endpoint or 'unmatched'
+        metrics.observe_request(endpoint, request.method, response.status_code, seconds,
+                                len(trace.statements), trace.sql_seconds)
+        if threshold and seconds >= threshold:
+            slowest = sorted(trace.statements, key=lambda item: item[0], reverse=True)[:SLOW_STATEMENTS_LOGGED]
+            app.logger.warning(
+                f"Slow request {request.method} {request.path} ({endpoint}): {seconds:.3f}s, "
+                f"{len(trace.statements)} statements in {trace.sql_seconds:.3f}s"
+                + ''.join(f"\n  {elapsed:.3f}s {statement}" for elapsed, statement in slowest)
+            )
+        return response
+
+    @app.teardown_request
+    def end_trace(error=None):
+        _trace.current = None
+
+    def metrics_view():
+        # Endpoint names, statement counts and latencies are not for the public
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if token and not hmac.compare_digest(supplied.encode(), token.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain',
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.extensions['metrics'] = metrics
+    return metrics
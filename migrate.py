@@ -1,46 +1,48 @@
+import sys
+
 from ecommerce import db, create_app
-from ecommerce.models.shop import Product, Shop
-from sqlalchemy import text
+from ecommerce.utils.analytics import rebuild_analytics
+from ecommerce.utils.migrations import MIGRATIONS, applied_versions, run_migrations
+from ecommerce.utils.query_plans import full_scans
+
+def migrate(target=None):
+    applied = run_migrations(db.engine, target=target, log=print)
+    if not applied:
+        print("Database is up to date")
+
+def status():
+    with db.engine.begin() as conn:
+        applied = applied_versions(conn)
+    for step in MIGRATIONS:
+        mark = 'x' if step.version in applied else ' '
+        print(f"[{mark}] {step.version} {step.description}")
 
-def migrate():
+def check_plans():
+    """Exit non-zero if a hot query would read a whole table"""
     with db.engine.connect() as conn:
-        # Add email_notifications column to user table with default value
-        try:
-            conn.execute(text('''
-                ALTER TABLE user 
-                ADD COLUMN email_notifications BOOLEAN NOT NULL DEFAULT 1
-            '''))
-            print("Added email_notifications column to user table")
-        except Exception as e:
-            print(f"Error adding email_notifications column (it might already exist): {e}")
+        scans = full_scans(conn)
+    for name, step in scans:
+        print(f"Full table scan in {name}: {step}")
+    if scans:
+        sys.exit(1)
+    print("No full table scans in hot queries")
 
-        # Add category column to product table
-        try:
-            conn.execute(text('ALTER TABLE product ADD COLUMN category VARCHAR(50)'))
-            print("Added category column to product table")
-        except Exception as e:
-            print(f"Error adding column (it might already exist): {e}")
-            
-        # Add about column to shop table
-        try:
-            conn.execute(text('ALTER TABLE shop ADD COLUMN about TEXT'))
-            print("Added about column to shop table")
-        except Exception as e:
-            print(f"Error adding column (it might already exist): {e}")
-        
-        # Add contact fields to shop table
-        try:
-            conn.execute(text('ALTER TABLE shop ADD COLUMN phone VARCHAR(20)'))
-            conn.execute(text('ALTER TABLE shop ADD COLUMN email VARCHAR(120)'))
-            conn.execute(text('ALTER TABLE shop ADD COLUMN website VARCHAR(200)'))
-            conn.execute(text('ALTER TABLE shop ADD COLUMN business_hours TEXT'))
-            print("Added contact columns to shop table")
-        except Exception as e:
-            print(f"Error adding columns (they might already exist): {e}")
-        
-        conn.commit()
+def backfill_analytics():
+    """Recompute the shop analytics tables from every order and negotiation"""
+    with db.engine.begin() as conn:
+        orders = rebuild_analytics(conn)
+    print(f"Rebuilt shop analytics from {orders} orders")
 
 if __name__ == '__main__':
+    # python migrate.py [status | check-plans | backfill-analytics | <target version>]
+    command = sys.argv[1] if len(sys.argv) > 1 else None
     app = create_app()
     with app.app_context():
-        migrate()
\ No newline at end of file
+        if command == 'status':
+            status()
+        elif command == 'check-plans':
+            check_plans()
+        elif command == 'backfill-analytics':
+            backfill_analytics()
+        else:
+            migrate(command)
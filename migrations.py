@@ -0,0 +1,193 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+Migration = namedtuple('Migration', ['version', 'description', 'apply'])
+
+# Registered steps, in the order they are applied
+MIGRATIONS = []
+
+CREATE_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_migration (
+        version VARCHAR(32) PRIMARY KEY,
+        description VARCHAR(200) NOT NULL,
+        applied_at DATETIME NOT NULL
+    )
+'''
+RECORD_VERSION = text(
+    'INSERT INTO schema_migration (version, description, applied_at) '
+    'VALUES (:version, :description, :applied_at)'
+)
+
+# Composite indexes for the hot lookups; leading columns are the equality
+# filters, trailing ones the sort or the second filter
+PERFORMANCE_INDEXES = [
+    # Customer order history, newest first
+    ('ix_order_customer_created', 'order', ('customer_id', 'created_at')),
+    # Shop order queues by status
+    ('ix_order_shop_status_created', 'order', ('shop_id', 'status', 'created_at')),
+    # Active deliveries per courier (ETA, dispatch capacity)
+    ('ix_order_courier_status', 'order', ('delivery_person_id', 'status')),
+    # Confirmed orders still waiting for a courier
+    ('ix_order_status_courier', 'order', ('status', 'delivery_person_id')),
+    ('ix_order_item_order', 'order_item', ('order_id',)),
+    ('ix_product_shop_category', 'product', ('shop_id', 'category')),
+    ('ix_shop_owner', 'shop', ('owner_id',)),
+    ('ix_user_role_active', 'user', ('role', 'is_active')),
+    ('ix_negotiation_customer_created', 'negotiation', ('customer_id', 'created_at')),
+    ('ix_negotiation_product_status', 'negotiation', ('product_id', 'status')),
+    ('ix_delivery_negotiation_order', 'delivery_negotiation', ('order_id',)),
+    ('ix_cart_item_user_product', 'cart_item', ('user_id', 'product_id')),
+]
+
+def migration(version, description):
+    """Register a schema step; versions must sort in the order steps are applied"""
+    def register(apply):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, apply))
+        return apply
+    return register
+
+def _add_columns(conn, table, columns):
+    """Add whichever of (name, ddl) the table lacks"""
+    existing = {column['name'] for column in inspect(conn).get_columns(table)}
+    for name, ddl in columns:
+        if name not in existing:
+            conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}'))
+
+# Every step is safe to re-run: SQLite commits some DDL on its own, and
+# databases migrated before versions were recorded replay them all once
+
+@migration('0001', 'Add user.email_notifications')
+def _email_notifications(conn):
+    _add_columns(conn, 'user', [('email_notifications', 'BOOLEAN NOT NULL DEFAULT TRUE')])
+
+@migration('0002', 'Add product.category')
+def _product_category(conn):
+    _add_columns(conn, 'product', [('category', 'VARCHAR(50)')])
+
+@migration('0003', 'Add shop about and contact fields')
+def _shop_profile(conn):
+    _add_columns(conn, 'shop', [
+        ('about', 'TEXT'),
+        ('phone', 'VARCHAR(20)'),
+        ('email', 'VARCHAR(120)'),
+        ('website', 'VARCHAR(200)'),
+        ('business_hours', 'TEXT'),
+    ])
+
+@migration('0004', 'Add geo_cell columns for the spatial index')
+def _geo_cells(conn):
+    from .spatial_index import cell_key
+
+    for table in ('shop', 'user'):
+        _add_columns(conn, table, [('geo_cell', 'VARCHAR(32)')])
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_geo_cell ON "{table}" (geo_cell)'))
+
+        # Backfill cells for rows that already have coordinates
+        rows = conn.execute(text(
+            f'SELECT id, location_lat, location_lng FROM "{table}" '
+            'WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL AND geo_cell IS NULL'
+        )).fetchall()
+        if rows:
+            conn.execute(
+                text(f'UPDATE "{table}" SET geo_cell = :cell WHERE id = :id'),
+                [{'cell': cell_key(lat, lng), 'id': row_id} for row_id, lat, lng in rows]
+            )
+
+@migration('0005', 'Create courier_position_history')
+def _courier_history(conn):
+    conn.execute(text('''
+        CREATE TABLE IF NOT EXISTS courier_position_history (
+            id INTEGER PRIMARY KEY,
+            courier_id INTEGER NOT NULL REFERENCES "user" (id),
+            lat FLOAT NOT NULL,
+            lng FLOAT NOT NULL,
+            recorded_at DATETIME NOT NULL
+        )
+    '''))
+    conn.execute(text('''
+        CREATE INDEX IF NOT EXISTS ix_courier_position_history_courier_recorded
+        ON courier_position_history (courier_id, recorded_at)
+    '''))
+
+@migration('0006', 'Create email_outbox')
+def _email_outbox(conn):
+    from .mail_dispatch import ensure_outbox_table
+    ensure_outbox_table(conn)
+
+@migration('0007', 'Add user digest preferences and cursor')
+def _digest_columns(conn):
+    _add_columns(conn, 'user', [
+        ('notification_digest_minutes', 'INTEGER NOT NULL DEFAULT 0'),
+        ('last_digest_at', 'DATETIME'),
+    ])
+
+@migration('0008', 'Create notification_event')
+def _notification_events(conn):
+    from .notification_digest import ensure_notification_tables
+    ensure_notification_tables(conn)
+
+@migration('0009', 'Build the search suggestion index')
+def _search_index(conn):
+    from .search_index import rebuild_search_index
+    rebuild_search_index(conn)
+
+@migration('0010', 'Add composite indexes for hot foreign keys and filters')
+def _performance_indexes(conn):
+    for name, table, columns in PERFORMANCE_INDEXES:
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {name} ON "{table}" ({", ".join(columns)})'
+        ))
+
+@migration('0011', 'Add user.cart_version')
+def _cart_version(conn):
+    _add_columns(conn, 'user', [('cart_version', 'INTEGER NOT NULL DEFAULT 0')])
+    # Carts holding a product, for bumping their versions when it changes
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_cart_item_product ON cart_item (product_id)'))
+
+@migration('0012', 'Add shop analytics aggregate tables')
+def _analytics_tables(conn):
+    # Filled from existing orders by `python migrate.py backfill-analytics`, then kept current on every write
+    from .analytics import ensure_analytics_tables
+    ensure_analytics_tables(conn)
+
+@migration('0013', 'Add user.location_recorded_at')
+def _location_recorded_at(conn):
+    # Time of the newest GPS fix written, kept apart from updated_at so profile edits don't reorder fixes
+    _add_columns(conn, 'user', [('location_recorded_at', 'DATETIME')])
+
+def applied_versions(conn):
+    conn.execute(text(CREATE_VERSION_TABLE))
+    return {row[0] for row in conn.execute(text('SELECT version FROM schema_migration'))}
+
+def pending_migrations(conn):
+    applied = applied_versions(conn)
+    return [step for step in MIGRATIONS if step.version not in applied]
+
+def run_migrations(engine, target=None, log=None):
+    """
+    Apply every pending step up to `target` (inclusive), each in its own
+    transaction together with its schema_migration row. Returns the steps
+    applied. A step that fails stops the run and is retried next time.
+    """
+    with engine.begin() as conn:
+        pending = pending_migrations(conn)
+
+    applied = []
+    for step in pending:
+        if target is not None and step.version > target:
+            break
+        with engine.begin() as conn:
+            step.apply(conn)
+            conn.execute(RECORD_VERSION, {
+                'version': step.version,
+                'description': step.description,
+                'applied_at': datetime.utcnow()
+            })
+        applied.append(step)
+        if log:
+            log(f"Applied {step.version}: {step.description}")
+    return applied
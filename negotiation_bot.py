@@ -1,3 +1,7 @@
+from .negotiation_engine import (
+    ACCEPT, REJECT_BELOW_MIN, REJECT_DISCOUNT, REJECT_FULL_PRICE, classify_offer, delivery_terms, product_terms
+)
+
 class NegotiationBot:
     def __init__(self, product):
         self.product = product
@@ -8,9 +12,8 @@ class NegotiationBot:
         self.last_offer = None
         self.last_counter = None
         
-        # Strategy parameters
-        self.eagerness = 0.7  # How eager to make a deal (0-1)
-        self.flexibility = 0.6  # How flexible in counteroffer (0-1)
+        # Strategy parameters and accept/counter rules live in negotiation_engine
+        self.terms = product_terms(product)
         
     def evaluate_offer(self, offered_price):
         """
@@ -22,53 +25,20 @@ class NegotiationBot:
         """
         self.negotiation_rounds += 1
         self.last_offer = offered_price
+        code, counter_offer = classify_offer(self.terms, offered_price, self.negotiation_rounds)
         
-        # Quick rejects
-        if offered_price >= self.max_price:
+        if code == REJECT_FULL_PRICE:
             return 'reject', None, "Please use the regular price if you're willing to pay full price."
-        
-        if offered_price < self.min_price:
+        if code == REJECT_BELOW_MIN:
             return 'reject', None, f"I'm sorry, but {offered_price:.2f} is too low. The minimum price is {self.min_price:.2f}"
-            
-        # Calculate metrics
-        discount = (self.max_price - offered_price) / self.max_price
-        if discount > self.max_discount:
+        if code == REJECT_DISCOUNT:
             return 'reject', None, f"That's too low. The maximum discount we can offer is {self.max_discount*100:.0f}%"
-        
-        # Decision making
-        if self._should_accept(offered_price):
+        if code == ACCEPT:
             return 'accept', None, "Great! We have a deal!"
             
-        counter_offer = self._calculate_counter_offer()
         self.last_counter = counter_offer
         return 'counter', counter_offer, self._get_counter_message(counter_offer)
         
-    def _should_accept(self, offered_price):
-        """Determine if an offer should be accepted"""
-        # More likely to accept as rounds increase
-        round_factor = min(self.negotiation_rounds / 5, 1)
-        
-        # More likely to accept if close to target price
-        price_factor = (offered_price - self.min_price) / (self.max_price - self.min_price)
-        
-        # Combined acceptance probability
-        acceptance_prob = (round_factor + price_factor + self.eagerness) / 3
-        
-        return acceptance_prob > 0.8
-        
-    def _calculate_counter_offer(self):
-        """Calculate a counter-offer based on the negotiation state"""
-        if not self.last_offer:
-            # Initial counter offer
-            discount = self.max_discount * (1 - self.eagerness)
-            return self.max_price * (1 - discount)
-            
-        # Calculate middle ground, weighted by flexibility
-        target = self.last_offer + (self.max_price - self.last_offer) * self.flexibility
-        
-        # Ensure counter offer is within bounds
-        return max(min(target, self.max_price), self.min_price)
-        
     def _get_counter_message(self, counter_offer):
         """Generate a message for the counter offer"""
         discount = (self.max_price - counter_offer) / self.max_price * 100
@@ -107,7 +77,7 @@ class NegotiationBot:
             return None  # Indicates negotiation should end
             
         # Calculate counter-offer based on existing strategy
-        self.last_counter = self._calculate_counter_offer(user_offer)
+        self.last_counter = classify_offer(self.terms, user_offer, self.negotiation_rounds)[1]
         return self.last_counter
 
 def create_negotiation_session(product):
@@ -120,13 +90,19 @@ def create_negotiation_session(product):
 def process_negotiation(negotiation, offered_price):
     """
     Process a negotiation offer and return the result
+    The bot is restored from the negotiation row (and cached), and the
+    outcome is written back to it: rounds, offered/counter/final price and status.
     Returns: dict with keys:
     - accepted: bool
     - counter_price: float or None
     - message: str
     """
-    bot = create_negotiation_session(negotiation.product)
-    decision, counter_offer, message = bot.evaluate_offer(offered_price)
+    from .negotiation_session import negotiation_sessions
+    if not negotiation.product.is_negotiable():
+        raise ValueError("This product is not available for negotiation")
+    decision, counter_offer, message = negotiation_sessions.offer(
+        'product', negotiation.id, offered_price, negotiation
+    )
     
     return {
         'accepted': decision == 'accept',
@@ -137,79 +113,43 @@ def process_negotiation(negotiation, offered_price):
 class DeliveryNegotiationBot:
     def __init__(self, order):
         self.order = order
-        self.base_fee = 5.00  # Base delivery fee
-        self.min_fee = 3.00  # Minimum acceptable delivery fee
         self.max_discount = 0.40  # Maximum 40% discount
         self.negotiation_rounds = 0
         self.last_offer = None
         self.last_counter = None
         
-        # Strategy parameters adjusted for delivery
-        self.eagerness = 0.6  # More conservative for delivery fees
-        self.flexibility = 0.5  # Less flexible than product negotiations
-        
-        # Adjust min_fee based on distance if available
-        if order.delivery_lat and order.delivery_lng and order.shop.location_lat and order.shop.location_lng:
-            from ...utils.distance import calculate_distance
-            distance = calculate_distance(
-                order.shop.location_lat,
-                order.shop.location_lng,
-                order.delivery_lat,
-                order.delivery_lng
-            )
-            # Minimum fee increases with distance
-            self.min_fee = max(3.00, 2.00 + (distance * 0.50))  # $2 base + $0.50 per km
-            self.base_fee = max(5.00, 3.00 + (distance * 0.75))  # $3 base + $0.75 per km
+        # Base and minimum fee grow with distance; the quote is the one
+        # checkout charges, served from the shared quote cache
+        from ...utils.delivery_quote import quote_delivery
+        quote = quote_delivery(
+            getattr(order.shop, 'id', None),
+            order.shop.location_lat or None,
+            order.shop.location_lng or None,
+            order.delivery_lat or None,
+            order.delivery_lng or None
+        )
+        self.base_fee = quote.base_fee
+        self.min_fee = quote.min_fee
+        # More conservative and less flexible than product negotiations
+        self.terms = delivery_terms(self.base_fee, self.min_fee)
 
     def evaluate_offer(self, offered_fee):
         self.negotiation_rounds += 1
         self.last_offer = offered_fee
+        code, counter_offer = classify_offer(self.terms, offered_fee, self.negotiation_rounds)
         
-        # Quick rejects
-        if offered_fee >= self.base_fee:
+        if code == REJECT_FULL_PRICE:
             return 'reject', None, "Please use the standard delivery fee if you're willing to pay the full amount."
-        
-        if offered_fee < self.min_fee:
+        if code == REJECT_BELOW_MIN:
             return 'reject', None, f"I'm sorry, but ${offered_fee:.2f} is too low for the delivery distance. The minimum fee is ${self.min_fee:.2f}"
-            
-        # Calculate discount percentage
-        discount = (self.base_fee - offered_fee) / self.base_fee
-        if discount > self.max_discount:
+        if code == REJECT_DISCOUNT:
             return 'reject', None, f"That's too low. The maximum discount we can offer on delivery is {self.max_discount*100:.0f}%"
-        
-        # Decision making
-        if self._should_accept(offered_fee):
+        if code == ACCEPT:
             return 'accept', None, "Great! We'll deliver for that price!"
             
-        counter_offer = self._calculate_counter_offer()
         self.last_counter = counter_offer
         return 'counter', counter_offer, self._get_counter_message(counter_offer)
 
-    def _should_accept(self, offered_fee):
-        """Determine if an offer should be accepted"""
-        # More likely to accept as rounds increase
-        round_factor = min(self.negotiation_rounds / 4, 1)  # Fewer rounds for delivery negotiations
-        
-        # More likely to accept if close to target fee
-        price_factor = (offered_fee - self.min_fee) / (self.base_fee - self.min_fee)
-        
-        # Combined acceptance probability
-        acceptance_prob = (round_factor + price_factor + self.eagerness) / 3
-        return acceptance_prob > 0.85  # Higher threshold for acceptance
-
-    def _calculate_counter_offer(self):
-        """Calculate a counter-offer based on the negotiation state"""
-        if not self.last_offer:
-            # Initial counter offer
-            discount = self.max_discount * (1 - self.eagerness)
-            return self.base_fee * (1 - discount)
-            
-        # Calculate middle ground, weighted by flexibility
-        target = self.last_offer + (self.base_fee - self.last_offer) * self.flexibility
-        
-        # Ensure counter offer is within bounds
-        return max(min(target, self.base_fee), self.min_fee)
-
     def _get_counter_message(self, counter_offer):
         """Generate a message for the counter offer"""
         discount = (self.base_fee - counter_offer) / self.base_fee * 100
@@ -228,9 +168,11 @@ def create_delivery_negotiation_session(order):
     return DeliveryNegotiationBot(order)
 
 def process_delivery_negotiation(negotiation, offered_fee):
-    """Process a delivery fee negotiation offer and return the result"""
-    bot = create_delivery_negotiation_session(negotiation.order)
-    decision, counter_offer, message = bot.evaluate_offer(offered_fee)
+    """Process a delivery fee negotiation offer and return the result, persisting it like process_negotiation"""
+    from .negotiation_session import negotiation_sessions
+    decision, counter_offer, message = negotiation_sessions.offer(
+        'delivery', negotiation.id, offered_fee, negotiation
+    )
     
     return {
         'accepted': decision == 'accept',
@@ -0,0 +1,107 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Decision codes returned by classify_offer and evaluate_offers
+REJECT_FULL_PRICE = 0
+REJECT_BELOW_MIN = 1
+REJECT_DISCOUNT = 2
+ACCEPT = 3
+COUNTER = 4
+DECISIONS = np.array(['reject', 'reject', 'reject', 'accept', 'counter'])
+
+NegotiationTerms = namedtuple('NegotiationTerms', [
+    'price',                    # list price; offers at or above it are turned away
+    'min_price',
+    'max_discount_percentage',
+    'eagerness',                # how eager to make a deal (0-1)
+    'flexibility',              # how far a counter moves towards the list price (0-1)
+    'round_horizon',            # rounds after which the round factor stops growing
+    'accept_threshold',         # acceptance score needed to take an offer
+])
+NegotiationTerms.__new__.__defaults__ = (0.7, 0.6, 5, 0.8)
+
+def product_terms(product):
+    """Terms NegotiationBot applies to a product (or any object with the same fields)"""
+    return NegotiationTerms(product.price, product.min_price, product.max_discount_percentage)
+
+def delivery_terms(base_fee, min_fee):
+    """Terms DeliveryNegotiationBot applies to a delivery fee"""
+    return NegotiationTerms(base_fee, min_fee, 40.0, eagerness=0.6, flexibility=0.5,
+                            round_horizon=4, accept_threshold=0.85)
+
+def classify_offer(terms, offered_price, rounds=1):
+    """
+    Decide on one offer without any ORM objects.
+    `rounds` counts this offer (the first offer is round 1).
+    Returns (decision code, counter_offer); the code also tells the bots
+    which rule turned an offer away, for their reject messages.
+    """
+    max_price = terms.price
+    if offered_price >= max_price:
+        return REJECT_FULL_PRICE, None
+    if offered_price < terms.min_price:
+        return REJECT_BELOW_MIN, None
+    max_discount = terms.max_discount_percentage / 100
+    if (max_price - offered_price) / max_price > max_discount:
+        return REJECT_DISCOUNT, None
+
+    round_factor = min(rounds / terms.round_horizon, 1)
+    price_factor = (offered_price - terms.min_price) / (max_price - terms.min_price)
+    if (round_factor + price_factor + terms.eagerness) / 3 > terms.accept_threshold:
+        return ACCEPT, None
+
+    if not offered_price:
+        return COUNTER, max_price * (1 - max_discount * (1 - terms.eagerness))
+    target = offered_price + (max_price - offered_price) * terms.flexibility
+    return COUNTER, max(min(target, max_price), terms.min_price)
+
+def evaluate_offer(terms, offered_price, rounds=1):
+    """(decision, counter_offer) for one offer; the rules both negotiation bots apply"""
+    code, counter_offer = classify_offer(terms, offered_price, rounds)
+    return str(DECISIONS[code]), counter_offer
+
+def terms_table(terms):
+    """Stack a sequence of NegotiationTerms into one NegotiationTerms of float arrays"""
+    return NegotiationTerms(*(np.asarray(column, dtype=float) for column in zip(*terms)))
+
+def evaluate_offers(terms, offers, rounds=1):
+    """
+    Evaluate many offers at once.
+    `terms` is a NegotiationTerms of scalars or arrays (see terms_table);
+    `terms`, `offers` and `rounds` broadcast against each other, so
+    terms_table(...)[i] with offers[:, None] gives every product against
+    every offer. Returns (decision codes, counter prices), with NaN where
+    there is no counter. Matches evaluate_offer element for element.
+    """
+    offers = np.asarray(offers, dtype=float)
+    max_price = np.asarray(terms.price, dtype=float)
+    min_price = np.asarray(terms.min_price, dtype=float)
+    max_discount = np.asarray(terms.max_discount_percentage, dtype=float) / 100
+    eagerness = np.asarray(terms.eagerness, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        round_factor = np.minimum(np.asarray(rounds) / np.asarray(terms.round_horizon), 1)
+        price_factor = (offers - min_price) / (max_price - min_price)
+        accepted = (round_factor + price_factor + eagerness) / 3 > terms.accept_threshold
+
+        target = offers + (max_price - offers) * terms.flexibility
+        counter = np.maximum(np.minimum(target, max_price), min_price)
+        opening = max_price * (1 - max_discount * (1 - eagerness))
+        counter = np.where(offers == 0, opening, counter)
+
+        # Checked in reverse so the first matching rule wins, as in the scalar bot
+        decision = np.where(accepted, ACCEPT, COUNTER)
+        decision = np.where((max_price - offers) / max_price > max_discount, REJECT_DISCOUNT, decision)
+    decision = np.where(offers < min_price, REJECT_BELOW_MIN, decision)
+    decision = np.where(offers >= max_price, REJECT_FULL_PRICE, decision)
+    counter = np.where(decision == COUNTER, counter, np.nan)
+    return decision, counter
+
+def preview(terms, offers, rounds=1):
+    """Rows of (offer, decision, counter) for showing how a product would respond"""
+    decision, counter = evaluate_offers(terms, offers, rounds)
+    return [
+        (float(offer), str(DECISIONS[code]), None if np.isnan(price) else float(price))
+        for offer, code, price in zip(np.broadcast_to(offers, decision.shape), decision, counter)
+    ]
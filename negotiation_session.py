@@ -0,0 +1,253 @@
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from datetime import datetime
+from threading import Lock
+from types import SimpleNamespace
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..analytics import record_negotiations
+from .negotiation_bot import DeliveryNegotiationBot, NegotiationBot
+
+# Sessions kept per worker, and how long one is trusted before re-reading
+# its product and route; writes from other workers are caught by the
+# conditional UPDATE regardless
+SESSION_CACHE_SIZE = 1024
+SESSION_TTL = 900  # seconds
+MAX_ATTEMPTS = 2
+
+class _Kind:
+    """Where a negotiation kind is stored and how its bot is built"""
+    def __init__(self, table, offer, counter, final, load_sql, build_bot):
+        self.table = table
+        self.offer = offer
+        self.counter = counter
+        self.final = final
+        self.load_sql = text(load_sql)
+        self.build_bot = build_bot
+
+def _product_bot(row):
+    if row.min_price is None or row.max_discount_percentage is None:
+        raise ValueError("This product is not available for negotiation")
+    return NegotiationBot(SimpleNamespace(
+        price=row.price,
+        min_price=row.min_price,
+        max_discount_percentage=row.max_discount_percentage
+    ))
+
+def _delivery_bot(row):
+    return DeliveryNegotiationBot(SimpleNamespace(
+        delivery_lat=row.delivery_lat,
+        delivery_lng=row.delivery_lng,
+        shop=SimpleNamespace(id=row.shop_id, location_lat=row.shop_lat, location_lng=row.shop_lng)
+    ))
+
+KINDS = {
+    'product': _Kind(
+        'negotiation', 'offered_price', 'counter_price', 'final_price',
+        'SELECT n.rounds, n.status, n.offered_price AS offer, n.counter_price AS counter, '
+        'n.final_price AS final, n.product_id AS source_id, '
+        'p.price, p.min_price, p.max_discount_percentage '
+        'FROM negotiation n JOIN product p ON p.id = n.product_id WHERE n.id = :id',
+        _product_bot
+    ),
+    'delivery': _Kind(
+        'delivery_negotiation', 'offered_fee', 'counter_fee', 'final_fee',
+        'SELECT n.rounds, n.status, n.offered_fee AS offer, n.counter_fee AS counter, '
+        'n.final_fee AS final, n.order_id AS source_id, o.delivery_lat, o.delivery_lng, '
+        'o.shop_id, s.location_lat AS shop_lat, s.location_lng AS shop_lng '
+        'FROM delivery_negotiation n JOIN "order" o ON o.id = n.order_id '
+        'JOIN shop s ON s.id = o.shop_id WHERE n.id = :id',
+        _delivery_bot
+    ),
+}
+
+class NegotiationSession:
+    """A negotiation bot restored from its stored row, plus the values last persisted"""
+    __slots__ = ('kind', 'negotiation_id', 'source_id', 'bot', 'stored', 'loaded_at')
+
+    def __init__(self, kind, negotiation_id, row):
+        spec = KINDS[kind]
+        self.kind = kind
+        self.negotiation_id = negotiation_id
+        self.source_id = row.source_id
+        self.bot = spec.build_bot(row)
+        self.bot.negotiation_rounds = row.rounds or 0
+        self.bot.last_offer = row.offer
+        self.bot.last_counter = row.counter
+        self.stored = {
+            'rounds': row.rounds,
+            'status': row.status,
+            spec.offer: row.offer,
+            spec.counter: row.counter,
+            spec.final: row.final,
+        }
+        self.loaded_at = time.monotonic()
+
+    def apply(self, offered):
+        """Run one offer through the bot; returns (decision, counter, message, new stored values)"""
+        spec = KINDS[self.kind]
+        decision, counter, message = self.bot.evaluate_offer(offered)
+        values = dict(self.stored, rounds=self.bot.negotiation_rounds)
+        values[spec.offer] = offered
+        if decision == 'accept':
+            values['status'] = 'accepted'
+            values[spec.final] = offered
+        elif decision == 'counter':
+            values['status'] = 'counter_offer'
+            values[spec.counter] = counter
+        return decision, counter, message, values
+
+class NegotiationSessionManager:
+    """
+    Keeps active negotiation bots in an LRU/TTL cache keyed by
+    (kind, negotiation id), so an offer round costs one conditional UPDATE
+    of the fields that changed instead of rebuilding the bot from the
+    product/order graph. The UPDATE only applies if rounds and status are
+    still what this session last saw; otherwise the row changed elsewhere
+    and the session is reloaded before trying again.
+    """
+    def __init__(self, engine=None, size=SESSION_CACHE_SIZE, ttl=SESSION_TTL):
+        self._engine = engine
+        self.size = size
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = Lock()
+
+        # Counters for monitoring
+        self.hits = 0
+        self.misses = 0
+        self.conflicts = 0
+
+    def _transaction(self):
+        """
+        The request's db.session connection inside the app, so the write
+        commits or rolls back with the caller's changes; a transaction of
+        its own when the manager was given an engine.
+        """
+        if self._engine is None:
+            from ... import db
+            return nullcontext(db.session.connection())
+        return self._engine.begin()
+
+    def _cached(self, key):
+        with self._lock:
+            session = self._sessions.get(key)
+            if session and time.monotonic() - session.loaded_at < self.ttl:
+                self._sessions.move_to_end(key)
+                self.hits += 1
+                return session
+            self._sessions.pop(key, None)
+            self.misses += 1
+            return None
+
+    def _store(self, key, session):
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.size:
+                self._sessions.popitem(last=False)
+
+    def _load(self, conn, kind, negotiation_id):
+        row = conn.execute(KINDS[kind].load_sql, {'id': negotiation_id}).first()
+        if row is None:
+            raise LookupError(f"No {kind} negotiation with id {negotiation_id}")
+        return NegotiationSession(kind, negotiation_id, row)
+
+    def _write(self, conn, session, values):
+        changed = {field: value for field, value in values.items() if session.stored[field] != value}
+        assignments = ', '.join(f'{field} = :new_{field}' for field in changed)
+        params = {f'new_{field}': value for field, value in changed.items()}
+        params.update(
+            id=session.negotiation_id,
+            now=datetime.utcnow(),
+            rounds=session.stored['rounds'] or 0,
+            status=session.stored['status']
+        )
+        result = conn.execute(text(
+            f'UPDATE {KINDS[session.kind].table} SET {assignments}, updated_at = :now '
+            "WHERE id = :id AND COALESCE(rounds, 0) = :rounds AND COALESCE(status, '') = COALESCE(:status, '')"
+        ), params)
+        return changed if result.rowcount == 1 else None
+
+    def offer(self, kind, negotiation_id, offered, negotiation=None):
+        """
+        Evaluate an offer and persist the outcome.
+        Returns (decision, counter, message). When the caller's ORM object is
+        passed as `negotiation`, its attributes are refreshed without
+        marking them dirty.
+        """
+        key = (kind, negotiation_id)
+        for attempt in range(MAX_ATTEMPTS):
+            session = self._cached(key)
+            try:
+                with self._transaction() as conn:
+                    if session is None:
+                        session = self._load(conn, kind, negotiation_id)
+                    decision, counter, message, values = session.apply(offered)
+                    changed = self._write(conn, session, values)
+                    if changed is not None and kind == 'product' and 'status' in changed:
+                        _count_acceptance(conn, negotiation_id, session.stored['status'], changed['status'])
+            except Exception:
+                # The bot may have advanced past what was stored
+                self.invalidate(kind, negotiation_id)
+                raise
+            if changed is not None:
+                session.stored = values
+                self._store(key, session)
+                if negotiation is not None:
+                    _refresh(negotiation, changed)
+                return decision, counter, message
+            self.conflicts += 1
+            self.invalidate(kind, negotiation_id)
+        raise RuntimeError(f"{kind} negotiation {negotiation_id} kept changing while being processed")
+
+    def invalidate(self, kind, negotiation_id=None, source_id=None):
+        """Drop one session, or every session for a product/order"""
+        with self._lock:
+            if negotiation_id is not None:
+                self._sessions.pop((kind, negotiation_id), None)
+                return
+            for key in [key for key, session in self._sessions.items()
+                        if key[0] == kind and session.source_id == source_id]:
+                del self._sessions[key]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+def _count_acceptance(conn, negotiation_id, old, new):
+    # Raw writes skip the ORM hook that keeps the shop's negotiation stats
+    record_negotiations(conn, accepted=[negotiation_id] if new == 'accepted' else [],
+                        unaccepted=[negotiation_id] if old == 'accepted' else [])
+
+def _refresh(negotiation, changed):
+    mapped = inspect(negotiation, raiseerr=False) is not None
+    for field, value in changed.items():
+        if mapped:
+            set_committed_value(negotiation, field, value)
+        else:
+            setattr(negotiation, field, value)
+
+negotiation_sessions = NegotiationSessionManager()
+
+def _drop_product_sessions(mapper, connection, target):
+    negotiation_sessions.invalidate('product', source_id=target.id)
+
+def _drop_delivery_sessions(mapper, connection, target):
+    negotiation_sessions.invalidate('delivery', source_id=target.id)
+
+def init_negotiation_sessions(app):
+    """Forget cached bots when the product or order they were built from changes"""
+    from ...models.order import Order
+    from ...models.shop import Product
+
+    for model, drop in ((Product, _drop_product_sessions), (Order, _drop_delivery_sessions)):
+        if not event.contains(model, 'after_update', drop):
+            event.listen(model, 'after_update', drop)
+            event.listen(model, 'after_delete', drop)
@@ -0,0 +1,329 @@
+import atexit
+import os
+import socket
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Event, Thread, get_ident
+
+from flask_mail import Message
+from sqlalchemy import DateTime, text
+
+from .email_render import render_email
+from .mail_dispatch import dispatch_messages
+
+# A customer email goes out once an order has been quiet this long...
+COALESCE_WINDOW = 60  # seconds
+# ...or once its oldest pending change is this old, however busy the order is
+MAX_DELAY = 300  # seconds
+# How often the background thread looks for emails that are due
+FLUSH_INTERVAL = 15  # seconds
+# Events newer than this are left for the next digest, so a change whose
+# transaction is still committing is never skipped
+SETTLE_SECONDS = 5
+# Orders handled per customer flush
+CLAIM_SIZE = 200
+# Claims older than this belong to a worker that died mid-send
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Admin events are kept this long past the slowest admin's digest interval
+RETENTION_MARGIN = timedelta(hours=1)
+
+# Choices offered for user.notification_digest_minutes; 0 sends changes
+# as they happen, coalesced over COALESCE_WINDOW
+DIGEST_CHOICES = (0, 15, 60, 240, 1440)
+
+CREATE_EVENT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS notification_event (
+        id INTEGER PRIMARY KEY,
+        audience VARCHAR(16) NOT NULL,
+        order_id INTEGER NOT NULL,
+        old_status VARCHAR(20),
+        new_status VARCHAR(20),
+        action VARCHAR(100),
+        claimed_by VARCHAR(64),
+        claimed_at DATETIME,
+        created_at DATETIME NOT NULL
+    )
+'''
+CREATE_EVENT_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS ix_notification_event_audience_order ON notification_event (audience, order_id)',
+    'CREATE INDEX IF NOT EXISTS ix_notification_event_audience_created ON notification_event (audience, created_at)',
+]
+
+INSERT_EVENT = text(
+    'INSERT INTO notification_event (audience, order_id, old_status, new_status, action, created_at) '
+    'VALUES (:audience, :order_id, :old_status, :new_status, :action, :created_at)'
+)
+
+def ensure_notification_tables(conn):
+    conn.execute(text(CREATE_EVENT_TABLE))
+    for statement in CREATE_EVENT_INDEXES:
+        conn.execute(text(statement))
+
+def set_digest_minutes(conn, user_id, minutes):
+    """Save an admin's digest interval; raises ValueError unless it is one of DIGEST_CHOICES"""
+    try:
+        minutes = int(minutes)
+    except (TypeError, ValueError):
+        raise ValueError("Digest interval must be a number of minutes") from None
+    if minutes not in DIGEST_CHOICES:
+        raise ValueError(f"Digest interval must be one of {', '.join(map(str, DIGEST_CHOICES))} minutes")
+    conn.execute(text('UPDATE "user" SET notification_digest_minutes = :minutes WHERE id = :id'),
+                 {'minutes': minutes, 'id': user_id})
+    return minutes
+
+def _load_orders(order_ids):
+    from ..models.order import Order
+    from .loading import loading_options
+
+    query = Order.query.options(*loading_options(Order, 'order_email')).filter(Order.id.in_(order_ids))
+    return {order.id: order for order in query}
+
+def summarize_changes(changes):
+    """Collapse a run of status changes into one: first old status, last new status"""
+    actions = []
+    for change in changes:
+        if change['action'] and change['action'] not in actions:
+            actions.append(change['action'])
+    return {
+        'old': changes[0]['old'],
+        'new': changes[-1]['new'],
+        'action': ', '.join(actions),
+        'count': len(changes)
+    }
+
+class NotificationDigester:
+    """
+    Collapses order status emails.
+    Status changes are recorded in the notification_event table instead of
+    being mailed straight away. A customer gets one email per order once the
+    order has been quiet for `window` seconds (or at most `max_delay` after
+    the first change). Admins get one digest per interval listing every
+    order that changed, where the interval is their own
+    notification_digest_minutes (0 meaning every `window` seconds).
+    Anyone with email_notifications switched off gets nothing. Claims and
+    digest cursors live in the database, so any number of workers can run
+    the flusher.
+    """
+    def __init__(self, app, engine, window=COALESCE_WINDOW, max_delay=MAX_DELAY,
+                 flush_interval=FLUSH_INTERVAL, order_loader=_load_orders):
+        self.app = app
+        self.engine = engine
+        self.window = timedelta(seconds=window)
+        self.max_delay = timedelta(seconds=max(max_delay, window))
+        self.flush_interval = flush_interval
+        self.order_loader = order_loader
+        self._stop = Event()
+        self._thread = None
+
+        # Counters for monitoring
+        self.changes_recorded = 0
+        self.emails_sent = 0
+
+    def record(self, audience, order_id, change=None, new_status=None):
+        change = change or {}
+        with self.engine.begin() as conn:
+            conn.execute(INSERT_EVENT, {
+                'audience': audience,
+                'order_id': order_id,
+                'old_status': change.get('old'),
+                'new_status': change.get('new', new_status),
+                'action': change.get('action'),
+                'created_at': datetime.utcnow()
+            })
+        self.changes_recorded += 1
+
+    def flush(self, now=None):
+        """Send whatever is due; returns the number of emails handed to the mail dispatcher"""
+        now = now or datetime.utcnow()
+        with self.app.app_context():
+            return self._flush_customers(now) + self._flush_admins(now)
+
+    def _render_context(self):
+        # Email templates build absolute links, which need a request context
+        return self.app.test_request_context(base_url=self.app.config.get('EMAIL_BASE_URL'))
+
+    def _claim_customer_events(self, now):
+        token = f'{socket.gethostname()}:{os.getpid()}:{get_ident()}'[:64]
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'UPDATE notification_event SET claimed_by = :token, claimed_at = :now '
+                "WHERE audience = 'customer' AND (claimed_by IS NULL OR claimed_at < :stale) "
+                'AND order_id IN (SELECT order_id FROM notification_event '
+                "WHERE audience = 'customer' GROUP BY order_id "
+                'HAVING MAX(created_at) <= :quiet OR MIN(created_at) <= :overdue LIMIT :limit)'
+            ), {
+                'token': token, 'now': now, 'stale': now - CLAIM_TIMEOUT,
+                'quiet': now - self.window, 'overdue': now - self.max_delay, 'limit': CLAIM_SIZE
+            })
+            rows = conn.execute(text(
+                'SELECT id, order_id, old_status, new_status, action FROM notification_event '
+                'WHERE claimed_by = :token ORDER BY id'
+            ), {'token': token}).fetchall()
+        return token, rows
+
+    def _flush_customers(self, now):
+        token, rows = self._claim_customer_events(now)
+        if not rows:
+            return 0
+
+        pending = OrderedDict()
+        for row in rows:
+            pending.setdefault(row.order_id, []).append(
+                {'old': row.old_status, 'new': row.new_status, 'action': row.action}
+            )
+        orders = self.order_loader(list(pending))
+
+        messages = []
+        with self._render_context():
+            for order_id, changes in pending.items():
+                order = orders.get(order_id)
+                if order is None or order.customer.email_notifications is False:
+                    continue
+                msg = Message(
+                    f'Order #{order.id} Status Update',
+                    recipients=[order.customer.email]
+                )
+                msg.html = render_email(
+                    'email/order_status_update.html',
+                    order=order,
+                    changes=changes
+                )
+                messages.append(msg)
+            if messages:
+                dispatch_messages(messages)
+
+        with self.engine.begin() as conn:
+            conn.execute(text('DELETE FROM notification_event WHERE claimed_by = :token'), {'token': token})
+        self.emails_sent += len(messages)
+        return len(messages)
+
+    def _interval(self, admin):
+        minutes = admin.notification_digest_minutes or 0
+        return timedelta(minutes=minutes) if minutes > 0 else self.window
+
+    def _take_digest(self, conn, admin, end):
+        """Advance the admin's digest cursor; False if another worker got there first"""
+        if admin.last_digest_at is None:
+            result = conn.execute(text(
+                'UPDATE "user" SET last_digest_at = :end WHERE id = :id AND last_digest_at IS NULL'
+            ), {'end': end, 'id': admin.id})
+        else:
+            result = conn.execute(text(
+                'UPDATE "user" SET last_digest_at = :end WHERE id = :id AND last_digest_at = :since'
+            ), {'end': end, 'id': admin.id, 'since': admin.last_digest_at})
+        return result.rowcount == 1
+
+    def _flush_admins(self, now):
+        end = now - timedelta(seconds=SETTLE_SECONDS)
+        with self.engine.connect() as conn:
+            admins = conn.execute(text(
+                'SELECT id, username, email, notification_digest_minutes, last_digest_at FROM "user" '
+                "WHERE role = 'admin' AND (email_notifications IS NULL OR email_notifications = :on)"
+            ).columns(last_digest_at=DateTime), {'on': True}).fetchall()
+
+        sent = 0
+        longest = self.max_delay
+        for admin in admins:
+            interval = self._interval(admin)
+            longest = max(longest, interval)
+            since = admin.last_digest_at
+            if since is not None and end - since < interval:
+                continue
+
+            with self.engine.begin() as conn:
+                if not self._take_digest(conn, admin, end):
+                    continue
+                events = conn.execute(text(
+                    'SELECT order_id, old_status, new_status, action, created_at FROM notification_event '
+                    "WHERE audience = 'admin' AND created_at > :since AND created_at <= :end ORDER BY id"
+                ), {'since': since or datetime.min, 'end': end}).fetchall()
+            if events:
+                # An admin's first digest covers every change still retained
+                self._send_digest(admin, events, since or end - interval, end)
+                sent += 1
+
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                "DELETE FROM notification_event WHERE audience = 'admin' AND created_at < :cutoff"
+            ), {'cutoff': now - longest - RETENTION_MARGIN})
+        self.emails_sent += sent
+        return sent
+
+    def _send_digest(self, admin, events, since, end):
+        changes = OrderedDict()
+        for event in events:
+            changes.setdefault(event.order_id, []).append(
+                {'old': event.old_status, 'new': event.new_status, 'action': event.action}
+            )
+        orders = self.order_loader(list(changes))
+
+        with self._render_context():
+            if len(changes) == 1:
+                # A single order reads better in the regular notification
+                order_id, order_changes = next(iter(changes.items()))
+                order = orders.get(order_id)
+                if order is None:
+                    return
+                subject = f'Order #{order.id} Status Update'
+                html = render_email(
+                    'email/admin_order_notification.html',
+                    order=order,
+                    change=summarize_changes(order_changes)
+                )
+            else:
+                summary = [
+                    (orders[order_id], summarize_changes(order_changes))
+                    for order_id, order_changes in changes.items() if order_id in orders
+                ]
+                subject = f'Order Digest - {len(summary)} orders updated'
+                html = render_email(
+                    'email/admin_order_digest.html',
+                    recipient=admin,
+                    summary=summary,
+                    period_start=since,
+                    period_end=end
+                )
+            dispatch_messages([Message(subject, recipients=[admin.email], html=html)])
+
+    def start(self):
+        """Flush periodically on a background thread"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name='notification-digest', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Pending changes are in the database; whichever worker runs next sends them
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                self.app.logger.error(f"Error sending notification digests: {e}")
+
+def init_notification_digest(app):
+    """Start coalescing status emails; a window of 0 keeps sending them immediately"""
+    window = app.config.get('NOTIFICATION_COALESCE_WINDOW', COALESCE_WINDOW)
+    if not window:
+        return None
+
+    from .. import db
+    with app.app_context():
+        engine = db.engine
+    digester = NotificationDigester(
+        app,
+        engine,
+        window=window,
+        max_delay=app.config.get('NOTIFICATION_MAX_DELAY', MAX_DELAY),
+        flush_interval=app.config.get('NOTIFICATION_FLUSH_INTERVAL', FLUSH_INTERVAL)
+    )
+    digester.start()
+    atexit.register(digester.stop)
+    app.extensions['notification_digester'] = digester
+    return digester
@@ -0,0 +1,21 @@
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from ecommerce import db
+from ecommerce.utils.notification_digest import set_digest_minutes
+
+notification_settings_bp = Blueprint('notification_settings', __name__)
+
+@notification_settings_bp.route('/api/settings/notification-digest', methods=['POST'])
+@login_required
+def update_notification_digest():
+    """Set how often an admin gets order update digests (JSON or form field `minutes`)"""
+    if current_user.role != 'admin':
+        return jsonify({'status': 'error', 'message': 'Only admins receive order digests'}), 403
+
+    data = request.get_json(silent=True) or request.form
+    try:
+        minutes = set_digest_minutes(db.session.connection(), current_user.id, data.get('minutes'))
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    db.session.commit()
+    return jsonify({'status': 'success', 'minutes': minutes})
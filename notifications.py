@@ -1,37 +1,53 @@
 from flask import current_app, render_template
 from flask_mail import Message
 from datetime import datetime, timedelta
-from threading import Thread
 from .. import mail, db
 from ..models.user import User
+from ..models.order import Order
+from sqlalchemy import or_
+from .distance import calculate_distance
+from .spatial_index import nearby_couriers
+from .mail_dispatch import dispatch_messages
+from .email_render import render_email, render_fanout
 
-def send_async_email(app, msg):
-    with app.app_context():
-        mail.send(msg)
+def _coalesce(audience, order, change=None):
+    """Hand a status change to the digester; False when emails go out immediately"""
+    digester = current_app.extensions.get('notification_digester')
+    if digester is None:
+        return False
+    digester.record(audience, order.id, change, new_status=order.status)
+    return True
 
 def send_email(subject, recipients, template, **kwargs):
     """
     Send an email using a template and keyword arguments.
+    Delivery happens on the mail dispatcher's bounded worker pool.
     """
-    app = current_app._get_current_object()
     msg = Message(
         subject=subject,
         recipients=recipients,
-        html=render_template(template, **kwargs)
+        html=render_email(template, **kwargs)
     )
-    Thread(target=send_async_email, args=(app, msg)).start()
+    dispatch_messages([msg])
 
-def notify_customer_order_status(order):
-    """Send order status update notification to customer"""
+def notify_customer_order_status(order, change=None):
+    """
+    Send order status update notification to customer.
+    With coalescing on, changes to one order within the window become one email.
+    """
+    if _coalesce('customer', order, change):
+        return
+    if order.customer.email_notifications is False:
+        return
     msg = Message(
         f'Order #{order.id} Status Update',
         recipients=[order.customer.email]
     )
-    msg.html = render_template(
+    msg.html = render_email(
         'email/order_status_update.html',
         order=order
     )
-    mail.send(msg)
+    dispatch_messages([msg])
 
 def notify_shop_owner_new_order(order):
     """Notify shop owner about new orders"""
@@ -39,57 +55,76 @@ def notify_shop_owner_new_order(order):
         f'New Order #{order.id} Received',
         recipients=[order.shop.owner.email]
     )
-    msg.html = render_template(
+    msg.html = render_email(
         'email/new_order_notification.html',
         order=order
     )
-    mail.send(msg)
+    dispatch_messages([msg])
 
 def notify_admin_order_status(order, change=None):
-    """Notify admin about order status changes"""
-    admins = User.query.filter_by(role='admin').all()
+    """
+    Notify admin about order status changes.
+    With coalescing on, admins get periodic digests instead (see notification_digest).
+    """
+    if _coalesce('admin', order, change):
+        return
+    admins = User.query.filter_by(role='admin').filter(
+        User.email_notifications.isnot(False)
+    ).all()
+    if not admins:
+        return
+    # The admin email has no per-recipient content; render it once
+    html = render_email(
+        'email/admin_order_notification.html',
+        order=order,
+        change=change
+    )
+    messages = []
     for admin in admins:
         msg = Message(
             f'Order #{order.id} Status Update',
             recipients=[admin.email]
         )
-        msg.html = render_template(
-            'email/admin_order_notification.html',
-            order=order,
-            change=change
-        )
-        mail.send(msg)
+        msg.html = html
+        messages.append(msg)
+    dispatch_messages(messages)
 
 def notify_delivery_person_new_order(order):
     """Notify available delivery people about new deliverable orders"""
-    delivery_persons = User.query.filter_by(
+    query = User.query.filter_by(
         role='delivery',
         is_active=True
-    ).all()
+    )
+
+    if order.delivery_lat and order.delivery_lng:
+        # Only notify if within reasonable distance (10km), looked up in the
+        # spatial index instead of scanning every courier. People without a
+        # known location are still notified.
+        nearby_ids = [user_id for user_id, _ in nearby_couriers(
+            order.delivery_lat,
+            order.delivery_lng,
+            10
+        )]
+        query = query.filter(or_(
+            User.id.in_(nearby_ids),
+            User.location_lat.is_(None),
+            User.location_lng.is_(None)
+        ))
+    delivery_persons = query.all()
     
+    messages = []
     for person in delivery_persons:
-        # Only notify if within reasonable distance
-        if person.location_lat and person.location_lng:
-            distance = calculate_distance(
-                person.location_lat,
-                person.location_lng,
-                order.delivery_lat,
-                order.delivery_lng
-            )
-            # Skip if more than 10km away
-            if distance > 10:
-                continue
-        
         msg = Message(
             'New Delivery Order Available',
             recipients=[person.email]
         )
-        msg.html = render_template(
+        msg.html = render_email(
             'email/new_order_available.html',
             order=order,
             delivery_person=person
         )
-        mail.send(msg)
+        messages.append(msg)
+    dispatch_messages(messages)
 
 def notify_delivery_assignment(order, delivery_person):
     """Notify delivery person about being assigned to an order"""
@@ -97,28 +132,32 @@ def notify_delivery_assignment(order, delivery_person):
         f'New Delivery Assignment - Order #{order.id}',
         recipients=[delivery_person.email]
     )
-    msg.html = render_template(
+    msg.html = render_email(
         'email/delivery_assignment.html',
         order=order,
         delivery_person=delivery_person
     )
-    mail.send(msg)
+    dispatch_messages([msg])
 
 def notify_all_delivery_persons(message):
     """Send a notification message to all delivery persons"""
     delivery_persons = User.query.filter_by(role='delivery', is_active=True).all()
     
-    for person in delivery_persons:
+    # Shared body rendered once; only the greeting differs per person
+    bodies = render_fanout(
+        'email/general_notification.html',
+        delivery_persons,
+        message=message
+    )
+    messages = []
+    for person, html in zip(delivery_persons, bodies):
         msg = Message(
             'Delivery Service Update',
             recipients=[person.email]
         )
-        msg.html = render_template(
-            'email/general_notification.html',
-            message=message,
-            recipient=person
-        )
-        mail.send(msg)
+        msg.html = html
+        messages.append(msg)
+    dispatch_messages(messages)
 
 def estimate_delivery_time(order):
     """Estimate delivery time in minutes based on distance and conditions"""
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, make_response, request, session
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+CACHE_SIZE = 512  # pages and fragments kept per worker without Redis
+CACHE_TTL = 300  # seconds; bounds staleness from writes that skip the ORM
+REDIS_PREFIX = 'quickshop:page:'
+REDIS_TIMEOUT = 0.25  # seconds; a slow Redis falls back to rendering
+
+# Scopes touched by a session's flushes, invalidated once it commits
+PENDING_SCOPES = 'page_cache_scopes'
+
+class LocalBackend:
+    """In-process LRU, used without Redis (tests, single-worker development)"""
+    errors = ()
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def versions(self, scopes):
+        with self._lock:
+            return [self._versions.get(scope, 0) for scope in scopes]
+
+    def bump(self, scopes):
+        with self._lock:
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+class RedisBackend:
+    """
+    Shared by every worker. Scope versions are Redis counters, so a write
+    in one worker invalidates the pages all of them cached.
+    """
+    def __init__(self, client, prefix=REDIS_PREFIX):
+        import redis
+
+        self.errors = (redis.RedisError,)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl)
+
+    def versions(self, scopes):
+        if not scopes:
+            return []
+        return [int(version or 0) for version in self.client.mget([self.prefix + 'v:' + scope for scope in scopes])]
+
+    def bump(self, scopes):
+        pipe = self.client.pipeline(transaction=False)
+        for scope in scopes:
+            pipe.incr(self.prefix + 'v:' + scope)
+        pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+class PageCache:
+    """
+    Rendered pages and fragments keyed by name and the current version of
+    each scope they depend on ('shops', 'shop:<id>'). Invalidating a scope
+    bumps its version, so stale entries are never read again and age out.
+    An unreachable backend counts as a miss.
+    """
+    def __init__(self, backend=None, ttl=CACHE_TTL):
+        self.backend = backend or LocalBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def configure(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    def lookup(self, name, scopes):
+        """(key, entry); entry is None on a miss and key is None if the backend failed"""
+        try:
+            versions = self.backend.versions(scopes)
+            key = f"{name}@{'.'.join(map(str, versions))}"
+            entry = self.backend.get(key)
+        except self.backend.errors:
+            self.errors += 1
+            return None, None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, entry
+
+    def store(self, key, entry):
+        if key is None:
+            return
+        try:
+            self.backend.set(key, entry, self.ttl)
+        except self.backend.errors:
+            self.errors += 1
+
+    def invalidate(self, *scopes):
+        try:
+            self.backend.bump(scopes)
+        except self.backend.errors:
+            self.errors += 1
+
+    def clear(self):
+        self.backend.clear()
+
+page_cache = PageCache()
+
+def shop_scope(shop_id):
+    return f'shop:{shop_id}'
+
+def _enabled():
+    return current_app.config.get('PAGE_CACHE_ENABLED', True)
+
+def _shared_page():
+    # The navbar shows the signed-in user's cart, and flashed messages are one-off
+    return request.method == 'GET' and '_user_id' not in session and '_flashes' not in session
+
+def cached_page(*scopes):
+    """
+    Cache a view's page for anonymous visitors until one of its scopes is
+    invalidated. Scopes are formatted with the view arguments, e.g.
+    cached_page('shops', 'shop:{shop_id}'). Every 200 response carries an
+    ETag, cached ones also a Last-Modified, and matching revalidations get 304.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not _enabled():
+                return view(**kwargs)
+
+            key = entry = None
+            if _shared_page():
+                key, entry = page_cache.lookup('page:' + request.full_path,
+                                               [scope.format(**kwargs) for scope in scopes])
+            if entry is None:
+                response = make_response(view(**kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = {
+                    'body': response.get_data(as_text=True),
+                    'content_type': response.content_type,
+                    'etag': hashlib.sha1(response.get_data()).hexdigest(),
+                    'modified': int(time.time()),
+                }
+                page_cache.store(key, entry)
+            else:
+                response = current_app.response_class(entry['body'], content_type=entry['content_type'])
+
+            response.set_etag(entry['etag'])
+            if key is not None:
+                response.last_modified = entry['modified']
+            response.cache_control.no_cache = True  # always revalidate, which is cheap
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def cache_fragment(name, *scopes, caller=None):
+    """
+    Jinja call block rendered once per scope version, for the shared parts
+    of pages that also show per-user content:
+    {% call cache_fragment('shop-products:%d' % shop.id, 'shop:%d' % shop.id) %}...{% endcall %}
+    """
+    if not _enabled():
+        return caller()
+    key, entry = page_cache.lookup('fragment:' + name, scopes)
+    if entry is None:
+        entry = {'body': str(caller())}
+        page_cache.store(key, entry)
+    return Markup(entry['body'])
+
+def _mark(target, *scopes):
+    session = object_session(target)
+    if session is None:
+        page_cache.invalidate(*scopes)
+    else:
+        session.info.setdefault(PENDING_SCOPES, set()).update(scopes)
+
+def _shop_changed(mapper, connection, target):
+    _mark(target, 'shops', shop_scope(target.id))
+
+def _product_changed(mapper, connection, target):
+    _mark(target, shop_scope(target.shop_id))
+
+def _invalidate_committed(session):
+    # After the commit, so no request can re-cache the old rows in between
+    scopes = session.info.pop(PENDING_SCOPES, None)
+    if scopes:
+        page_cache.invalidate(*sorted(scopes))
+
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_SCOPES, None)
+
+def _listen(shop_model, product_model):
+    for model, changed in ((shop_model, _shop_changed), (product_model, _product_changed)):
+        if not event.contains(model, 'after_insert', changed):
+            event.listen(model, 'after_insert', changed)
+            event.listen(model, 'after_update', changed)
+            event.listen(model, 'after_delete', changed)
+    if not event.contains(Session, 'after_commit', _invalidate_committed):
+        event.listen(Session, 'after_commit', _invalidate_committed)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
+
+def init_page_cache(app):
+    """Back the page cache with Redis when configured and invalidate it on shop and product writes"""
+    from ..models.shop import Product, Shop
+
+    url = app.config.get('CACHE_REDIS_URL')
+    if url:
+        import redis
+
+        client = redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+        backend = RedisBackend(client)
+    else:
+        if app.config.get('PAGE_CACHE_ENABLED', True) and not (app.debug or app.testing):
+            app.logger.warning("Page cache is in-process; run a single worker or set CACHE_REDIS_URL")
+        backend = LocalBackend(app.config.get('PAGE_CACHE_SIZE', CACHE_SIZE))
+    page_cache.configure(backend, app.config.get('PAGE_CACHE_TTL', CACHE_TTL))
+
+    _listen(Shop, Product)
+    app.jinja_env.globals['cache_fragment'] = cache_fragment
+    app.extensions['page_cache'] = page_cache
+    return page_cache
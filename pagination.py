@@ -0,0 +1,207 @@
+import base64
+import json
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+from sqlalchemy import event, inspect, literal, text, tuple_
+
+PER_PAGE = 20
+# Cached list totals; a count may lag writes in other workers by the TTL
+COUNT_CACHE_SIZE = 4096
+COUNT_CACHE_TTL = 60  # seconds
+
+# Columns an order list can be counted by, and the statuses shown as tabs
+ORDER_OWNERS = ('customer_id', 'shop_id', 'delivery_person_id')
+ORDER_STATUSES = ('pending', 'confirmed', 'delivering', 'completed', 'cancelled')
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+def encode_cursor(values, before=False):
+    """Opaque URL-safe token for the sort key of a row; `before` pages backwards from it"""
+    payload = json.dumps({'k': [_encode_value(value) for value in values], 'b': before},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(sort key, before) from a token; (None, False) for a missing or mangled one"""
+    if not cursor:
+        return None, False
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return tuple(_decode_value(value) for value in payload['k']), bool(payload.get('b'))
+    except (ValueError, TypeError, KeyError):
+        return None, False
+
+class KeysetPage:
+    """
+    One page of a keyset-paginated list, passed to templates as `pagination`.
+    Links carry next_cursor / prev_cursor instead of page numbers, so every
+    page costs one indexed range read however deep it is. `total` is
+    whatever count the caller supplied (often cached) and may be None.
+    """
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+def _cursors(rows, key, values, before, more):
+    """Cursors for a fetched page; rows are in display order"""
+    if before:
+        has_next, has_prev = True, more
+    else:
+        has_next, has_prev = more, values is not None
+    next_cursor = encode_cursor(key(rows[-1])) if has_next and rows else None
+    prev_cursor = encode_cursor(key(rows[0]), before=True) if has_prev and rows else None
+    return next_cursor, prev_cursor
+
+def keyset_paginate(query, columns, cursor=None, per_page=PER_PAGE, descending=True, total=None):
+    """
+    Page an ORM query by `columns` (e.g. Order.created_at, Order.id), which
+    together must be unique and non-null. The query's own ORDER BY is
+    replaced. Reads per_page + 1 rows from the cursor position instead of
+    skipping OFFSET rows.
+    """
+    values, before = decode_cursor(cursor)
+    if values is not None and len(values) != len(columns):
+        values, before = None, False
+    scan_descending = descending != before
+
+    if values is not None:
+        # Typed binds, so datetimes compare in the column's stored format
+        position = tuple_(*(literal(value, column.type) for value, column in zip(values, columns)))
+        key_columns = tuple_(*columns)
+        query = query.filter(key_columns < position if scan_descending else key_columns > position)
+    ordering = [column.desc() if scan_descending else column.asc() for column in columns]
+    rows = query.order_by(None).order_by(*ordering).limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before:
+        rows.reverse()
+
+    def key(row):
+        return tuple(getattr(row, column.key) for column in columns)
+
+    next_cursor, prev_cursor = _cursors(rows, key, values, before, more)
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor, total)
+
+def keyset_slice(rows, key, cursor=None, per_page=PER_PAGE):
+    """
+    Keyset page over a list already sorted ascending by key(row), such as
+    nearby shops as (distance, id). Binary search finds the cursor, so deep
+    pages cost the same as the first.
+    """
+    values, before = decode_cursor(cursor)
+    keys = [key(row) for row in rows]
+    if values is None:
+        start, end = 0, per_page
+    elif before:
+        end = bisect_left(keys, values)
+        start = max(end - per_page, 0)
+    else:
+        start = bisect_right(keys, values)
+        end = start + per_page
+
+    page = rows[start:end]
+    more = start > 0 if before else end < len(rows)
+    next_cursor, prev_cursor = _cursors(page, key, values, before, more)
+    return KeysetPage(page, per_page, next_cursor, prev_cursor, total=len(rows))
+
+class CountCache:
+    """LRU/TTL cache of list totals, dropped early by owner when rows change locally"""
+    def __init__(self, size=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+count_cache = CountCache()
+
+def order_status_counts(conn, owner, owner_id, cache=count_cache):
+    """
+    {'all': n, status: n, ...} for one customer's, shop's or courier's
+    orders, from one GROUP BY over the owner's index; serves both the
+    status tabs and the pagination total.
+    """
+    if owner not in ORDER_OWNERS:
+        raise ValueError(f"Cannot count orders by {owner}")
+    key = ('order', owner, owner_id)
+    counts = cache.get(key)
+    if counts is None:
+        rows = conn.execute(text(
+            f'SELECT status, COUNT(*) FROM "order" WHERE {owner} = :owner_id GROUP BY status'
+        ), {'owner_id': owner_id})
+        counts = dict.fromkeys(ORDER_STATUSES, 0)
+        counts.update(rows.fetchall())
+        counts['all'] = sum(counts.values())
+        cache.put(key, counts)
+    return counts
+
+def _drop_order_counts(mapper, connection, target):
+    for owner in ORDER_OWNERS:
+        count_cache.invalidate(('order', owner, getattr(target, owner)))
+    # A reassigned order also leaves its previous courier's list
+    for courier_id in inspect(target).attrs.delivery_person_id.history.deleted:
+        count_cache.invalidate(('order', 'delivery_person_id', courier_id))
+
+def init_pagination(app):
+    """Recount order lists when orders are placed, change hands or change status"""
+    from ..models.order import Order
+
+    if not event.contains(Order, 'after_insert', _drop_order_counts):
+        for name in ('after_insert', 'after_update', 'after_delete'):
+            event.listen(Order, name, _drop_order_counts)
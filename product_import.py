@@ -0,0 +1,259 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, Text, insert
+
+# Rows inserted per statement, and images handed to the pool at a time
+CHUNK_SIZE = 1000
+# Errors kept for the report; the count covers all of them
+MAX_REPORTED_ERRORS = 100
+
+# Image variants, longest side in pixels
+IMAGE_MAX_SIZE = 1200
+THUMBNAIL_SIZE = 300
+WEBP_QUALITY = 82
+JPEG_QUALITY = 85
+DEFAULT_MAX_DISCOUNT = 20.0
+
+# The product columns the import writes; a full Table so inserts can return ids in row order
+product_table = Table(
+    'product', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('description', Text),
+    Column('price', Float),
+    Column('stock', Integer),
+    Column('shop_id', Integer),
+    Column('image_url', String(255)),
+    Column('category', String(50)),
+    Column('created_at', DateTime),
+    Column('min_price', Float),
+    Column('max_discount_percentage', Float),
+)
+
+RowError = namedtuple('RowError', ['line', 'message'])
+
+class ImportReport:
+    def __init__(self):
+        self.inserted = 0
+        self.images = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(line, message))
+
+def read_rows(stream, fmt='csv'):
+    """Yield (line number, raw dict) from a binary or text stream, one row at a time"""
+    if isinstance(stream, (io.RawIOBase, io.BufferedIOBase)) or 'b' in getattr(stream, 'mode', ''):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line, text in enumerate(stream, 1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError:
+                    yield line, None
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+def _number(row, name, cast, required=False, minimum=None, maximum=None):
+    value = row.get(name)
+    if value in (None, ''):
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    try:
+        value = cast(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number") from None
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise ValueError(f"{name} is out of range")
+    return value
+
+def clean_row(row):
+    """Validate one raw row as add_product does; returns the product fields or raises ValueError"""
+    if not isinstance(row, dict):
+        raise ValueError("Row is not an object")
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > 100:
+        raise ValueError("name is longer than 100 characters")
+    category = (row.get('category') or '').strip() or None
+    if category and len(category) > 50:
+        raise ValueError("category is longer than 50 characters")
+
+    price = _number(row, 'price', float, required=True, minimum=0)
+    product = {
+        'name': name,
+        'description': (row.get('description') or '').strip(),
+        'price': price,
+        'stock': _number(row, 'stock', int, required=True, minimum=0),
+        'category': category,
+        'min_price': None,
+        'max_discount_percentage': None,
+        'image': (row.get('image') or '').strip() or None,
+    }
+    min_price = _number(row, 'min_price', float, minimum=0)
+    if min_price is not None:
+        if min_price > price:
+            raise ValueError("min_price is above price")
+        max_discount = _number(row, 'max_discount', float, minimum=0, maximum=100)
+        product['min_price'] = min_price
+        product['max_discount_percentage'] = DEFAULT_MAX_DISCOUNT if max_discount is None else max_discount
+    return product
+
+def clean_rows(rows, report):
+    """Yield (line, product) for valid rows, recording the rest in the report"""
+    for line, row in rows:
+        try:
+            yield line, clean_row(row)
+        except ValueError as e:
+            report.add_error(line, str(e))
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def image_name(digest):
+    """Path under images/products/ for an image with this content digest"""
+    return f'{digest[:2]}/{digest}.webp'
+
+def _save_atomically(image, path, fmt, **options):
+    # Another worker may be writing the same digest; readers only ever see whole files
+    partial = f'{path}.{os.getpid()}.tmp'
+    image.save(partial, fmt, **options)
+    os.replace(partial, path)
+
+def store_image(data, products_dir):
+    """
+    Normalize image bytes into a WebP, a WebP thumbnail and a JPEG
+    fallback named after the content hash. Identical images are stored
+    once. Returns the image_url for the product.
+    """
+    from PIL import Image, ImageOps
+
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    name = image_name(digest)
+    target = os.path.join(products_dir, name)
+    if os.path.exists(target):
+        return name
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        base = target[:-len('.webp')]
+        _save_atomically(image, f'{base}.jpg', 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        thumbnail = image.copy()
+        thumbnail.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        _save_atomically(thumbnail, f'{base}_thumb.webp', 'WEBP', quality=WEBP_QUALITY)
+        # Written last: its presence marks the whole set as complete
+        _save_atomically(image, target, 'WEBP', quality=WEBP_QUALITY)
+    return name
+
+def process_image(source, products_dir):
+    """Pool worker: (image_url, error) for an image file"""
+    try:
+        with open(source, 'rb') as f:
+            return store_image(f.read(), products_dir), None
+    except Exception as e:
+        return None, f"image {os.path.basename(source)}: {e}"
+
+def _attach_images(chunk, image_root, products_dir, pool, report):
+    """Replace each row's image path with its stored image_url; drops rows whose image fails"""
+    root = os.path.realpath(image_root)
+    failed = set()
+    pending, sources = [], []
+    for line, product in chunk:
+        if not product['image']:
+            continue
+        source = os.path.realpath(os.path.join(root, product['image']))
+        if os.path.commonpath([root, source]) != root:
+            report.add_error(line, f"image {product['image']} is outside the image folder")
+            failed.add(line)
+            continue
+        pending.append((line, product))
+        sources.append(source)
+
+    # Rows sharing an image file are processed once
+    unique = list(dict.fromkeys(sources))
+    if unique and pool is not None:
+        processed = pool.map(process_image, unique, [products_dir] * len(unique), chunksize=16)
+    else:
+        processed = (process_image(source, products_dir) for source in unique)
+    results = dict(zip(unique, processed))
+
+    for (line, product), source in zip(pending, sources):
+        image_url, error = results[source]
+        if error:
+            report.add_error(line, error)
+            failed.add(line)
+        else:
+            product['image_url'] = image_url
+            report.images += 1
+    return [(line, product) for line, product in chunk if line not in failed]
+
+def import_products(conn, shop_id, stream, fmt='csv', image_root=None, products_dir=None,
+                    chunk_size=CHUNK_SIZE, workers=None):
+    """
+    Stream a CSV/JSONL catalog into a shop. Rows are validated as they are
+    read and inserted chunk_size at a time, so memory stays flat however
+    large the file is. With image_root and products_dir, each row's `image`
+    (a path under image_root) is normalized in a process pool of `workers`.
+    Returns an ImportReport; the caller commits.
+    """
+    from .search_index import index_products
+
+    report = ImportReport()
+    with_images = image_root is not None and products_dir is not None
+    pool = ProcessPoolExecutor(max_workers=workers) if with_images and workers != 0 else None
+    statement = insert(product_table).returning(
+        product_table.c.id, product_table.c.shop_id, product_table.c.name,
+        product_table.c.category, product_table.c.price, sort_by_parameter_order=True
+    )
+    try:
+        for chunk in chunked(clean_rows(read_rows(stream, fmt), report), chunk_size):
+            if with_images:
+                chunk = _attach_images(chunk, image_root, products_dir, pool, report)
+            if not chunk:
+                continue
+            now = datetime.utcnow()
+            rows = [{
+                'name': product['name'],
+                'description': product['description'],
+                'price': product['price'],
+                'stock': product['stock'],
+                'shop_id': shop_id,
+                # Without image processing, `image` names a file already in place
+                'image_url': product.get('image_url') if with_images else product['image'],
+                'category': product['category'],
+                'created_at': now,
+                'min_price': product['min_price'],
+                'max_discount_percentage': product['max_discount_percentage'],
+            } for _, product in chunk]
+            inserted = conn.execute(statement, rows).fetchall()
+            index_products(conn, inserted)
+            report.inserted += len(inserted)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return report
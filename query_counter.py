@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from threading import Lock
+
+from sqlalchemy import event
+
+class QueryCounter:
+    """
+    Records the SQL statements an engine runs while active.
+    Use as a context manager; statements from every thread using the
+    engine are counted, so keep other work off it while measuring.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self._lock = Lock()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc_info):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+@contextmanager
+def assert_max_queries(engine, limit):
+    """
+    Fail when the block runs more than `limit` statements, listing them;
+    a ceiling per endpoint turns N+1 regressions into test failures.
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        listing = '\n'.join(f'  {n}. {statement}' for n, statement in enumerate(counter.statements, 1))
+        raise AssertionError(f"{counter.count} queries run, expected at most {limit}:\n{listing}")
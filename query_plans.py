@@ -0,0 +1,108 @@
+import re
+from collections import namedtuple
+
+from sqlalchemy import text
+
+from .dispatch import AVAILABLE_COURIERS, PENDING_ORDERS
+
+HotQuery = namedtuple('HotQuery', ['name', 'sql', 'params'])
+
+# Queries run on every page view or dispatch pass; none of them may read a
+# whole table once the performance indexes are in place
+HOT_QUERIES = [
+    HotQuery('customer_orders',
+             'SELECT * FROM "order" WHERE customer_id = :id ORDER BY created_at DESC LIMIT 20',
+             {'id': 1}),
+    HotQuery('customer_orders_keyset_page',
+             'SELECT * FROM "order" WHERE customer_id = :id AND (created_at, id) < (:created_at, :last_id) '
+             'ORDER BY created_at DESC, id DESC LIMIT 21',
+             {'id': 1, 'created_at': '2025-01-01 00:00:00.000000', 'last_id': 1000}),
+    HotQuery('shop_orders_by_status',
+             'SELECT * FROM "order" WHERE shop_id = :id AND status = :status ORDER BY created_at DESC',
+             {'id': 1, 'status': 'pending'}),
+    HotQuery('shop_order_status_counts',
+             'SELECT status, COUNT(*) FROM "order" WHERE shop_id = :id GROUP BY status',
+             {'id': 1}),
+    HotQuery('courier_active_deliveries',
+             'SELECT COUNT(*) FROM "order" WHERE delivery_person_id = :id AND status = \'delivering\'',
+             {'id': 1}),
+    HotQuery('courier_orders',
+             'SELECT * FROM "order" WHERE delivery_person_id = :id ORDER BY created_at DESC',
+             {'id': 1}),
+    HotQuery('courier_delivery_counts',
+             'SELECT delivery_person_id, COUNT(*) FROM "order" '
+             "WHERE status = 'delivering' AND delivery_person_id IN (:a, :b) GROUP BY delivery_person_id",
+             {'a': 1, 'b': 2}),
+    HotQuery('dispatch_pending_orders', PENDING_ORDERS, {}),
+    HotQuery('dispatch_available_couriers',
+             AVAILABLE_COURIERS + ' GROUP BY u.id, u.location_lat, u.location_lng',
+             {'active': True}),
+    HotQuery('order_items',
+             'SELECT oi.*, p.name FROM order_item oi JOIN product p ON p.id = oi.product_id '
+             'WHERE oi.order_id = :id',
+             {'id': 1}),
+    HotQuery('shop_products',
+             'SELECT * FROM product WHERE shop_id = :id', {'id': 1}),
+    HotQuery('shop_products_by_category',
+             'SELECT * FROM product WHERE shop_id = :id AND category = :category',
+             {'id': 1, 'category': 'Grocery'}),
+    HotQuery('owner_shops',
+             'SELECT * FROM shop WHERE owner_id = :id', {'id': 1}),
+    HotQuery('customer_negotiations',
+             'SELECT * FROM negotiation WHERE customer_id = :id ORDER BY created_at DESC',
+             {'id': 1}),
+    HotQuery('product_negotiations',
+             'SELECT * FROM negotiation WHERE product_id = :id AND status = :status',
+             {'id': 1, 'status': 'pending'}),
+    HotQuery('order_delivery_negotiation',
+             'SELECT * FROM delivery_negotiation WHERE order_id = :id', {'id': 1}),
+    HotQuery('cart_contents',
+             'SELECT ci.*, p.name, p.price, p.shop_id FROM cart_item ci '
+             'JOIN product p ON p.id = ci.product_id WHERE ci.user_id = :id',
+             {'id': 1}),
+    HotQuery('cart_summary',
+             'SELECT ci.id, ci.quantity, p.name, p.price, s.id, s.name, s.location_lat, s.location_lng '
+             'FROM cart_item ci JOIN product p ON p.id = ci.product_id JOIN shop s ON s.id = p.shop_id '
+             'WHERE ci.user_id = :id ORDER BY s.name, ci.id',
+             {'id': 1}),
+    HotQuery('carts_holding_product',
+             'SELECT user_id FROM cart_item WHERE product_id = :id', {'id': 1}),
+    HotQuery('analytics_daily_sales',
+             'SELECT day, orders, revenue FROM shop_daily_sales WHERE shop_id = :id AND day >= :since ORDER BY day',
+             {'id': 1, 'since': '2024-01-01'}),
+    HotQuery('analytics_status_counts',
+             'SELECT status, orders FROM shop_order_status WHERE shop_id = :id', {'id': 1}),
+    HotQuery('analytics_top_products',
+             'SELECT ps.product_id, p.name, ps.units, ps.revenue FROM product_sales ps '
+             'JOIN product p ON p.id = ps.product_id WHERE ps.shop_id = :id AND ps.units > 0 '
+             'ORDER BY ps.units DESC LIMIT 10',
+             {'id': 1}),
+    HotQuery('analytics_negotiations',
+             'SELECT ns.product_id, p.name, ns.negotiations, ns.accepted, ns.discount_total '
+             'FROM product_negotiation_stats ns JOIN product p ON p.id = ns.product_id '
+             'WHERE ns.shop_id = :id AND ns.negotiations > 0 ORDER BY ns.negotiations DESC',
+             {'id': 1}),
+    HotQuery('cart_item_lookup',
+             'SELECT * FROM cart_item WHERE user_id = :id AND product_id = :product_id',
+             {'id': 1, 'product_id': 1}),
+]
+
+# "SCAN order", "SCAN o", "SCAN o USING INDEX ..." all read every row;
+# only SEARCH steps narrow by key
+_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(?!\(subquery)')
+
+def explain(conn, query):
+    """SQLite's EXPLAIN QUERY PLAN details for a hot query, one string per step"""
+    rows = conn.execute(text(f'EXPLAIN QUERY PLAN {query.sql}'), query.params)
+    return [row[-1] for row in rows]
+
+def full_scans(conn, queries=HOT_QUERIES):
+    """[(query name, plan step)] for every step that reads a whole table"""
+    if conn.dialect.name != 'sqlite':
+        raise NotImplementedError("Query plan checks use SQLite's EXPLAIN QUERY PLAN")
+    return [
+        (query.name, step)
+        for query in queries
+        for step in explain(conn, query)
+        if _SCAN_RE.match(step)
+    ]
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request, url_for
+from ecommerce.utils.db_engine import read_engine
+from ecommerce.utils.search_index import suggest
+
+search_bp = Blueprint('search', __name__)
+
+def _serialize(row):
+    if row['kind'] == 'shop':
+        return {
+            'type': 'shop',
+            'id': row['ref_id'],
+            'name': row['name'],
+            'url': url_for('shop.view', shop_id=row['ref_id'])
+        }
+    return {
+        'type': 'product',
+        'id': row['ref_id'],
+        'name': row['name'],
+        'category': row['category'] or None,
+        'price': row['price'],
+        'url': url_for('shop.view', shop_id=row['shop_id'])
+    }
+
+@search_bp.route('/api/search/suggestions')
+def search_suggestions():
+    """Type-ahead suggestions for products and shops, optionally within one shop"""
+    query = request.args.get('q', '').strip()
+    shop_id = request.args.get('shop_id', type=int)
+    if len(query) < 2:
+        return jsonify([])
+
+    # Suggestions tolerate replica lag
+    with read_engine().connect() as conn:
+        rows = suggest(conn, query, shop_id=shop_id)
+    return jsonify([_serialize(row) for row in rows])
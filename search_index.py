@@ -0,0 +1,295 @@
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+# Suggestions returned per request
+SUGGESTION_LIMIT = 8
+# Candidates pulled from the index before ranking; keeps short prefixes cheap
+CANDIDATE_POOL = 64
+# Hot prefix cache size and how long another worker's writes may go unseen
+CACHE_SIZE = 2048
+CACHE_TTL = 60
+
+# Columns the suggestion rows are built from; other updates leave the index alone
+PRODUCT_FIELDS = ('name', 'category', 'price', 'shop_id')
+SHOP_FIELDS = ('name', 'is_active')
+# Set on a session whose flushes changed the index, to drop cached suggestions on commit
+PENDING_INVALIDATION = 'search_index_changed'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+CREATE_FTS_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_suggestion USING fts5(
+        name,
+        category,
+        shop_tag,
+        kind UNINDEXED,
+        ref_id UNINDEXED,
+        shop_id UNINDEXED,
+        price UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3 4'
+    )
+'''
+
+# Postgres has no FTS5; trigram indexes serve the same prefix lookups
+CREATE_TRIGRAM_INDEXES = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS ix_product_name_trgm ON product USING gin (lower(name) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_product_category_trgm ON product USING gin (lower(category) gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS ix_shop_name_trgm ON shop USING gin (lower(name) gin_trgm_ops)',
+]
+
+def tokenize(query):
+    return _TOKEN_RE.findall(query.lower())
+
+def _rowid(kind, ref_id):
+    # Products and shops share one table; odd rowids are shops
+    return ref_id * 2 + (1 if kind == 'shop' else 0)
+
+def _match_expression(tokens, shop_id=None):
+    terms = ' '.join(f'"{token}"*' for token in tokens)
+    expression = f'{{name category}} : ({terms})'
+    if shop_id is not None:
+        expression = f'shop_tag : "s{int(shop_id)}" AND {expression}'
+    return expression
+
+class SuggestionCache:
+    """
+    LRU cache of suggestion lists for the hottest prefixes.
+    Any local index write bumps the generation, which invalidates every
+    entry at once; the TTL bounds staleness from writes in other workers.
+    """
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self.generation and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (self.generation, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+suggestion_cache = SuggestionCache()
+
+def _rank(query, rows, limit):
+    """Names starting with the query first, then shorter (closer) names"""
+    query = query.lower()
+    rows.sort(key=lambda row: (not row['name'].lower().startswith(query), len(row['name']), row['name']))
+    return rows[:limit]
+
+def _suggest_sqlite(conn, tokens, shop_id, pool):
+    result = conn.execute(text(
+        'SELECT kind, ref_id, shop_id, name, category, price FROM search_suggestion '
+        'WHERE search_suggestion MATCH :match LIMIT :pool'
+    ), {'match': _match_expression(tokens, shop_id), 'pool': pool})
+    return [dict(row._mapping) for row in result]
+
+def _suggest_postgres(conn, tokens, shop_id, pool):
+    params = {'pool': pool}
+    conditions = []
+    for i, token in enumerate(tokens):
+        params[f't{i}'] = f'%{token}%'
+        conditions.append(f'(lower(p.name) LIKE :t{i} OR lower(p.category) LIKE :t{i})')
+    product_filter = ' AND '.join(conditions)
+    if shop_id is not None:
+        product_filter += ' AND p.shop_id = :shop_id'
+        params['shop_id'] = shop_id
+
+    rows = [dict(row._mapping) for row in conn.execute(text(
+        "SELECT 'product' AS kind, p.id AS ref_id, p.shop_id, p.name, p.category, p.price "
+        f'FROM product p WHERE {product_filter} LIMIT :pool'
+    ), params)]
+    if shop_id is None:
+        shop_filter = ' AND '.join(f'lower(s.name) LIKE :t{i}' for i in range(len(tokens)))
+        rows += [dict(row._mapping) for row in conn.execute(text(
+            "SELECT 'shop' AS kind, s.id AS ref_id, s.id AS shop_id, s.name, NULL AS category, NULL AS price "
+            f'FROM shop s WHERE s.is_active AND {shop_filter} LIMIT :pool'
+        ), params)]
+    return rows
+
+def suggest(conn, query, shop_id=None, limit=SUGGESTION_LIMIT, cache=suggestion_cache):
+    """
+    Return up to `limit` suggestion rows (kind, ref_id, shop_id, name,
+    category, price) whose name or category has a word starting with each
+    word of `query` (a substring match on Postgres). Restricted to one
+    shop's products when shop_id is given.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+
+    key = (' '.join(tokens), shop_id, limit)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    if conn.dialect.name == 'postgresql':
+        rows = _suggest_postgres(conn, tokens, shop_id, CANDIDATE_POOL)
+    else:
+        rows = _suggest_sqlite(conn, tokens, shop_id, CANDIDATE_POOL)
+    rows = _rank(' '.join(tokens), rows, limit)
+
+    if cache is not None:
+        cache.put(key, rows)
+    return rows
+
+def ensure_search_index(conn):
+    """Create the suggestion index structures for the connection's dialect"""
+    if conn.dialect.name == 'postgresql':
+        for statement in CREATE_TRIGRAM_INDEXES:
+            conn.execute(text(statement))
+    else:
+        conn.execute(text(CREATE_FTS_TABLE))
+
+def _product_row(product_id, shop_id, name, category, price):
+    return {
+        'rowid': _rowid('product', product_id), 'name': name, 'category': category or '',
+        'shop_tag': f's{shop_id}', 'kind': 'product', 'ref_id': product_id,
+        'shop_id': shop_id, 'price': price
+    }
+
+def _shop_row(shop_id, name):
+    return {
+        'rowid': _rowid('shop', shop_id), 'name': name, 'category': '',
+        'shop_tag': '', 'kind': 'shop', 'ref_id': shop_id,
+        'shop_id': shop_id, 'price': None
+    }
+
+INSERT_ENTRY = text(
+    'INSERT INTO search_suggestion '
+    '(rowid, name, category, shop_tag, kind, ref_id, shop_id, price) '
+    'VALUES (:rowid, :name, :category, :shop_tag, :kind, :ref_id, :shop_id, :price)'
+)
+DELETE_ENTRY = text('DELETE FROM search_suggestion WHERE rowid = :rowid')
+
+def rebuild_search_index(conn, chunk_size=5000):
+    """Repopulate the FTS table from product and shop in chunked bulk inserts"""
+    ensure_search_index(conn)
+    if conn.dialect.name == 'postgresql':
+        # Trigram indexes are maintained by Postgres itself
+        return 0
+
+    conn.execute(text('DELETE FROM search_suggestion'))
+    count = 0
+    shops = conn.execute(text('SELECT id, name FROM shop WHERE is_active = :active'), {'active': True})
+    rows = [_shop_row(*shop) for shop in shops]
+    if rows:
+        conn.execute(INSERT_ENTRY, rows)
+        count += len(rows)
+
+    products = conn.execution_options(stream_results=True).execute(text(
+        'SELECT id, shop_id, name, category, price FROM product'
+    ))
+    while True:
+        chunk = products.fetchmany(chunk_size)
+        if not chunk:
+            break
+        conn.execute(INSERT_ENTRY, [_product_row(*product) for product in chunk])
+        count += len(chunk)
+
+    suggestion_cache.invalidate()
+    return count
+
+def index_products(conn, products):
+    """Add bulk-inserted (id, shop_id, name, category, price) rows, which skip the ORM hooks"""
+    if conn.dialect.name == 'postgresql' or not products:
+        return
+    conn.execute(INSERT_ENTRY, [_product_row(*product) for product in products])
+    suggestion_cache.invalidate()
+
+def _touched(target, fields):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in fields if name in state.attrs)
+
+def _changed(target):
+    """Drop cached suggestions once the write commits, so none are re-cached from the old rows"""
+    session = object_session(target)
+    if session is None:
+        suggestion_cache.invalidate()
+    else:
+        session.info[PENDING_INVALIDATION] = True
+
+def _index_product(mapper, connection, target):
+    if connection.dialect.name != 'postgresql':
+        connection.execute(DELETE_ENTRY, {'rowid': _rowid('product', target.id)})
+        connection.execute(INSERT_ENTRY, _product_row(
+            target.id, target.shop_id, target.name, target.category, target.price
+        ))
+    _changed(target)
+
+def _reindex_product(mapper, connection, target):
+    # Stock and other frequent updates don't touch the suggestion row
+    if _touched(target, PRODUCT_FIELDS):
+        _index_product(mapper, connection, target)
+
+def _unindex_product(mapper, connection, target):
+    if connection.dialect.name != 'postgresql':
+        connection.execute(DELETE_ENTRY, {'rowid': _rowid('product', target.id)})
+    _changed(target)
+
+def _index_shop(mapper, connection, target):
+    if connection.dialect.name != 'postgresql':
+        connection.execute(DELETE_ENTRY, {'rowid': _rowid('shop', target.id)})
+        if target.is_active is not False:
+            connection.execute(INSERT_ENTRY, _shop_row(target.id, target.name))
+    _changed(target)
+
+def _reindex_shop(mapper, connection, target):
+    if _touched(target, SHOP_FIELDS):
+        _index_shop(mapper, connection, target)
+
+def _unindex_shop(mapper, connection, target):
+    if connection.dialect.name != 'postgresql':
+        connection.execute(DELETE_ENTRY, {'rowid': _rowid('shop', target.id)})
+    _changed(target)
+
+def _invalidate_committed(session):
+    if session.info.pop(PENDING_INVALIDATION, None):
+        suggestion_cache.invalidate()
+
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_INVALIDATION, None)
+
+def init_search_index(app):
+    """Keep the suggestion index in step with product and shop writes"""
+    from ..models.shop import Product, Shop
+
+    hooks = (
+        (Product, _index_product, _reindex_product, _unindex_product),
+        (Shop, _index_shop, _reindex_shop, _unindex_shop),
+    )
+    for model, index, reindex, unindex in hooks:
+        if not event.contains(model, 'after_insert', index):
+            event.listen(model, 'after_insert', index)
+            event.listen(model, 'after_update', reindex)
+            event.listen(model, 'after_delete', unindex)
+    if not event.contains(Session, 'after_commit', _invalidate_committed):
+        event.listen(Session, 'after_commit', _invalidate_committed)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
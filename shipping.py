@@ -0,0 +1,51 @@
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+from sqlalchemy import text
+from ecommerce import db
+from ecommerce.utils.delivery_quote import quote_shops
+
+shipping_bp = Blueprint('shipping', __name__)
+
+@shipping_bp.route('/api/cart/shipping-quotes', methods=['POST'])
+@login_required
+def cart_shipping_quotes():
+    """
+    Delivery quotes for every shop in the cart, in one call.
+    Optional JSON: item_ids (only quote shops of these cart items) and
+    lat/lng (defaults to the customer's saved location).
+    """
+    data = request.get_json(silent=True) or {}
+    lat = data.get('lat', current_user.location_lat)
+    lng = data.get('lng', current_user.location_lng)
+    try:
+        lat = float(lat) if lat is not None else None
+        lng = float(lng) if lng is not None else None
+        item_ids = [int(item_id) for item_id in data.get('item_ids') or []]
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid shipping data'}), 400
+
+    conn = db.session.connection()
+    sql = (
+        'SELECT DISTINCT p.shop_id FROM cart_item ci JOIN product p ON p.id = ci.product_id '
+        'WHERE ci.user_id = :user_id'
+    )
+    params = {'user_id': current_user.id}
+    if item_ids:
+        sql += ' AND ci.id IN (' + ', '.join(f':i{n}' for n in range(len(item_ids))) + ')'
+        params.update({f'i{n}': item_id for n, item_id in enumerate(item_ids)})
+    shop_ids = sorted(row[0] for row in conn.execute(text(sql), params))
+
+    quotes = quote_shops(conn, shop_ids, lat, lng)
+    return jsonify({
+        'status': 'success',
+        'quotes': [
+            {
+                'shop_id': quote.shop_id,
+                'distance_km': round(quote.distance_km, 2) if quote.distance_km is not None else None,
+                'fee': round(quote.base_fee, 2),
+                'min_fee': round(quote.min_fee, 2)
+            }
+            for quote in quotes
+        ],
+        'shipping_fee': round(sum(quote.base_fee for quote in quotes), 2)
+    })
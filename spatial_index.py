@@ -0,0 +1,365 @@
+import time
+from math import cos, floor, radians
+from threading import RLock
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session, object_session
+
+from .distance import calculate_distances
+
+# Grid cell edge in degrees (~2.2 km of latitude). Cells are small enough that
+# a radius query only touches a handful of buckets around the point.
+CELL_SIZE_DEG = 0.02
+KM_PER_DEG_LAT = 111.32
+# Past this many rings the data is sparse enough that a full scan is cheaper
+MAX_RINGS = 32
+
+# Index moves made in a session, applied only once it commits
+PENDING_MOVES = 'spatial_index_moves'
+
+def cell_of(lat, lng, cell_size=CELL_SIZE_DEG):
+    """Return the (row, col) grid cell containing a coordinate"""
+    return floor(lat / cell_size), floor(lng / cell_size)
+
+def cell_key(lat, lng, cell_size=CELL_SIZE_DEG):
+    """Return the string form of a grid cell, as stored in the geo_cell column"""
+    if lat is None or lng is None:
+        return None
+    row, col = cell_of(lat, lng, cell_size)
+    return f"{row}:{col}"
+
+def _cell_span(lat, radius_km, cell_size):
+    """Number of cells to scan in each direction to cover radius_km"""
+    lat_cell_km = cell_size * KM_PER_DEG_LAT
+    lng_cell_km = lat_cell_km * max(cos(radians(min(abs(lat) + cell_size, 89.0))), 1e-6)
+    return int(radius_km // lat_cell_km) + 1, int(radius_km // lng_cell_km) + 1
+
+def cells_within(lat, lng, radius_km, cell_size=CELL_SIZE_DEG):
+    """All grid cell keys that may contain points within radius_km of (lat, lng)"""
+    row, col = cell_of(lat, lng, cell_size)
+    row_span, col_span = _cell_span(lat, radius_km, cell_size)
+    return [
+        f"{r}:{c}"
+        for r in range(row - row_span, row + row_span + 1)
+        for c in range(col - col_span, col + col_span + 1)
+    ]
+
+class SpatialIndex:
+    """
+    In-process bucketed index of points keyed by id.
+    Points live in grid cells so radius and k-nearest queries only look at
+    the buckets around the query point, not at every indexed point.
+    """
+    def __init__(self, cell_size=CELL_SIZE_DEG):
+        self.cell_size = cell_size
+        self._cells = {}      # (row, col) -> {id: (lat, lng)}
+        self._positions = {}  # id -> (lat, lng, (row, col))
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def update(self, item_id, lat, lng):
+        """Insert or move a point; a missing coordinate removes it"""
+        if lat is None or lng is None:
+            self.remove(item_id)
+            return
+
+        cell = cell_of(lat, lng, self.cell_size)
+        with self._lock:
+            previous = self._positions.get(item_id)
+            if previous and previous[2] != cell:
+                self._discard(item_id, previous[2])
+            self._cells.setdefault(cell, {})[item_id] = (lat, lng)
+            self._positions[item_id] = (lat, lng, cell)
+
+    def remove(self, item_id):
+        with self._lock:
+            previous = self._positions.pop(item_id, None)
+            if previous:
+                self._discard(item_id, previous[2])
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+
+    def load(self, points):
+        """Replace every point with (id, lat, lng) rows; readers never see a half-built index"""
+        cells, positions = {}, {}
+        for item_id, lat, lng in points:
+            if lat is None or lng is None:
+                continue
+            cell = cell_of(lat, lng, self.cell_size)
+            cells.setdefault(cell, {})[item_id] = (lat, lng)
+            positions[item_id] = (lat, lng, cell)
+        with self._lock:
+            self._cells = cells
+            self._positions = positions
+
+    def position(self, item_id):
+        entry = self._positions.get(item_id)
+        return entry[:2] if entry else None
+
+    def _discard(self, item_id, cell):
+        bucket = self._cells.get(cell)
+        if bucket is not None:
+            bucket.pop(item_id, None)
+            if not bucket:
+                del self._cells[cell]
+
+    def _collect(self, cells):
+        ids, lats, lngs = [], [], []
+        for cell in cells:
+            bucket = self._cells.get(cell)
+            if bucket:
+                for item_id, (lat, lng) in bucket.items():
+                    ids.append(item_id)
+                    lats.append(lat)
+                    lngs.append(lng)
+        return ids, lats, lngs
+
+    def within_radius(self, lat, lng, radius_km):
+        """
+        Return [(id, distance_km)] for points within radius_km, nearest first
+        """
+        row, col = cell_of(lat, lng, self.cell_size)
+        row_span, col_span = _cell_span(lat, radius_km, self.cell_size)
+        cells = [
+            (r, c)
+            for r in range(row - row_span, row + row_span + 1)
+            for c in range(col - col_span, col + col_span + 1)
+        ]
+        with self._lock:
+            ids, lats, lngs = self._collect(cells)
+        if not ids:
+            return []
+
+        distances = calculate_distances(lat, lng, lats, lngs)
+        matches = [(ids[i], float(distances[i])) for i in range(len(ids)) if distances[i] <= radius_km]
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    def nearest(self, lat, lng, k, max_distance=None):
+        """
+        Return the k nearest [(id, distance_km)], nearest first.
+        Scans rings of cells outward and stops once the k-th candidate is
+        closer than anything an unscanned ring could contain.
+        """
+        if k <= 0:
+            return []
+
+        row, col = cell_of(lat, lng, self.cell_size)
+        lat_cell_km = self.cell_size * KM_PER_DEG_LAT
+        min_cell_km = lat_cell_km * max(cos(radians(min(abs(lat) + self.cell_size, 89.0))), 1e-6)
+
+        candidates = []
+        ring = 0
+        with self._lock:
+            total = len(self._positions)
+            seen = 0
+            while seen < total:
+                if ring > MAX_RINGS:
+                    ids = list(self._positions)
+                    distances = calculate_distances(
+                        lat, lng,
+                        [self._positions[i][0] for i in ids],
+                        [self._positions[i][1] for i in ids]
+                    )
+                    candidates = list(zip(ids, distances.tolist()))
+                    break
+                if ring == 0:
+                    cells = [(row, col)]
+                else:
+                    cells = [(row + dr, col + dc)
+                             for dr in range(-ring, ring + 1)
+                             for dc in (-ring, ring)]
+                    cells += [(row + dr, col + dc)
+                              for dr in (-ring, ring)
+                              for dc in range(-ring + 1, ring)]
+                ids, lats, lngs = self._collect(cells)
+                if ids:
+                    seen += len(ids)
+                    distances = calculate_distances(lat, lng, lats, lngs)
+                    candidates.extend(zip(ids, distances.tolist()))
+
+                covered_km = ring * min_cell_km
+                if max_distance is not None and covered_km >= max_distance:
+                    break
+                if len(candidates) >= k:
+                    candidates.sort(key=lambda match: match[1])
+                    if candidates[k - 1][1] <= covered_km:
+                        break
+                ring += 1
+
+        candidates.sort(key=lambda match: match[1])
+        if max_distance is not None:
+            candidates = [match for match in candidates if match[1] <= max_distance]
+        return candidates[:k]
+
+# Process-wide indexes, populated lazily from the database. Each worker holds
+# its own copy and only sees its own writes, so it reloads every _reload_after
+# seconds to pick up shops and couriers moved by the other workers.
+shop_index = SpatialIndex()
+courier_index = SpatialIndex()
+_loaded = False
+_loaded_at = 0.0
+_reload_after = None
+_load_lock = RLock()
+
+def rebuild_indexes():
+    """Reload both indexes from the shop and user tables"""
+    global _loaded, _loaded_at
+    from .. import db
+
+    with _load_lock:
+        shop_index.load(db.session.execute(text(
+            'SELECT id, location_lat, location_lng FROM shop WHERE is_active = :active'
+        ), {'active': True}))
+        courier_index.load(db.session.execute(text(
+            'SELECT id, location_lat, location_lng FROM "user" '
+            "WHERE role = 'delivery' AND is_active = :active"
+        ), {'active': True}))
+        _loaded = True
+        _loaded_at = time.monotonic()
+
+def _stale():
+    if not _loaded:
+        return True
+    return bool(_reload_after) and time.monotonic() - _loaded_at > _reload_after
+
+def _ensure_loaded():
+    if _stale():
+        with _load_lock:
+            # Another thread may have reloaded while this one waited
+            if _stale():
+                rebuild_indexes()
+
+def nearby_shops(lat, lng, radius_km, limit=None):
+    """[(shop_id, distance_km)] of active shops within radius_km, nearest first"""
+    _ensure_loaded()
+    matches = shop_index.within_radius(lat, lng, radius_km)
+    return matches[:limit] if limit else matches
+
+def nearby_shops_page(lat, lng, radius_km, cursor=None, per_page=12):
+    """Keyset page of nearby shops ordered by (distance, id); total is exact"""
+    from .pagination import keyset_slice
+
+    def key(match):
+        return match[1], match[0]
+
+    matches = sorted(nearby_shops(lat, lng, radius_km), key=key)
+    return keyset_slice(matches, key, cursor=cursor, per_page=per_page)
+
+def nearest_shops(lat, lng, k, max_distance=None):
+    _ensure_loaded()
+    return shop_index.nearest(lat, lng, k, max_distance)
+
+def shop_position(shop_id):
+    """(lat, lng) of an active shop, or None"""
+    _ensure_loaded()
+    return shop_index.position(shop_id)
+
+def nearby_couriers(lat, lng, radius_km):
+    """[(user_id, distance_km)] of active delivery persons within radius_km"""
+    _ensure_loaded()
+    return courier_index.within_radius(lat, lng, radius_km)
+
+def nearest_couriers(lat, lng, k, max_distance=None):
+    _ensure_loaded()
+    return courier_index.nearest(lat, lng, k, max_distance)
+
+def cell_candidates_query(table, lat, lng, radius_km):
+    """
+    SQL fallback over the indexed geo_cell column, for processes that do not
+    hold the in-memory index (e.g. scripts). Returns (sql, params) selecting
+    id, location_lat, location_lng for rows in the covering cells.
+    """
+    cells = cells_within(lat, lng, radius_km)
+    placeholders = ', '.join(f':c{i}' for i in range(len(cells)))
+    sql = text(
+        f'SELECT id, location_lat, location_lng FROM "{table}" '
+        f'WHERE geo_cell IN ({placeholders})'
+    )
+    return sql, {f'c{i}': cell for i, cell in enumerate(cells)}
+
+def _location_changed(target):
+    state = inspect(target)
+    return any(
+        state.attrs[name].history.has_changes()
+        for name in ('location_lat', 'location_lng', 'is_active', 'role')
+        if name in state.attrs
+    )
+
+def _store_cell(connection, table, target):
+    connection.execute(
+        text(f'UPDATE "{table}" SET geo_cell = :cell WHERE id = :id'),
+        {'cell': cell_key(target.location_lat, target.location_lng), 'id': target.id}
+    )
+
+def _move(index, target, position):
+    """Queue a move (or a removal, for position None) until the session commits"""
+    session = object_session(target)
+    if session is None:
+        _apply({(index, target.id): position})
+    else:
+        session.info.setdefault(PENDING_MOVES, {})[(index, target.id)] = position
+
+def _apply(moves):
+    for (index, item_id), position in moves.items():
+        if position is None:
+            index.remove(item_id)
+        else:
+            index.update(item_id, *position)
+
+def _sync_shop(mapper, connection, target):
+    if not _location_changed(target):
+        return
+    _store_cell(connection, 'shop', target)
+    if target.is_active is False:
+        _move(shop_index, target, None)
+    else:
+        _move(shop_index, target, (target.location_lat, target.location_lng))
+
+def _sync_user(mapper, connection, target):
+    if not _location_changed(target):
+        return
+    _store_cell(connection, 'user', target)
+    if target.role == 'delivery' and target.is_active is not False:
+        _move(courier_index, target, (target.location_lat, target.location_lng))
+    else:
+        _move(courier_index, target, None)
+
+def _forget_shop(mapper, connection, target):
+    _move(shop_index, target, None)
+
+def _forget_user(mapper, connection, target):
+    _move(courier_index, target, None)
+
+def _apply_committed(session):
+    # A rolled back move must never reach the index, so wait for the commit
+    moves = session.info.pop(PENDING_MOVES, None)
+    if moves:
+        _apply(moves)
+
+def _forget_rolled_back(session):
+    session.info.pop(PENDING_MOVES, None)
+
+def init_spatial_index(app):
+    """Keep geo_cell columns and the in-process indexes in step with writes"""
+    global _reload_after
+    from ..models.shop import Shop
+    from ..models.user import User
+
+    _reload_after = app.config.get('SPATIAL_INDEX_RELOAD', 60)
+    for model, sync, forget in ((Shop, _sync_shop, _forget_shop), (User, _sync_user, _forget_user)):
+        if not event.contains(model, 'after_insert', sync):
+            event.listen(model, 'after_insert', sync)
+            event.listen(model, 'after_update', sync)
+            event.listen(model, 'after_delete', forget)
+    if not event.contains(Session, 'after_commit', _apply_committed):
+        event.listen(Session, 'after_commit', _apply_committed)
+        event.listen(Session, 'after_rollback', _forget_rolled_back)
@@ -0,0 +1,206 @@
+import unittest
+from datetime import date, datetime, timedelta
+from flask import Flask
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, create_engine, event, text
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils.analytics import (_read_old_values, _update_aggregates, ensure_analytics_tables,
+                                       init_analytics, rebuild_analytics, shop_analytics)
+from ecommerce.utils.checkout import place_orders
+from ecommerce.utils.query_counter import QueryCounter
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    cart_version = Column(Integer, nullable=False, default=0)
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    price = Column(Float)
+    stock = Column(Integer)
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+
+class Order(Base):
+    __tablename__ = 'order'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer)
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+    status = Column(String(20))
+    total_amount = Column(Float)
+    delivery_fee = Column(Float)
+    delivery_address = Column(String(200))
+    delivery_lat = Column(Float)
+    delivery_lng = Column(Float)
+    special_instructions = Column(String(200))
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+class OrderItem(Base):
+    __tablename__ = 'order_item'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('order.id'))
+    product_id = Column(Integer, ForeignKey('product.id'))
+    quantity = Column(Integer)
+    price = Column(Float)
+
+class CartItem(Base):
+    __tablename__ = 'cart_item'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    product_id = Column(Integer)
+    quantity = Column(Integer)
+
+class Negotiation(Base):
+    __tablename__ = 'negotiation'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('product.id'))
+    initial_price = Column(Float)
+    offered_price = Column(Float)
+    final_price = Column(Float)
+    status = Column(String(20))
+
+TODAY = date(2024, 3, 31)
+AGGREGATES = {
+    'shop_daily_sales': 'SELECT shop_id, day, orders, ROUND(revenue, 2) FROM shop_daily_sales '
+                        'WHERE orders != 0 OR revenue != 0 ORDER BY shop_id, day',
+    'shop_order_status': 'SELECT shop_id, status, orders FROM shop_order_status WHERE orders != 0 '
+                         'ORDER BY shop_id, status',
+    'product_sales': 'SELECT product_id, shop_id, units, ROUND(revenue, 2) FROM product_sales '
+                     'WHERE units != 0 ORDER BY product_id',
+    'product_negotiation_stats': 'SELECT product_id, shop_id, negotiations, accepted, ROUND(discount_total, 2) '
+                                 'FROM product_negotiation_stats WHERE negotiations != 0 ORDER BY product_id',
+}
+
+class AnalyticsTestCase(unittest.TestCase):
+    def setUp(self):
+        init_analytics(Flask(__name__))
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            ensure_analytics_tables(conn)
+        with Session(self.engine) as session:
+            session.add_all([
+                User(id=1),
+                Shop(id=1, name='Dhaka Fresh Mart', location_lat=23.7806, location_lng=90.4070),
+                Shop(id=2, name='Rahim Grocery', location_lat=23.7510, location_lng=90.3930),
+                Product(id=1, name='Miniket Rice 5kg', price=420.0, stock=100, shop_id=1),
+                Product(id=2, name='Hilsa Fish 1kg', price=1400.0, stock=100, shop_id=1),
+                Product(id=3, name='Masoor Dal 1kg', price=135.0, stock=100, shop_id=2),
+            ])
+            session.commit()
+
+    def tearDown(self):
+        # The hook is global to every Session; other tests map their own "order" tables
+        event.remove(Session, 'before_flush', _read_old_values)
+        event.remove(Session, 'after_flush', _update_aggregates)
+        self.engine.dispose()
+
+    def order(self, session, shop_id, days_ago, status, items):
+        created = datetime(2024, 3, 31, 12) - timedelta(days=days_ago)
+        order = Order(customer_id=1, shop_id=shop_id, status=status, created_at=created,
+                      total_amount=sum(quantity * price for _, quantity, price in items))
+        session.add(order)
+        session.flush()
+        session.add_all([OrderItem(order_id=order.id, product_id=product_id, quantity=quantity, price=price)
+                         for product_id, quantity, price in items])
+        return order
+
+    def snapshot(self):
+        with self.engine.connect() as conn:
+            return {table: conn.execute(text(sql)).fetchall() for table, sql in AGGREGATES.items()}
+
+    def test_writes_match_a_full_rebuild(self):
+        with Session(self.engine) as session:
+            first = self.order(session, 1, 0, 'pending', [(1, 2, 420.0), (2, 1, 1400.0)])
+            second = self.order(session, 1, 3, 'confirmed', [(1, 1, 420.0)])
+            third = self.order(session, 2, 3, 'completed', [(3, 4, 135.0)])
+            session.add_all([
+                Negotiation(id=1, product_id=1, initial_price=420.0, offered_price=380.0, status='pending'),
+                Negotiation(id=2, product_id=1, initial_price=420.0, offered_price=400.0, final_price=399.0,
+                            status='accepted'),
+                Negotiation(id=3, product_id=2, initial_price=1400.0, offered_price=1000.0, status='rejected'),
+            ])
+            session.commit()
+
+            # Status moves, a cancellation, a repriced item and a deleted order
+            first.status = 'confirmed'
+            second.status = 'cancelled'
+            item = session.query(OrderItem).filter_by(order_id=third.id).one()
+            item.quantity = 5
+            third.total_amount = 675.0
+            session.get(Negotiation, 1).status = 'accepted'
+            session.commit()
+            session.delete(session.get(OrderItem, item.id))
+            session.delete(third)
+            session.delete(session.get(Negotiation, 2))
+            session.commit()
+
+        # Raw checkout writes its rows itself
+        with Session(self.engine) as session:
+            session.add(CartItem(id=1, user_id=1, product_id=3, quantity=2))
+            session.commit()
+        with self.engine.begin() as conn:
+            place_orders(conn, 1, [1], 'Dhanmondi', 23.7465, 90.3760)
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental['shop_order_status'],
+                         [(1, 'cancelled', 1), (1, 'confirmed', 1), (2, 'pending', 1)])
+        self.assertEqual(incremental['product_sales'], [(1, 1, 2, 840.0), (2, 1, 1, 1400.0), (3, 2, 2, 270.0)])
+        self.assertEqual(incremental['product_negotiation_stats'], [(1, 1, 1, 1, 9.52), (2, 1, 1, 0, 0.0)])
+
+        with self.engine.begin() as conn:
+            rebuild_analytics(conn)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_dashboard_reads_aggregates_only(self):
+        with Session(self.engine) as session:
+            for n in range(200):
+                self.order(session, 1, n % 45, 'cancelled' if n % 10 == 0 else 'completed',
+                           [(1 + n % 2, 1 + n % 3, 420.0)])
+            session.add(Negotiation(product_id=2, initial_price=1400.0, offered_price=1260.0, status='accepted'))
+            session.commit()
+
+        with self.engine.connect() as conn:
+            with QueryCounter(self.engine) as counter:
+                figures = shop_analytics(conn, 1, days=30, today=TODAY)
+            direct = conn.execute(text(
+                "SELECT COUNT(*), SUM(total_amount) FROM \"order\" WHERE shop_id = 1 AND status != 'cancelled' "
+                "AND created_at >= '2024-03-02'"
+            )).one()
+
+        # One query per panel, however many orders the shop has taken
+        self.assertEqual(counter.count, 4)
+        self.assertEqual(len(figures['daily']), 30)
+        self.assertEqual((figures['daily'][0]['day'], figures['daily'][-1]['day']), ('2024-03-02', '2024-03-31'))
+        self.assertEqual((figures['orders'], figures['revenue']), (direct[0], round(direct[1], 2)))
+        self.assertEqual(figures['status_counts'],
+                         {'pending': 0, 'confirmed': 0, 'delivering': 0, 'completed': 180, 'cancelled': 20})
+        # Units are all-time, cancelled orders excluded
+        self.assertEqual([(product['product_id'], product['units']) for product in figures['top_products']],
+                         [(2, 200), (1, 160)])
+        self.assertEqual(figures['negotiations'], [{
+            'product_id': 2, 'name': 'Hilsa Fish 1kg', 'negotiations': 1,
+            'acceptance_rate': 100.0, 'average_discount': 10.0,
+        }])
+
+    def test_empty_days_are_zero_filled(self):
+        with Session(self.engine) as session:
+            self.order(session, 2, 1, 'pending', [(3, 1, 135.0)])
+            session.commit()
+        with self.engine.connect() as conn:
+            figures = shop_analytics(conn, 2, days=7, today=TODAY)
+            self.assertEqual([day['orders'] for day in figures['daily']], [0, 0, 0, 0, 0, 1, 0])
+            self.assertEqual(shop_analytics(conn, 1, days=7, today=TODAY)['revenue'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
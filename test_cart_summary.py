@@ -0,0 +1,157 @@
+import unittest
+from flask import Flask
+from sqlalchemy import Column, Float, ForeignKey, Integer, String, create_engine, event, text
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils import cart_summary
+from ecommerce.utils.cart_summary import build_summary, cart_counts, cart_state, init_cart_summary, summary_etag
+from ecommerce.utils.page_cache import page_cache
+from ecommerce.utils.query_counter import QueryCounter
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    address = Column(String(200))
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+    cart_version = Column(Integer, nullable=False, default=0)
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    price = Column(Float)
+    stock = Column(Integer)
+    image_url = Column(String(255))
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+
+class CartItem(Base):
+    __tablename__ = 'cart_item'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('user.id'))
+    product_id = Column(Integer, ForeignKey('product.id'))
+    quantity = Column(Integer)
+
+class CartSummaryTestCase(unittest.TestCase):
+    def setUp(self):
+        init_cart_summary(Flask(__name__))
+        page_cache.clear()
+        # The hooks are global to every Session; other tests map their own product tables
+        for name, hook in (('after_flush', cart_summary._bump_cart_versions),
+                           ('after_commit', cart_summary._drop_committed_counts),
+                           ('after_rollback', cart_summary._forget_rolled_back)):
+            self.addCleanup(event.remove, Session, name, hook)
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add_all([
+                User(id=1, address='House 12, Road 5, Dhanmondi', location_lat=23.7465, location_lng=90.3760),
+                User(id=2),
+                Shop(id=1, name='Dhaka Fresh Mart', location_lat=23.7806, location_lng=90.4070),
+                Shop(id=2, name='Rahim Grocery', location_lat=23.7510, location_lng=90.3930),
+                Product(id=1, name='Miniket Rice 5kg', price=420.0, stock=10, shop_id=1),
+                Product(id=2, name='Hilsa Fish 1kg', price=1400.0, stock=5, shop_id=1),
+                Product(id=3, name='Masoor Dal 1kg', price=135.0, stock=20, shop_id=2),
+            ])
+            session.commit()
+
+    def versions(self):
+        with self.engine.connect() as conn:
+            return [cart_state(conn, user_id)[0] for user_id in (1, 2)]
+
+    def counts(self, user_id=1):
+        with self.engine.connect() as conn:
+            return cart_counts(conn, user_id)
+
+    def test_summary_from_one_query(self):
+        with Session(self.engine) as session:
+            session.add_all([
+                CartItem(user_id=1, product_id=1, quantity=2),
+                CartItem(user_id=1, product_id=2, quantity=1),
+                CartItem(user_id=1, product_id=3, quantity=3),
+            ])
+            session.commit()
+
+        with self.engine.connect() as conn:
+            state = cart_state(conn, 1)
+            with QueryCounter(self.engine) as counter:
+                summary = build_summary(conn, 1, state)
+        self.assertEqual(counter.count, 1)
+        self.assertEqual((summary['count'], summary['quantity']), (3, 6))
+        self.assertEqual(summary['subtotal'], 2645.0)
+        self.assertEqual(summary['address'], 'House 12, Road 5, Dhanmondi')
+        self.assertEqual([(shop['shop_name'], shop['subtotal']) for shop in summary['shops']],
+                         [('Dhaka Fresh Mart', 2240.0), ('Rahim Grocery', 405.0)])
+        self.assertEqual(summary['shipping_fee'], round(sum(shop['fee'] for shop in summary['shops']), 2))
+        self.assertEqual(summary['total'], round(summary['subtotal'] + summary['shipping_fee'], 2))
+
+    def test_cart_writes_bump_version_and_counts(self):
+        self.assertEqual(self.counts(), (0, 0))
+        with Session(self.engine) as session:
+            session.add(CartItem(user_id=1, product_id=1, quantity=2))
+            session.commit()
+        self.assertEqual(self.versions(), [1, 0])
+        self.assertEqual(self.counts(), (1, 2))
+
+        with Session(self.engine) as session:
+            session.get(CartItem, 1).quantity = 5
+            session.add(CartItem(user_id=1, product_id=3, quantity=1))
+            session.flush()
+            session.rollback()
+        self.assertEqual(self.versions(), [1, 0])
+        self.assertEqual(self.counts(), (1, 2))
+
+        with Session(self.engine) as session:
+            session.delete(session.get(CartItem, 1))
+            session.commit()
+        self.assertEqual(self.versions(), [2, 0])
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_uncached_counts_see_other_workers_writes(self):
+        self.assertEqual(self.counts(), (0, 0))
+        # As another worker would: the write never invalidates this process's cache
+        with self.engine.begin() as conn:
+            conn.execute(text('INSERT INTO cart_item (user_id, product_id, quantity) VALUES (1, 1, 2)'))
+        self.assertEqual(self.counts(), (0, 0))
+        with self.engine.connect() as conn:
+            self.assertEqual(cart_counts(conn, 1, cached=False), (1, 2))
+
+    def test_catalog_changes_bump_carts_holding_them(self):
+        with Session(self.engine) as session:
+            session.add_all([CartItem(user_id=1, product_id=1, quantity=1),
+                             CartItem(user_id=2, product_id=3, quantity=1)])
+            session.commit()
+        with self.engine.connect() as conn:
+            etag = summary_etag(cart_state(conn, 1))
+
+        with Session(self.engine) as session:
+            session.get(Product, 1).stock = 3  # not shown in the summary
+            session.commit()
+        self.assertEqual(self.versions(), [1, 1])
+
+        with Session(self.engine) as session:
+            session.get(Product, 1).price = 450.0
+            session.commit()
+        self.assertEqual(self.versions(), [2, 1])
+
+        with Session(self.engine) as session:
+            session.get(Shop, 2).location_lat = 23.7600
+            session.commit()
+        self.assertEqual(self.versions(), [2, 2])
+
+        with Session(self.engine) as session:
+            session.get(User, 1).address = 'Flat 3B, Gulshan 2'
+            session.commit()
+        with self.engine.connect() as conn:
+            self.assertNotEqual(summary_etag(cart_state(conn, 1)), etag)
+
+if __name__ == '__main__':
+    unittest.main()
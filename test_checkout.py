@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+from threading import Thread
+from sqlalchemy import create_engine, text
+from ecommerce.utils.analytics import ensure_analytics_tables
+from ecommerce.utils.checkout import OutOfStock, checkout
+from ecommerce.utils.db_engine import apply_sqlite_pragmas, engine_options
+
+STRESS_THREADS = 8
+STRESS_CUSTOMERS = 64
+STOCK = 100
+
+SCHEMA = [
+    '''CREATE TABLE "user" (id INTEGER PRIMARY KEY, address VARCHAR(200), location_lat FLOAT,
+       location_lng FLOAT, cart_version INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TABLE shop (id INTEGER PRIMARY KEY, name VARCHAR(100), location_lat FLOAT, location_lng FLOAT)''',
+    '''CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR(100), price FLOAT, stock INTEGER,
+       shop_id INTEGER)''',
+    '''CREATE TABLE "order" (id INTEGER PRIMARY KEY, customer_id INTEGER, shop_id INTEGER, status VARCHAR(20),
+       total_amount FLOAT, delivery_fee FLOAT, delivery_address VARCHAR(200), delivery_lat FLOAT,
+       delivery_lng FLOAT, special_instructions TEXT, created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE order_item (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER, quantity INTEGER,
+       price FLOAT)''',
+    '''CREATE TABLE cart_item (id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, quantity INTEGER)''',
+    'CREATE INDEX ix_cart_item_user_product ON cart_item (user_id, product_id)',
+]
+
+DHANMONDI = (23.7465, 90.3760)
+
+class CheckoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        uri = f'sqlite:///{self.db_path}'
+        self.engine = create_engine(uri, **engine_options(uri, {}))
+        apply_sqlite_pragmas(self.engine, {})
+        with self.engine.begin() as conn:
+            for statement in SCHEMA:
+                conn.execute(text(statement))
+            ensure_analytics_tables(conn)
+            conn.execute(text('INSERT INTO shop VALUES (1, :name, 23.7806, 90.4070), (2, :other, 23.7510, 90.3930)'),
+                         {'name': 'Dhaka Fresh Mart', 'other': 'Rahim Grocery'})
+            conn.execute(text('INSERT INTO product VALUES (:id, :name, :price, :stock, :shop_id)'), [
+                {'id': 1, 'name': 'Miniket Rice 5kg', 'price': 420.0, 'stock': STOCK, 'shop_id': 1},
+                {'id': 2, 'name': 'Hilsa Fish 1kg', 'price': 1400.0, 'stock': STOCK, 'shop_id': 1},
+                {'id': 3, 'name': 'Masoor Dal 1kg', 'price': 135.0, 'stock': STOCK, 'shop_id': 2},
+            ])
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def fill_cart(self, user_id, items):
+        with self.engine.begin() as conn:
+            conn.execute(text('INSERT OR IGNORE INTO "user" (id, address) VALUES (:id, :address)'),
+                         {'id': user_id, 'address': 'House 12, Road 5, Dhanmondi'})
+            return [conn.execute(text(
+                'INSERT INTO cart_item (user_id, product_id, quantity) VALUES (:user_id, :product_id, :quantity) '
+                'RETURNING id'
+            ), {'user_id': user_id, 'product_id': product_id, 'quantity': quantity}).scalar_one()
+                for product_id, quantity in items]
+
+    def scalar(self, sql, **params):
+        with self.engine.connect() as conn:
+            return conn.execute(text(sql), params).scalar()
+
+    def test_one_order_per_shop_with_totals(self):
+        item_ids = self.fill_cart(1, [(1, 2), (2, 1), (3, 4)])
+        orders = checkout(self.engine, 1, item_ids, 'House 12, Road 5, Dhanmondi', *DHANMONDI)
+
+        self.assertEqual([(order.shop_id, order.total_amount) for order in orders], [(1, 2240.0), (2, 540.0)])
+        self.assertTrue(all(order.delivery_fee >= 5.0 for order in orders))
+        self.assertEqual(self.scalar('SELECT total_amount FROM "order" WHERE id = :id', id=orders[0].id), 2240.0)
+        self.assertEqual(self.scalar('SELECT SUM(quantity * price) FROM order_item'), 2780.0)
+        self.assertEqual(self.scalar('SELECT stock FROM product WHERE id = 3'), STOCK - 4)
+        self.assertEqual(self.scalar('SELECT COUNT(*) FROM cart_item'), 0)
+        self.assertEqual(self.scalar('SELECT cart_version FROM "user" WHERE id = 1'), 1)
+
+        # A double-submitted checkout finds the cart already claimed
+        with self.assertRaises(ValueError):
+            checkout(self.engine, 1, item_ids, 'House 12, Road 5, Dhanmondi', *DHANMONDI)
+        self.assertEqual(self.scalar('SELECT COUNT(*) FROM "order"'), 2)
+
+    def test_out_of_stock_rolls_back_everything(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('UPDATE product SET stock = 1 WHERE id = 2'))
+        item_ids = self.fill_cart(1, [(1, 1), (2, 2)])
+        with self.assertRaises(OutOfStock) as raised:
+            checkout(self.engine, 1, item_ids, 'House 12, Road 5, Dhanmondi', *DHANMONDI)
+        self.assertEqual((raised.exception.product_id, raised.exception.available), (2, 1))
+        self.assertEqual(self.scalar('SELECT stock FROM product WHERE id = 1'), STOCK)
+        self.assertEqual(self.scalar('SELECT COUNT(*) FROM cart_item'), 2)
+        self.assertEqual(self.scalar('SELECT COUNT(*) FROM "order"'), 0)
+
+    def test_concurrent_checkouts_never_oversell(self):
+        # Every customer wants 1-3 units of the same popular product: far more than the stock
+        carts = {user_id: self.fill_cart(user_id, [(1, 1 + user_id % 3), (3, 1)])
+                 for user_id in range(1, STRESS_CUSTOMERS + 1)}
+        placed, sold_out, errors = [], [], []
+
+        def customers(thread):
+            for user_id in range(1 + thread, STRESS_CUSTOMERS + 1, STRESS_THREADS):
+                try:
+                    checkout(self.engine, user_id, carts[user_id], 'Dhanmondi', *DHANMONDI)
+                    placed.append(user_id)
+                except OutOfStock:
+                    sold_out.append(user_id)
+                except Exception as e:
+                    errors.append(repr(e))
+
+        threads = [Thread(target=customers, args=(thread,)) for thread in range(STRESS_THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(placed and sold_out)
+        sold = self.scalar('SELECT SUM(quantity) FROM order_item WHERE product_id = 1')
+        stock = self.scalar('SELECT stock FROM product WHERE id = 1')
+        self.assertGreaterEqual(stock, 0)
+        self.assertEqual(sold + stock, STOCK)
+        self.assertEqual(sold, sum(1 + user_id % 3 for user_id in placed))
+        # Customers who missed out keep their carts
+        self.assertEqual(self.scalar('SELECT COUNT(*) FROM cart_item'), 2 * len(sold_out))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from threading import Thread
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from ecommerce.utils.db_engine import apply_sqlite_pragmas, engine_options
+
+WORKERS = 4
+THREADS_PER_WORKER = 4
+ROUNDS = 40
+
+def _make_engine(path, config=None):
+    uri = f'sqlite:///{path}'
+    engine = create_engine(uri, **engine_options(uri, config or {}))
+    apply_sqlite_pragmas(engine, config or {})
+    return engine
+
+def _worker(path, worker, results, config=None):
+    """One gunicorn-style worker process: its own engine and pool, several request threads"""
+    engine = _make_engine(path, config)
+    errors = []
+
+    def requests(thread):
+        for n in range(ROUNDS):
+            try:
+                if n % 2:
+                    with engine.connect() as conn:
+                        conn.execute(text('SELECT COUNT(*), MAX(total) FROM orders')).fetchone()
+                        conn.execute(text('SELECT hits FROM counter WHERE id = 1')).scalar()
+                else:
+                    with engine.begin() as conn:
+                        conn.execute(text('INSERT INTO orders (worker, total) VALUES (:worker, :total)'),
+                                     {'worker': worker, 'total': thread * ROUNDS + n})
+                        conn.execute(text('UPDATE counter SET hits = hits + 1 WHERE id = 1'))
+            except OperationalError as e:
+                errors.append(str(e.orig))
+
+    threads = [Thread(target=requests, args=(thread,)) for thread in range(THREADS_PER_WORKER)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    results.put(errors)
+
+class EngineOptionsTestCase(unittest.TestCase):
+    def test_postgres_pool_and_statement_timeout(self):
+        options = engine_options('postgresql://shop@db/ecommerce', {'DB_POOL_SIZE': 5, 'DB_STATEMENT_TIMEOUT': 2000})
+        self.assertEqual(options['pool_size'], 5)
+        self.assertTrue(options['pool_pre_ping'])
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=2000'})
+
+    def test_sqlite_has_no_pool_sizing(self):
+        options = engine_options('sqlite:///ecommerce.db', {'SQLITE_BUSY_TIMEOUT': 2500})
+        self.assertNotIn('pool_size', options)
+        self.assertEqual(options['connect_args']['timeout'], 2.5)
+
+class SQLiteProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.engine = _make_engine(self.db_path)
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE orders (id INTEGER PRIMARY KEY, worker INTEGER, total FLOAT)'))
+            conn.execute(text('CREATE TABLE counter (id INTEGER PRIMARY KEY, hits INTEGER NOT NULL)'))
+            conn.execute(text('INSERT INTO counter VALUES (1, 0)'))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.close(self.db_fd)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.unlink(self.db_path + suffix)
+
+    def test_pragmas_applied_per_connection(self):
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('PRAGMA journal_mode')).scalar(), 'wal')
+            self.assertEqual(conn.execute(text('PRAGMA busy_timeout')).scalar(), 5000)
+            self.assertEqual(conn.execute(text('PRAGMA synchronous')).scalar(), 1)  # NORMAL
+            self.assertEqual(conn.execute(text('PRAGMA cache_size')).scalar(), -20000)
+
+    def run_workers(self, config=None):
+        self.engine.dispose()
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [
+            context.Process(target=_worker, args=(self.db_path, worker, results, config))
+            for worker in range(WORKERS)
+        ]
+        for worker in workers:
+            worker.start()
+        errors = [error for _ in workers for error in results.get(timeout=60)]
+        for worker in workers:
+            worker.join()
+        return errors
+
+    def test_concurrent_workers_never_lock(self):
+        errors = self.run_workers()
+        self.assertEqual(errors, [])
+        writes = WORKERS * THREADS_PER_WORKER * ROUNDS // 2
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM orders')).scalar(), writes)
+            self.assertEqual(conn.execute(text('SELECT hits FROM counter')).scalar(), writes)
+
+    def test_workers_lock_without_busy_timeout(self):
+        # Negative control: the same load fails fast once writers stop waiting for the lock
+        errors = self.run_workers({'SQLITE_BUSY_TIMEOUT': 0})
+        self.assertTrue(errors)
+        self.assertTrue(all('database is locked' in error for error in errors), errors[:3])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from types import SimpleNamespace
+from ecommerce.utils.ai.negotiation_bot import DeliveryNegotiationBot
+from ecommerce.utils.delivery_quote import QUANTUM_DEG, QuoteCache, fee_bounds, quote_delivery
+from ecommerce.utils.distance import calculate_distance
+
+SHOP = (23.8103, 90.4125)
+
+class DeliveryQuoteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = QuoteCache()
+
+    def test_quote_uses_snapped_point(self):
+        quote = quote_delivery(1, *SHOP, 23.75012, 90.39049, cache=self.cache)
+        distance = calculate_distance(*SHOP, 23750 * QUANTUM_DEG, 90390 * QUANTUM_DEG)
+        self.assertEqual(quote.distance_km, distance)
+        self.assertEqual((quote.base_fee, quote.min_fee), fee_bounds(distance))
+
+    def test_neighbours_share_cached_quote(self):
+        first = quote_delivery(1, *SHOP, 23.75012, 90.39049, cache=self.cache)
+        second = quote_delivery(1, *SHOP, 23.75031, 90.38981, cache=self.cache)
+        self.assertIs(first, second)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_moved_shop_is_requoted(self):
+        first = quote_delivery(1, *SHOP, 23.75, 90.39, cache=self.cache)
+        moved = quote_delivery(1, 23.70, 90.41, 23.75, 90.39, cache=self.cache)
+        self.assertNotEqual(first.distance_km, moved.distance_km)
+
+        self.cache.invalidate_shop(1)
+        self.assertEqual(len(self.cache._entries), 0)
+
+    def test_missing_coordinates_use_default_fees(self):
+        quote = quote_delivery(1, *SHOP, None, None, cache=self.cache)
+        self.assertEqual((quote.base_fee, quote.min_fee), (5.00, 3.00))
+
+    def test_negotiation_bot_uses_quote(self):
+        order = SimpleNamespace(delivery_lat=23.75012, delivery_lng=90.39049,
+                                shop=SimpleNamespace(id=1, location_lat=SHOP[0], location_lng=SHOP[1]))
+        bot = DeliveryNegotiationBot(order)
+        quote = quote_delivery(1, *SHOP, 23.75012, 90.39049)
+        self.assertEqual((bot.base_fee, bot.min_fee), (quote.base_fee, quote.min_fee))
+
+if __name__ == '__main__':
+    unittest.main()
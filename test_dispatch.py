@@ -0,0 +1,129 @@
+import itertools
+import os
+import tempfile
+import unittest
+import numpy as np
+from sqlalchemy import create_engine, text
+from ecommerce.utils.analytics import ensure_analytics_tables
+from ecommerce.utils.dispatch import Assignment, commit_dispatch, dispatch_orders, greedy_assign, optimal_assign
+
+def brute_force_cost(distances, capacity):
+    """Lowest total distance over all assignments that place every order"""
+    slots = [courier for courier, count in enumerate(capacity) for _ in range(count)]
+    best = np.inf
+    for chosen in itertools.permutations(slots, distances.shape[0]):
+        best = min(best, sum(distances[i, j] for i, j in enumerate(chosen)))
+    return best
+
+class AssignmentTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(5)
+
+    def test_greedy_respects_capacity_and_distance(self):
+        distances = self.rng.uniform(0, 20, (400, 60))
+        capacity = self.rng.integers(0, 4, 60)
+        result = greedy_assign(distances, capacity, max_distance=8)
+        counts = np.bincount(result[result >= 0], minlength=60)
+        self.assertTrue(np.all(counts <= capacity))
+        assigned = np.nonzero(result >= 0)[0]
+        self.assertTrue(np.all(distances[assigned, result[assigned]] <= 8))
+        # Whatever is left over has no courier within range with capacity
+        spare = capacity - counts
+        for order in np.nonzero(result < 0)[0]:
+            self.assertFalse(np.any((distances[order] <= 8) & (spare > 0)))
+
+    def test_greedy_takes_closest_pairs_first(self):
+        distances = np.array([[1.0, 5.0], [2.0, 9.0]])
+        self.assertEqual(greedy_assign(distances, [1, 1]).tolist(), [0, 1])
+
+    def test_overloaded_couriers_count_as_full(self):
+        # A courier already carrying more than the limit has negative capacity
+        distances = np.array([[1.0, 5.0], [2.0, 6.0], [3.0, 7.0]])
+        for capacity in ([-3, 3], [-1, 3]):
+            self.assertEqual(greedy_assign(distances, capacity, 10).tolist(), [1, 1, 1])
+            self.assertEqual(optimal_assign(distances, capacity, 10).tolist(), [1, 1, 1])
+
+    def test_optimal_matches_brute_force(self):
+        for _ in range(20):
+            distances = self.rng.uniform(0, 10, (5, 3))
+            capacity = self.rng.integers(1, 3, 3)
+            while capacity.sum() < 5:
+                capacity[self.rng.integers(0, 3)] += 1
+            result = optimal_assign(distances, capacity)
+            self.assertTrue(np.all(result >= 0))
+            self.assertTrue(np.all(np.bincount(result, minlength=3) <= capacity))
+            self.assertAlmostEqual(distances[np.arange(5), result].sum(), brute_force_cost(distances, capacity))
+
+    def test_optimal_beats_greedy_and_handles_shortage(self):
+        distances = self.rng.uniform(0, 10, (120, 40))
+        capacity = np.full(40, 2)
+        greedy = greedy_assign(distances, capacity)
+        optimal = optimal_assign(distances, capacity)
+        self.assertEqual((optimal >= 0).sum(), 80)
+        self.assertLessEqual(distances[optimal >= 0, optimal[optimal >= 0]].sum(),
+                             distances[greedy >= 0, greedy[greedy >= 0]].sum())
+
+class DispatchOrdersTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE shop (id INTEGER PRIMARY KEY, location_lat FLOAT, location_lng FLOAT)'))
+            conn.execute(text(
+                'CREATE TABLE "user" (id INTEGER PRIMARY KEY, role VARCHAR(20), is_active BOOLEAN, '
+                'location_lat FLOAT, location_lng FLOAT)'
+            ))
+            conn.execute(text(
+                'CREATE TABLE "order" (id INTEGER PRIMARY KEY, shop_id INTEGER, delivery_person_id INTEGER, '
+                'status VARCHAR(20), updated_at DATETIME)'
+            ))
+            ensure_analytics_tables(conn)
+            conn.execute(text('INSERT INTO shop VALUES (1, 23.81, 90.41), (2, 23.75, 90.39)'))
+            conn.execute(text(
+                "INSERT INTO \"user\" VALUES (10, 'delivery', 1, 23.811, 90.411), "
+                "(11, 'delivery', 1, 23.751, 90.391), (12, 'delivery', 0, 23.81, 90.41), "
+                "(13, 'customer', 1, 23.81, 90.41)"
+            ))
+            # Courier 10 already carries two deliveries
+            conn.execute(text(
+                "INSERT INTO \"order\" (id, shop_id, delivery_person_id, status) VALUES "
+                "(1, 1, 10, 'delivering'), (2, 1, 10, 'delivering'), "
+                "(3, 1, NULL, 'confirmed'), (4, 1, NULL, 'confirmed'), (5, 2, NULL, 'confirmed'), "
+                "(6, 2, NULL, 'pending')"
+            ))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_dispatch_commits_in_bulk(self):
+        with self.engine.begin() as conn:
+            assignments = dispatch_orders(conn)
+        self.assertEqual(
+            sorted((a.order_id, a.courier_id) for a in assignments),
+            [(3, 10), (4, 11), (5, 11)]
+        )
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                'SELECT id, delivery_person_id, status FROM "order" WHERE id >= 3 ORDER BY id'
+            )).fetchall()
+        self.assertEqual([tuple(row) for row in rows], [
+            (3, 10, 'delivering'), (4, 11, 'delivering'), (5, 11, 'delivering'), (6, None, 'pending')
+        ])
+
+    def test_orders_taken_meanwhile_are_not_reported(self):
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE \"order\" SET delivery_person_id = 11, status = 'delivering' WHERE id = 4"))
+            applied = commit_dispatch(conn, [Assignment(3, 10, 0.1), Assignment(4, 10, 0.2)])
+        self.assertEqual(applied, [Assignment(3, 10, 0.1)])
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT delivery_person_id FROM "order" WHERE id = 4')).scalar(), 11)
+
+    def test_zone_limits_the_batch(self):
+        with self.engine.begin() as conn:
+            assignments = dispatch_orders(conn, zone=(23.75, 90.39, 2))
+        self.assertEqual([(a.order_id, a.courier_id) for a in assignments], [(5, 11)])
+
+if __name__ == '__main__':
+    unittest.main()
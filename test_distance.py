@@ -0,0 +1,47 @@
+import unittest
+import numpy as np
+from ecommerce.utils.distance import (
+    calculate_distance, calculate_distances, distance_matrix, rank_by_distance,
+    get_formatted_distance, estimate_travel_time
+)
+
+class DistanceTestCase(unittest.TestCase):
+    def setUp(self):
+        # Points scattered around Dhaka
+        rng = np.random.default_rng(42)
+        self.lats = 23.78 + rng.uniform(-0.3, 0.3, 500)
+        self.lngs = 90.41 + rng.uniform(-0.3, 0.3, 500)
+        self.origin = (23.7808, 90.4093)
+
+    def test_one_to_many_matches_scalar(self):
+        distances = calculate_distances(*self.origin, self.lats, self.lngs)
+        expected = [calculate_distance(*self.origin, lat, lng)
+                    for lat, lng in zip(self.lats, self.lngs)]
+        np.testing.assert_allclose(distances, expected, rtol=1e-12)
+
+    def test_matrix_matches_scalar(self):
+        matrix = distance_matrix(self.lats[:20], self.lngs[:20], self.lats[20:50], self.lngs[20:50])
+        self.assertEqual(matrix.shape, (20, 30))
+        self.assertAlmostEqual(
+            matrix[3, 7],
+            calculate_distance(self.lats[3], self.lngs[3], self.lats[27], self.lngs[27]),
+            places=9
+        )
+
+    def test_rank_by_distance(self):
+        distances = calculate_distances(*self.origin, self.lats, self.lngs)
+        indices, ranked = rank_by_distance(*self.origin, self.lats, self.lngs, max_distance=10, limit=15)
+        self.assertLessEqual(len(indices), 15)
+        self.assertTrue(np.all(np.diff(ranked) >= 0))
+        self.assertTrue(np.all(ranked <= 10))
+        np.testing.assert_array_equal(indices, np.argsort(distances, kind='stable')[:len(indices)])
+
+    def test_array_formatting_and_travel_time(self):
+        distances = np.array([0.4, 1.25, 7.5, 22.0])
+        self.assertEqual(get_formatted_distance(distances),
+                         [get_formatted_distance(float(d)) for d in distances])
+        self.assertEqual(estimate_travel_time(distances, 'bike').tolist(),
+                         [estimate_travel_time(float(d), 'bike') for d in distances])
+
+if __name__ == '__main__':
+    unittest.main()
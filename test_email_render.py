@@ -0,0 +1,48 @@
+import unittest
+from types import SimpleNamespace
+from flask import Flask, render_template
+from jinja2 import DictLoader
+from ecommerce.utils.email_render import init_email_templates, render_email, render_fanout
+
+class EmailRenderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.jinja_loader = DictLoader({
+            'email/general_notification.html':
+                '<p>Hello {{ recipient.username }} ({{ recipient.email }}),</p><div>{{ message }}</div>',
+            'email/admin_order_notification.html': '<h3>Order #{{ order_id }}</h3>',
+        })
+        init_email_templates(self.app)
+        self.context = self.app.test_request_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_templates_compiled_at_startup(self):
+        self.assertEqual(
+            sorted(self.app.extensions['email_templates']),
+            ['email/admin_order_notification.html', 'email/general_notification.html']
+        )
+
+    def test_fanout_matches_per_recipient_render(self):
+        recipients = [
+            SimpleNamespace(username='rahim', email='rahim@test.com'),
+            SimpleNamespace(username='<karim & co>', email='karim@test.com'),
+        ]
+        expected = [
+            render_template('email/general_notification.html', recipient=recipient, message='Rain <alert>')
+            for recipient in recipients
+        ]
+        self.assertEqual(
+            render_fanout('email/general_notification.html', recipients, message='Rain <alert>'),
+            expected
+        )
+        self.assertIn('&lt;karim &amp; co&gt;', expected[1])
+
+    def test_shared_body_without_recipient_fields(self):
+        bodies = render_fanout('email/admin_order_notification.html', [object(), object()], order_id=7)
+        self.assertEqual(bodies, [render_email('email/admin_order_notification.html', order_id=7)] * 2)
+
+if __name__ == '__main__':
+    unittest.main()
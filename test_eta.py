@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from sqlalchemy import create_engine, event, text
+from ecommerce.utils import spatial_index
+from ecommerce.utils.distance import calculate_distance
+from ecommerce.utils.eta import CourierLoadCache, estimate_delivery_times
+
+SHOPS = {1: (23.8103, 90.4125), 2: (23.7461, 90.3742), 3: (0.0, 90.40)}
+
+def single_order_estimate(order, active):
+    """notifications.estimate_delivery_time, with the COUNT query's result passed in"""
+    shop_lat, shop_lng = SHOPS[order.shop_id]
+    if not (order.delivery_lat and order.delivery_lng and shop_lat and shop_lng):
+        return 60
+    distance = calculate_distance(shop_lat, shop_lng, order.delivery_lat, order.delivery_lng)
+    base_time = 15 + (distance * 3)
+    base_time *= 1.2
+    if order.delivery_person_id and active > 0:
+        base_time += active * 10
+    return round(base_time)
+
+class EtaTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        rng = np.random.default_rng(3)
+        self.loads = {10: 0, 11: 1, 12: 3}
+        with self.engine.begin() as conn:
+            conn.execute(text('CREATE TABLE shop (id INTEGER PRIMARY KEY, location_lat FLOAT, location_lng FLOAT)'))
+            conn.execute(text(
+                'CREATE TABLE "order" (id INTEGER PRIMARY KEY, delivery_person_id INTEGER, status VARCHAR(20))'
+            ))
+            conn.execute(text('INSERT INTO shop VALUES (:id, :lat, :lng)'),
+                         [{'id': shop_id, 'lat': lat, 'lng': lng} for shop_id, (lat, lng) in SHOPS.items()])
+            conn.execute(text("INSERT INTO \"order\" (delivery_person_id, status) VALUES (:courier, 'delivering')"),
+                         [{'courier': courier} for courier, count in self.loads.items() for _ in range(count)])
+
+        # Shop positions come from the in-process index when it is loaded
+        self.addCleanup(setattr, spatial_index, '_loaded', spatial_index._loaded)
+        spatial_index.shop_index.clear()
+        spatial_index.shop_index.update(1, *SHOPS[1])
+        spatial_index._loaded = True
+
+        self.orders = [
+            SimpleNamespace(
+                shop_id=int(rng.integers(1, 4)),
+                delivery_lat=23.78 + rng.uniform(-0.1, 0.1),
+                delivery_lng=90.40 + rng.uniform(-0.1, 0.1),
+                delivery_person_id=[None, 10, 11, 12][i % 4]
+            )
+            for i in range(50)
+        ]
+        self.orders[0].delivery_lat = None
+
+    def tearDown(self):
+        spatial_index.shop_index.clear()
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def test_matches_single_order_estimates(self):
+        with self.engine.connect() as conn:
+            estimates = estimate_delivery_times(self.orders, conn, cache=None)
+        expected = [
+            single_order_estimate(order, self.loads.get(order.delivery_person_id, 0))
+            for order in self.orders
+        ]
+        self.assertEqual(estimates, expected)
+
+    def test_fifty_orders_take_two_queries(self):
+        statements = []
+        event.listen(self.engine, 'before_cursor_execute', lambda *args: statements.append(args[2]))
+        cache = CourierLoadCache()
+        with self.engine.connect() as conn:
+            estimate_delivery_times(self.orders, conn, cache=cache)
+            # One for shops missing from the index, one GROUP BY for courier loads
+            self.assertEqual(len(statements), 2)
+            estimate_delivery_times(self.orders, conn, cache=cache)
+            self.assertEqual(len(statements), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from sqlalchemy import Column, Float, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base, relationship
+from ecommerce.utils.loading import loading_options, with_profile
+from ecommerce.utils.query_counter import QueryCounter, assert_max_queries
+
+Base = declarative_base()
+
+# The relationships the real models expose, reduced to what the templates touch
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    username = Column(String(80))
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    owner_id = Column(Integer, ForeignKey('user.id'))
+    owner = relationship(User)
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+    shop = relationship(Shop)
+
+class Order(Base):
+    __tablename__ = 'order'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('user.id'))
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+    delivery_person_id = Column(Integer, ForeignKey('user.id'))
+    customer = relationship(User, foreign_keys=[customer_id])
+    delivery_person = relationship(User, foreign_keys=[delivery_person_id])
+    shop = relationship(Shop)
+    items = relationship('OrderItem')
+
+class OrderItem(Base):
+    __tablename__ = 'order_item'
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, ForeignKey('order.id'))
+    product_id = Column(Integer, ForeignKey('product.id'))
+    price = Column(Float)
+    product = relationship(Product)
+
+class Negotiation(Base):
+    __tablename__ = 'negotiation'
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey('product.id'))
+    customer_id = Column(Integer, ForeignKey('user.id'))
+    product = relationship(Product)
+    customer = relationship(User)
+
+def render_order_email(order):
+    """Every attribute the order emails read"""
+    return [order.shop.owner.username, order.customer.username, order.delivery_person.username] + [
+        item.product.name for item in order.items
+    ]
+
+class LoadingProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        users = [User(id=n, username=f'user{n}') for n in range(1, 21)]
+        shops = [Shop(id=n, name=f'Shop {n}', owner=users[n]) for n in range(1, 6)]
+        products = [Product(id=n, name=f'Product {n}', shop=shops[n % 5]) for n in range(1, 31)]
+        orders = [
+            Order(id=n, customer=users[n % 7], delivery_person=users[10 + n % 5], shop=shops[n % 5],
+                  items=[OrderItem(product=products[(n + k) % 30], price=10.0) for k in range(3)])
+            for n in range(1, 21)
+        ]
+        negotiations = [Negotiation(id=n, product=products[n], customer=users[n % 9]) for n in range(1, 21)]
+        self.session.add_all(users + shops + products + orders + negotiations)
+        self.session.commit()
+        self.session.expunge_all()
+
+    def tearDown(self):
+        self.session.close()
+
+    def test_lazy_loading_trips_the_ceiling(self):
+        with self.assertRaises(AssertionError) as raised:
+            with assert_max_queries(self.engine, 5):
+                for order in self.session.query(Order):
+                    render_order_email(order)
+        self.assertIn('expected at most 5', str(raised.exception))
+
+    def test_order_email_profile(self):
+        with assert_max_queries(self.engine, 2) as counter:
+            orders = self.session.query(Order).options(*loading_options(Order, 'order_email')).all()
+            rendered = [render_order_email(order) for order in orders]
+        self.assertEqual(len(rendered), 20)
+        self.assertEqual(counter.count, 2)  # orders with joins, then items with their products
+
+    def test_negotiation_list_profile(self):
+        with QueryCounter(self.engine) as counter:
+            names = [(n.product.name, n.product.shop.name, n.customer.username)
+                     for n in with_profile(self.session.query(Negotiation), 'negotiation_list')]
+        self.assertEqual(len(names), 20)
+        self.assertEqual(counter.count, 1)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            loading_options(Order, 'everything')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, text
+from ecommerce.utils.location_ingest import LocationIngestor, parse_fix
+
+COURIERS = 1000
+LOAD_SECONDS = 3.0
+FLUSH_INTERVAL = 0.5
+
+class LocationIngestLoadTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        with self.engine.begin() as conn:
+            conn.execute(text('''
+                CREATE TABLE user (
+                    id INTEGER PRIMARY KEY, location_lat FLOAT, location_lng FLOAT,
+                    geo_cell VARCHAR(32), updated_at DATETIME, location_recorded_at DATETIME
+                )
+            '''))
+            conn.execute(text('''
+                CREATE TABLE courier_position_history (
+                    id INTEGER PRIMARY KEY, courier_id INTEGER NOT NULL,
+                    lat FLOAT NOT NULL, lng FLOAT NOT NULL, recorded_at DATETIME NOT NULL
+                )
+            '''))
+            conn.execute(text('INSERT INTO user (id) VALUES (:id)'),
+                         [{'id': i} for i in range(1, COURIERS + 1)])
+
+        self.commits = 0
+
+        @event.listens_for(self.engine, 'commit')
+        def count_commit(conn):
+            self.commits += 1
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    def test_sustained_ingest_with_bounded_commits(self):
+        ingestor = LocationIngestor(self.engine, flush_interval=FLUSH_INTERVAL)
+        ingestor.start()
+        deadline = time.monotonic() + LOAD_SECONDS
+        last_fix = {}
+        lock = threading.Lock()
+
+        def phone_fleet(seed):
+            rng = random.Random(seed)
+            base = datetime(2026, 1, 1)
+            tick = 0
+            while time.monotonic() < deadline:
+                tick += 1
+                courier_id = rng.randint(1, COURIERS)
+                lat = 23.78 + rng.uniform(-0.2, 0.2)
+                lng = 90.41 + rng.uniform(-0.2, 0.2)
+                recorded_at = base + timedelta(microseconds=tick * 4 + seed)
+                if ingestor.submit(courier_id, lat, lng, recorded_at):
+                    with lock:
+                        previous = last_fix.get(courier_id)
+                        if not previous or previous[2] < recorded_at:
+                            last_fix[courier_id] = (lat, lng, recorded_at)
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=phone_fleet, args=(seed,)) for seed in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        ingestor.stop()
+        elapsed = time.monotonic() - started
+
+        # Throughput is reported by bench_location_ingest.py
+        self.assertGreater(ingestor.fixes_written, 0)
+        # One commit per flush interval, plus the final flush on stop
+        self.assertLessEqual(self.commits, elapsed / FLUSH_INTERVAL + 2)
+
+        with self.engine.connect() as conn:
+            stored = {
+                row.id: (row.location_lat, row.location_lng)
+                for row in conn.execute(text('SELECT id, location_lat, location_lng FROM user'))
+            }
+        for courier_id, (lat, lng, _) in last_fix.items():
+            self.assertEqual(stored[courier_id], (lat, lng))
+
+    def test_history_and_out_of_order_fixes(self):
+        ingestor = LocationIngestor(self.engine, keep_history=True)
+        now = datetime(2026, 1, 1, 12)
+        accepted = ingestor.submit_batch(5, [
+            (23.80, 90.40, now + timedelta(seconds=10)),
+            (23.70, 90.30, now),
+        ])
+        self.assertEqual(accepted, 2)
+        ingestor.flush()
+        # Older than what was already written
+        self.assertFalse(ingestor.submit(5, 23.60, 90.20, now + timedelta(seconds=5)))
+        ingestor.flush()
+
+        with self.engine.connect() as conn:
+            location = conn.execute(text('SELECT location_lat, location_lng FROM user WHERE id = 5')).one()
+            history = conn.execute(text('SELECT COUNT(*) FROM courier_position_history')).scalar()
+        self.assertEqual(tuple(location), (23.80, 90.40))
+        self.assertEqual(history, 3)
+
+    def test_late_fix_from_another_worker_is_ignored(self):
+        now = datetime(2026, 1, 1, 12)
+        first, other = LocationIngestor(self.engine), LocationIngestor(self.engine)
+        first.submit(5, 23.80, 90.40, now)
+        first.flush()
+        # This worker never saw the newer fix, so only the database can refuse it
+        self.assertTrue(other.submit(5, 23.70, 90.30, now - timedelta(minutes=5)))
+        other.flush()
+        with self.engine.connect() as conn:
+            location = conn.execute(text('SELECT location_lat, location_lng FROM user WHERE id = 5')).one()
+        self.assertEqual(tuple(location), (23.80, 90.40))
+
+    def test_timestamps_with_offsets_become_naive_utc(self):
+        for stamp in ('2026-01-01T18:00:00+06:00', '2026-01-01T12:00:00Z', '2026-01-01T12:00:00'):
+            self.assertEqual(parse_fix({'lat': 23.8, 'lng': 90.4, 'recorded_at': stamp})[2],
+                             datetime(2026, 1, 1, 12))
+        # Compared with fixes stamped by utcnow() without a TypeError
+        ingestor = LocationIngestor(self.engine)
+        ingestor.submit(5, 23.8, 90.4)
+        lat, lng, recorded_at = parse_fix({'lat': 23.8, 'lng': 90.4, 'recorded_at': '2026-01-01T12:00:00Z'})
+        self.assertFalse(ingestor.submit(5, lat, lng, recorded_at))
+
+    def test_out_of_range_epochs_are_value_errors(self):
+        for stamp in (1e20, -1e20, float('nan')):
+            with self.assertRaises(ValueError):
+                parse_fix({'lat': 23.8, 'lng': 90.4, 'recorded_at': stamp})
+
+    def test_future_fixes_are_clamped_to_now(self):
+        before = datetime.utcnow()
+        recorded_at = parse_fix({'lat': 23.8, 'lng': 90.4, 'recorded_at': '2099-01-01T00:00:00Z'})[2]
+        self.assertTrue(before <= recorded_at <= datetime.utcnow())
+
+        # So one bad clock doesn't lock out the honest fixes that follow it
+        ingestor = LocationIngestor(self.engine)
+        ingestor.submit(5, 23.80, 90.40, recorded_at)
+        ingestor.flush()
+        other = LocationIngestor(self.engine)
+        other.submit(5, 23.70, 90.30, datetime.utcnow() + timedelta(seconds=1))
+        other.flush()
+        with self.engine.connect() as conn:
+            location = conn.execute(text('SELECT location_lat, location_lng FROM user WHERE id = 5')).one()
+        self.assertEqual(tuple(location), (23.70, 90.30))
+
+    def test_profile_writes_do_not_reorder_fixes(self):
+        ingestor = LocationIngestor(self.engine)
+        ingestor.submit(5, 23.80, 90.40, datetime(2026, 1, 1, 12))
+        ingestor.flush()
+        with self.engine.begin() as conn:
+            conn.execute(text("UPDATE user SET updated_at = '2026-01-01 13:00:00' WHERE id = 5"))
+        other = LocationIngestor(self.engine)
+        other.submit(5, 23.70, 90.30, datetime(2026, 1, 1, 12, 30))
+        other.flush()
+        with self.engine.connect() as conn:
+            location = conn.execute(text('SELECT location_lat, location_lng FROM user WHERE id = 5')).one()
+        self.assertEqual(tuple(location), (23.70, 90.30))
+
+if __name__ == '__main__':
+    unittest.main()
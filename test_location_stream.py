@@ -0,0 +1,124 @@
+import threading
+import unittest
+from sqlalchemy import Column, Float, Integer, String, create_engine, event, text
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils import location_stream
+from ecommerce.utils.location_stream import PositionStore, may_track
+
+Base = declarative_base()
+
+class User(Base):
+    __tablename__ = 'user'
+    id = Column(Integer, primary_key=True)
+    role = Column(String(20))
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+
+class PositionStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.store = PositionStore(threshold_km=0.015)
+        self.loads = []
+
+    def loader(self, courier_id):
+        self.loads.append(courier_id)
+        return 23.7808, 90.4093, None
+
+    def test_streams_are_capped(self):
+        self.assertTrue(self.store.reserve(2))
+        self.assertTrue(self.store.reserve(2))
+        self.assertFalse(self.store.reserve(2))
+        self.store.release()
+        self.assertTrue(self.store.reserve(2))
+        self.assertEqual(self.store.streams, 2)
+
+    def test_small_moves_do_not_wake_subscribers(self):
+        self.assertTrue(self.store.publish(1, 23.7808, 90.4093))
+        self.assertFalse(self.store.publish(1, 23.78085, 90.4093))  # ~5m
+        self.assertTrue(self.store.publish(1, 23.7830, 90.4093))    # ~250m
+        self.assertEqual(self.store.latest(1)[:2], (23.7830, 90.4093))
+
+    def test_one_publish_fans_out_to_all_subscribers(self):
+        received = []
+        ready = threading.Barrier(51)
+
+        def track():
+            stream = self.store.subscribe(7, loader=self.loader, keepalive=5)
+            received.append(next(stream))  # Seeded position
+            ready.wait()
+            received.append(next(stream))  # Pushed move
+            stream.close()
+
+        threads = [threading.Thread(target=track) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+        ready.wait()
+        self.store.publish(7, 23.80, 90.42)
+        for thread in threads:
+            thread.join(timeout=5)
+
+        self.assertEqual(len(received), 100)
+        self.assertEqual(sum('"lat": 23.8,' in frame for frame in received), 50)
+        # The database is read once per courier, not once per viewer
+        self.assertEqual(self.loads, [7])
+        self.assertEqual(self.store.subscriber_count(7), 0)
+
+class PublishOnCommitTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        with Session(self.engine) as session:
+            session.add(User(id=7, role='delivery', location_lat=23.78, location_lng=90.40))
+            session.commit()
+        hooks = [(User, 'after_update', location_stream._publish_user_move),
+                 (Session, 'after_commit', location_stream._publish_committed),
+                 (Session, 'after_rollback', location_stream._forget_rolled_back)]
+        for target, name, fn in hooks:
+            event.listen(target, name, fn)
+            self.addCleanup(event.remove, target, name, fn)
+        self.store = PositionStore()
+        self.addCleanup(setattr, location_stream, 'position_store', location_stream.position_store)
+        location_stream.position_store = self.store
+
+    def test_rolled_back_moves_are_not_published(self):
+        with Session(self.engine) as session:
+            session.get(User, 7).location_lat = 23.90
+            session.flush()
+            self.assertIsNone(self.store.latest(7))
+            session.rollback()
+        self.assertIsNone(self.store.latest(7))
+
+        with Session(self.engine) as session:
+            session.get(User, 7).location_lat = 23.85
+            session.commit()
+        self.assertEqual(self.store.latest(7)[:2], (23.85, 90.40))
+
+class MayTrackTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.conn = self.engine.connect()
+        self.conn.execute(text('CREATE TABLE shop (id INTEGER PRIMARY KEY, owner_id INTEGER)'))
+        self.conn.execute(text(
+            'CREATE TABLE "order" (id INTEGER PRIMARY KEY, customer_id INTEGER, shop_id INTEGER, '
+            'delivery_person_id INTEGER, status VARCHAR(20))'
+        ))
+        self.conn.execute(text('INSERT INTO shop VALUES (1, 20)'))
+        self.conn.execute(text('INSERT INTO "order" VALUES (:id, :customer, 1, 7, :status)'), [
+            {'id': 1, 'customer': 10, 'status': 'delivering'},
+            {'id': 2, 'customer': 11, 'status': 'completed'},
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_only_parties_to_an_active_delivery(self):
+        self.assertTrue(may_track(self.conn, 7, 'delivery', 7))
+        self.assertTrue(may_track(self.conn, 1, 'admin', 7))
+        self.assertTrue(may_track(self.conn, 10, 'user', 7))
+        self.assertTrue(may_track(self.conn, 20, 'shop_owner', 7))
+        # A finished order, another courier, or a stranger
+        self.assertFalse(may_track(self.conn, 11, 'user', 7))
+        self.assertFalse(may_track(self.conn, 8, 'delivery', 7))
+        self.assertFalse(may_track(self.conn, 12, 'user', 7))
+
+if __name__ == '__main__':
+    unittest.main()
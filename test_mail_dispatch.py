@@ -0,0 +1,195 @@
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+from flask import Flask
+from flask_mail import Mail, Message
+from sqlalchemy import create_engine, text
+from ecommerce.utils.mail_dispatch import MailDispatcher, ensure_outbox_table
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept mail; records sessions and delivered messages"""
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 stand-in ESMTP')
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            if command in ('EHLO', 'HELO'):
+                self.reply('250 stand-in')
+            elif command == 'MAIL':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                address = line.split(':', 1)[1].strip('<> ')
+                with server.lock:
+                    flaky = address in server.flaky and address not in server.refused
+                    if flaky:
+                        server.refused.add(address)
+                if flaky:
+                    self.reply('451 Try again later')
+                else:
+                    recipients.append(address)
+                    self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.delivered.extend(recipients)
+                time.sleep(server.latency)
+                self.reply('250 OK')
+            elif command == 'RSET':
+                recipients = []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StandInSMTPHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.delivered = []
+        self.flaky = set()
+        self.refused = set()
+        self.latency = 0.001
+
+class MailDispatcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.smtp = StandInSMTPServer()
+        threading.Thread(target=self.smtp.serve_forever, daemon=True).start()
+
+        self.app = Flask(__name__)
+        self.app.config.update(
+            MAIL_SERVER='127.0.0.1',
+            MAIL_PORT=self.smtp.server_address[1],
+            MAIL_USE_TLS=False,
+            MAIL_DEFAULT_SENDER='noreply@quickshop.test'
+        )
+        self.mail = Mail(self.app)
+        self.dispatcher = MailDispatcher(self.app, self.mail, pool_size=2, retry_delay=0.01)
+        self.dispatcher.start()
+
+    def tearDown(self):
+        self.dispatcher.stop()
+        self.smtp.shutdown()
+        self.smtp.server_close()
+
+    def fan_out(self, count):
+        with self.app.app_context():
+            return [
+                Message('Delivery Service Update', recipients=[f'courier{i}@quickshop.test'], html='<p>Hi</p>')
+                for i in range(count)
+            ]
+
+    def test_fan_out_reuses_connections(self):
+        messages = self.fan_out(200)
+        started = time.perf_counter()
+        self.dispatcher.submit(messages)
+        submit_time = time.perf_counter() - started
+        self.dispatcher.join()
+
+        self.assertEqual(len(self.smtp.delivered), 200)
+        self.assertEqual(self.dispatcher.sent, 200)
+        # One session per pool worker, not one per message
+        self.assertLessEqual(self.smtp.connections, 2)
+        # Queuing the fan-out is all the request pays for
+        self.assertLess(submit_time, 0.05)
+
+    def test_transient_failures_are_retried(self):
+        self.smtp.flaky = {'courier3@quickshop.test', 'courier7@quickshop.test'}
+        self.dispatcher.submit(self.fan_out(10))
+        self.dispatcher.join()
+
+        self.assertEqual(sorted(self.smtp.delivered), sorted(f'courier{i}@quickshop.test' for i in range(10)))
+        self.assertEqual(self.dispatcher.failed, 0)
+
+    def test_full_queue_spills_to_outbox_and_drains(self):
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine(f'sqlite:///{db_path}')
+        with engine.begin() as conn:
+            ensure_outbox_table(conn)
+
+        self.smtp.latency = 0.02
+        bounded = MailDispatcher(
+            self.app, self.mail, pool_size=1, chunk_size=5, queue_depth=1,
+            put_timeout=0.01, retry_delay=0.01, engine=engine, outbox_poll=0.05
+        )
+        bounded.start()
+        try:
+            started = time.perf_counter()
+            bounded.submit(self.fan_out(60))
+            # A full queue costs the caller at most put_timeout per batch
+            self.assertLess(time.perf_counter() - started, 0.5)
+            self.assertGreater(bounded.stats()['spilled'], 0)
+
+            deadline = time.monotonic() + 10
+            while len(self.smtp.delivered) < 60 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            bounded.stop()
+
+        with engine.connect() as conn:
+            remaining = conn.execute(text('SELECT COUNT(*) FROM email_outbox')).scalar()
+        engine.dispose()
+        os.remove(db_path)
+
+        self.assertEqual(sorted(set(self.smtp.delivered)), sorted(f'courier{i}@quickshop.test' for i in range(60)))
+        self.assertEqual(remaining, 0)
+        stats = bounded.stats()
+        self.assertEqual(stats['sent'], 60)
+        self.assertEqual(stats['workers'], 0)
+        self.assertGreater(stats['latency_max'], 0)
+
+    def test_unreachable_server_spills_to_outbox(self):
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        engine = create_engine(f'sqlite:///{db_path}')
+        with engine.begin() as conn:
+            ensure_outbox_table(conn)
+        self.smtp.shutdown()
+        self.smtp.server_close()
+
+        dispatcher = MailDispatcher(self.app, self.mail, pool_size=1, max_retries=1, retry_delay=0.01,
+                                    engine=engine, outbox_poll=60)
+        dispatcher.start()
+        try:
+            dispatcher.submit(self.fan_out(8))
+            dispatcher.join()
+        finally:
+            dispatcher.stop(timeout=1)
+        with engine.connect() as conn:
+            kept = conn.execute(text('SELECT COUNT(*) FROM email_outbox')).scalar()
+        engine.dispose()
+        os.remove(db_path)
+
+        self.assertEqual(kept, 8)
+        self.assertEqual((dispatcher.failed, dispatcher.spilled), (0, 8))
+
+    def test_stop_drains_queue(self):
+        self.smtp.latency = 0.005
+        self.dispatcher.submit(self.fan_out(30))
+        self.dispatcher.stop()
+        self.assertEqual(len(self.smtp.delivered), 30)
+        self.assertEqual(self.dispatcher.stats()['queue_depth'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
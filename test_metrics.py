@@ -0,0 +1,71 @@
+import unittest
+from flask import Flask, render_template
+from jinja2 import DictLoader
+from sqlalchemy import create_engine, text
+from ecommerce.utils.metrics import init_metrics
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.app = self.make_app(slow_threshold=0)
+        self.client = self.app.test_client()
+
+    def make_app(self, slow_threshold, **config):
+        app = Flask(__name__)
+        app.config['METRICS_ENABLED'] = True
+        app.config['SLOW_REQUEST_THRESHOLD'] = slow_threshold
+        app.config.update(config)
+        app.jinja_loader = DictLoader({'shops.html': '{% for s in shops %}{{ s }},{% endfor %}'})
+        init_metrics(app, engines=[self.engine])
+
+        @app.route('/shops')
+        def shops():
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1')).fetchall()
+                rows = conn.execute(text("SELECT 'Dhaka Fresh Mart' UNION SELECT 'Rahim Grocery'")).fetchall()
+            return render_template('shops.html', shops=[row[0] for row in rows])
+
+        @app.route('/broken')
+        def broken():
+            with self.engine.connect() as conn:
+                try:
+                    conn.execute(text('SELECT * FROM missing_table'))
+                except Exception:
+                    pass
+            return 'ok'
+
+        return app
+
+    def test_request_sql_and_template_metrics(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get('/shops').data, b'Dhaka Fresh Mart,Rahim Grocery,')
+        self.client.get('/broken')
+        body = self.client.get('/metrics').get_data(as_text=True)
+
+        self.assertIn('quickshop_request_duration_seconds_count{endpoint="shops",method="GET",status="200"} 3', body)
+        self.assertIn('quickshop_request_duration_seconds_bucket{endpoint="shops",method="GET",status="200",le="+Inf"} 3',
+                      body)
+        self.assertIn('quickshop_sql_statements_total{endpoint="shops"} 6', body)
+        self.assertIn('quickshop_sql_statements_total{endpoint="broken"} 0', body)
+        self.assertIn('quickshop_template_render_seconds_count{template="shops.html"} 3', body)
+        # The scrape itself is not counted
+        self.assertNotIn('endpoint="metrics"', body)
+
+    def test_metrics_are_off_by_default_and_can_require_a_token(self):
+        self.assertIsNone(init_metrics(Flask(__name__), engines=[self.engine]))
+
+        client = self.make_app(slow_threshold=0, METRICS_TOKEN='scrape-secret').test_client()
+        self.assertEqual(client.get('/metrics').status_code, 401)
+        self.assertEqual(client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_request_log_lists_statements(self):
+        app = self.make_app(slow_threshold=1e-9)
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            app.test_client().get('/shops')
+        self.assertIn('Slow request GET /shops (shops)', logs.output[0])
+        self.assertIn("SELECT 'Dhaka Fresh Mart'", logs.output[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import tempfile
+import unittest
+from sqlalchemy import create_engine, inspect, text
+from ecommerce.utils.migrations import MIGRATIONS, applied_versions, run_migrations
+from ecommerce.utils.query_plans import HOT_QUERIES, full_scans
+
+# Tables as db.create_all() made them before any migration
+BASE_SCHEMA = [
+    '''CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(80) NOT NULL, email VARCHAR(120) NOT NULL,
+       role VARCHAR(20) NOT NULL, location_lat FLOAT, location_lng FLOAT, created_at DATETIME,
+       updated_at DATETIME, is_active BOOLEAN)''',
+    '''CREATE TABLE shop (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, owner_id INTEGER NOT NULL,
+       location_lat FLOAT NOT NULL, location_lng FLOAT NOT NULL, is_active BOOLEAN)''',
+    '''CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, price FLOAT NOT NULL,
+       shop_id INTEGER NOT NULL, created_at DATETIME)''',
+    '''CREATE TABLE "order" (id INTEGER PRIMARY KEY, customer_id INTEGER NOT NULL, shop_id INTEGER NOT NULL,
+       delivery_person_id INTEGER, status VARCHAR(20) NOT NULL, created_at DATETIME, updated_at DATETIME)''',
+    '''CREATE TABLE order_item (id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+       quantity INTEGER NOT NULL)''',
+    '''CREATE TABLE negotiation (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, customer_id INTEGER NOT NULL,
+       status VARCHAR(20) NOT NULL, created_at DATETIME)''',
+    '''CREATE TABLE delivery_negotiation (id INTEGER PRIMARY KEY, order_id INTEGER NOT NULL,
+       customer_id INTEGER NOT NULL, status VARCHAR(20) NOT NULL)''',
+    '''CREATE TABLE cart_item (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, product_id INTEGER NOT NULL,
+       quantity INTEGER NOT NULL)''',
+]
+
+class MigrationsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        self.engine = create_engine(f'sqlite:///{self.db_path}')
+        with self.engine.begin() as conn:
+            for statement in BASE_SCHEMA:
+                conn.execute(text(statement))
+            conn.execute(text(
+                "INSERT INTO shop VALUES (1, 'Dhaka Fresh Mart', 1, 23.7806, 90.4070, 1)"
+            ))
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_applies_each_version_once(self):
+        applied = run_migrations(self.engine)
+        self.assertEqual([step.version for step in applied], [step.version for step in MIGRATIONS])
+        self.assertEqual(run_migrations(self.engine), [])
+
+        with self.engine.connect() as conn:
+            self.assertEqual(applied_versions(conn), {step.version for step in MIGRATIONS})
+            columns = {column['name'] for column in inspect(conn).get_columns('user')}
+            self.assertTrue({'email_notifications', 'geo_cell', 'last_digest_at', 'location_recorded_at'} <= columns)
+            self.assertIsNotNone(conn.execute(text('SELECT geo_cell FROM shop')).scalar())
+
+    def test_target_stops_early(self):
+        applied = run_migrations(self.engine, target='0003')
+        self.assertEqual([step.version for step in applied], ['0001', '0002', '0003'])
+        self.assertEqual(run_migrations(self.engine)[0].version, '0004')
+
+    def test_replays_over_schema_migrated_before_versioning(self):
+        # Older databases already have the columns but no schema_migration rows
+        with self.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE "user" ADD COLUMN email_notifications BOOLEAN DEFAULT 1'))
+            conn.execute(text('ALTER TABLE product ADD COLUMN category VARCHAR(50)'))
+        self.assertEqual(len(run_migrations(self.engine)), len(MIGRATIONS))
+
+    def test_hot_queries_use_indexes(self):
+        run_migrations(self.engine, target='0009')
+        with self.engine.connect() as conn:
+            # The analytics tables arrive in 0012
+            queries = [query for query in HOT_QUERIES if not query.name.startswith('analytics_')]
+            scanned = {name for name, step in full_scans(conn, queries)}
+        self.assertIn('customer_orders', scanned)
+        self.assertIn('cart_contents', scanned)
+
+        run_migrations(self.engine)
+        with self.engine.connect() as conn:
+            self.assertEqual(full_scans(conn), [])
+
+if __name__ == '__main__':
+    unittest.main()
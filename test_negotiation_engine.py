@@ -0,0 +1,70 @@
+import unittest
+from types import SimpleNamespace
+import numpy as np
+from ecommerce.utils.ai.negotiation_bot import DeliveryNegotiationBot, NegotiationBot
+from ecommerce.utils.ai.negotiation_engine import (
+    DECISIONS, delivery_terms, evaluate_offer, evaluate_offers, product_terms, terms_table
+)
+
+def bot_decision(bot, offer, rounds):
+    bot.negotiation_rounds = rounds - 1
+    decision, counter, _ = bot.evaluate_offer(offer)
+    return decision, counter
+
+class NegotiationEngineTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        prices = np.round(rng.uniform(5, 500, 300), 2)
+        self.products = [
+            SimpleNamespace(price=price, min_price=round(price * floor, 2), max_discount_percentage=discount)
+            for price, floor, discount in zip(
+                prices, rng.uniform(0.5, 0.95, 300), rng.choice([5.0, 10.0, 20.0, 35.0], 300)
+            )
+        ]
+        # Offers from 40% to 105% of each list price, including exact boundaries
+        self.fractions = np.concatenate([np.linspace(0.4, 1.05, 40), [1.0]])
+
+    def test_scalar_core_matches_bot(self):
+        for product in self.products[:50]:
+            bot = NegotiationBot(product)
+            for fraction in self.fractions:
+                offer = product.price * fraction
+                for rounds in (1, 3, 6):
+                    self.assertEqual(evaluate_offer(product_terms(product), offer, rounds),
+                                     bot_decision(bot, offer, rounds))
+            self.assertEqual(evaluate_offer(product_terms(product), product.min_price),
+                             bot_decision(bot, product.min_price, 1))
+
+    def test_batch_matches_bot_exactly(self):
+        table = terms_table([product_terms(product) for product in self.products])
+        offers = table.price[:, None] * self.fractions[None, :]
+        for rounds in (1, 2, 5):
+            codes, counters = evaluate_offers(
+                table._replace(**{field: getattr(table, field)[:, None] for field in table._fields}),
+                offers, rounds
+            )
+            self.assertEqual(codes.shape, offers.shape)
+            for i, product in enumerate(self.products):
+                bot = NegotiationBot(product)
+                for j in range(offers.shape[1]):
+                    decision, counter = bot_decision(bot, offers[i, j], rounds)
+                    self.assertEqual(DECISIONS[codes[i, j]], decision)
+                    if counter is None:
+                        self.assertTrue(np.isnan(counters[i, j]))
+                    else:
+                        self.assertEqual(counters[i, j], counter)
+
+    def test_delivery_terms_match_delivery_bot(self):
+        order = SimpleNamespace(delivery_lat=23.75, delivery_lng=90.39,
+                                shop=SimpleNamespace(location_lat=23.81, location_lng=90.41))
+        bot = DeliveryNegotiationBot(order)
+        terms = delivery_terms(bot.base_fee, bot.min_fee)
+        offers = np.linspace(bot.min_fee - 1, bot.base_fee + 1, 200)
+        codes, counters = evaluate_offers(terms, offers, 2)
+        for offer, code, counter in zip(offers, codes, counters):
+            decision, expected = bot_decision(bot, offer, 2)
+            self.assertEqual(DECISIONS[code], decision)
+            self.assertEqual(None if np.isnan(counter) else counter, expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from sqlalchemy import create_engine, event, text
+from ecommerce.utils.analytics import ensure_analytics_tables
+from ecommerce.utils.ai.negotiation_bot import NegotiationBot
+from ecommerce.utils.ai.negotiation_session import NegotiationSessionManager
+
+class NegotiationSessionTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE product (id INTEGER PRIMARY KEY, price FLOAT, min_price FLOAT, '
+                'max_discount_percentage FLOAT, shop_id INTEGER)'
+            ))
+            conn.execute(text(
+                'CREATE TABLE negotiation (id INTEGER PRIMARY KEY, product_id INTEGER, '
+                'initial_price FLOAT, offered_price FLOAT, counter_price FLOAT, final_price FLOAT, '
+                'status VARCHAR(20), rounds INTEGER, updated_at DATETIME)'
+            ))
+            ensure_analytics_tables(conn)
+            conn.execute(text('INSERT INTO product VALUES (1, 100.0, 80.0, 20.0, 1)'))
+            conn.execute(text(
+                "INSERT INTO negotiation (id, product_id, initial_price, offered_price, status, rounds) "
+                "VALUES (1, 1, 100.0, 82.0, 'pending', 0)"
+            ))
+        self.manager = NegotiationSessionManager(engine=self.engine)
+
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute', self.record_statement)
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def record_statement(self, conn, cursor, statement, *args):
+        self.statements.append(statement.split()[0].upper())
+
+    def stored(self):
+        with self.engine.connect() as conn:
+            return conn.execute(text(
+                'SELECT rounds, status, offered_price, counter_price, final_price FROM negotiation WHERE id = 1'
+            )).one()
+
+    def test_rounds_carry_over_like_one_long_lived_bot(self):
+        reference = NegotiationBot(SimpleNamespace(price=100.0, min_price=80.0, max_discount_percentage=20.0))
+        offers = [82.0, 84.0, 83.0, 86.0, 99.0]
+        for offer in offers:
+            self.assertEqual(self.manager.offer('product', 1, offer), reference.evaluate_offer(offer))
+        rounds, status, offered, counter, final = self.stored()
+        self.assertEqual((rounds, offered), (len(offers), offers[-1]))
+        self.assertEqual(status, 'accepted')
+        self.assertEqual(final, offers[-1])
+
+    def test_cached_round_is_one_update(self):
+        self.manager.offer('product', 1, 82.0)
+        self.statements.clear()
+        self.manager.offer('product', 1, 83.0)
+        self.assertEqual(self.statements, ['UPDATE'])
+        self.assertEqual(self.manager.hits, 1)
+
+    def test_orm_object_refreshed(self):
+        negotiation = SimpleNamespace(id=1, rounds=0, status='pending', offered_price=82.0, counter_price=None)
+        decision, counter, _ = self.manager.offer('product', 1, 82.0, negotiation)
+        self.assertEqual(decision, 'counter')
+        self.assertEqual((negotiation.rounds, negotiation.status, negotiation.counter_price),
+                         (1, 'counter_offer', counter))
+
+    def test_change_from_elsewhere_reloads_session(self):
+        self.manager.offer('product', 1, 82.0)
+        with self.engine.begin() as conn:
+            # Another worker handled a round meanwhile
+            conn.execute(text('UPDATE negotiation SET rounds = 3 WHERE id = 1'))
+        self.manager.offer('product', 1, 82.0)
+        self.assertEqual(self.manager.conflicts, 1)
+        self.assertEqual(self.stored().rounds, 4)
+
+    def test_null_status_is_not_a_conflict(self):
+        with self.engine.begin() as conn:
+            conn.execute(text('UPDATE negotiation SET status = NULL WHERE id = 1'))
+        self.assertEqual(self.manager.offer('product', 1, 82.0)[0], 'counter')
+        self.assertEqual(self.manager.conflicts, 0)
+        self.assertEqual(self.stored().status, 'counter_offer')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from flask import Flask
+from flask_mail import Mail
+from jinja2 import DictLoader
+from sqlalchemy import create_engine, text
+from ecommerce.utils.notification_digest import NotificationDigester, ensure_notification_tables, set_digest_minutes
+
+class RecordingDispatcher:
+    def __init__(self):
+        self.messages = []
+
+    def submit(self, messages):
+        self.messages.extend(messages)
+
+class NotificationDigestTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        with self.engine.begin() as conn:
+            conn.execute(text(
+                'CREATE TABLE "user" (id INTEGER PRIMARY KEY, username VARCHAR(80), email VARCHAR(120), '
+                'role VARCHAR(20), email_notifications BOOLEAN NOT NULL DEFAULT 1, '
+                'notification_digest_minutes INTEGER NOT NULL DEFAULT 0, last_digest_at DATETIME)'
+            ))
+            conn.execute(text(
+                'INSERT INTO "user" (id, username, email, role, email_notifications, notification_digest_minutes) '
+                'VALUES (:id, :username, :email, :role, :on, :minutes)'
+            ), [
+                {'id': 1, 'username': 'ops', 'email': 'ops@test.com', 'role': 'admin', 'on': True, 'minutes': 0},
+                {'id': 2, 'username': 'boss', 'email': 'boss@test.com', 'role': 'admin', 'on': True, 'minutes': 60},
+                {'id': 3, 'username': 'quiet', 'email': 'quiet@test.com', 'role': 'admin', 'on': False, 'minutes': 0},
+            ])
+            ensure_notification_tables(conn)
+
+        self.app = Flask(__name__)
+        self.app.jinja_loader = DictLoader({
+            'email/order_status_update.html': 'Order {{ order.id }}: {{ changes|map(attribute="new")|join(",") }}',
+            'email/admin_order_notification.html': 'Order {{ order.id }}: {{ change.old }} -> {{ change.new }}',
+            'email/admin_order_digest.html': '{% for order, change in summary %}{{ order.id }};{% endfor %}',
+        })
+        Mail(self.app)
+        self.dispatcher = RecordingDispatcher()
+        self.app.extensions['mail_dispatcher'] = self.dispatcher
+
+        customers = {
+            'rahim': SimpleNamespace(email='rahim@test.com', email_notifications=True),
+            'karim': SimpleNamespace(email='karim@test.com', email_notifications=False),
+        }
+        self.orders = {
+            order_id: SimpleNamespace(id=order_id, customer=customers['karim' if order_id == 99 else 'rahim'])
+            for order_id in list(range(1, 11)) + [99]
+        }
+        self.digester = NotificationDigester(
+            self.app, self.engine, window=60, max_delay=300,
+            order_loader=lambda ids: {i: self.orders[i] for i in ids}
+        )
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.path)
+
+    def later(self, seconds):
+        return datetime.utcnow() + timedelta(seconds=seconds)
+
+    def sent_to(self, address):
+        return [msg for msg in self.dispatcher.messages if msg.recipients == [address]]
+
+    def test_customer_changes_coalesce_per_order(self):
+        for status in ('confirmed', 'preparing', 'delivering'):
+            self.digester.record('customer', 1, new_status=status)
+        self.digester.record('customer', 2, new_status='confirmed')
+        self.digester.record('customer', 99, new_status='confirmed')
+
+        self.digester.flush(now=self.later(30))
+        self.assertEqual(self.dispatcher.messages, [])
+
+        self.digester.flush(now=self.later(61))
+        self.assertEqual(len(self.sent_to('rahim@test.com')), 2)
+        self.assertEqual(self.dispatcher.messages[0].html, 'Order 1: confirmed,preparing,delivering')
+        # Opted-out customers get nothing, and their changes are not kept
+        self.assertEqual(self.sent_to('karim@test.com'), [])
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT COUNT(*) FROM notification_event')).scalar(), 0)
+
+    def test_busy_order_is_sent_after_max_delay(self):
+        self.digester.record('customer', 1, new_status='confirmed')
+        with self.engine.begin() as conn:
+            conn.execute(text('UPDATE notification_event SET created_at = :old'),
+                         {'old': datetime.utcnow() - timedelta(seconds=301)})
+        self.digester.record('customer', 1, new_status='preparing')
+        self.digester.flush(now=self.later(1))
+        self.assertEqual(len(self.dispatcher.messages), 1)
+
+    def test_admin_digests_follow_each_admins_interval(self):
+        for order_id in range(1, 11):
+            for old, new in (('pending', 'confirmed'), ('confirmed', 'delivering')):
+                self.digester.record('admin', order_id, {'old': old, 'new': new, 'action': 'update'})
+
+        self.digester.flush(now=self.later(10))
+        # One digest each for the admins who want email, instead of 20 emails apiece
+        self.assertEqual(len(self.sent_to('ops@test.com')), 1)
+        self.assertEqual(len(self.sent_to('boss@test.com')), 1)
+        self.assertEqual(self.sent_to('quiet@test.com'), [])
+        self.assertEqual(self.sent_to('ops@test.com')[0].html, '1;2;3;4;5;6;7;8;9;10;')
+
+        self.digester.record('admin', 3, {'old': 'delivering', 'new': 'completed', 'action': 'update'})
+        with self.engine.begin() as conn:
+            # Keep the clock consistent with the simulated flush times
+            conn.execute(text('UPDATE notification_event SET created_at = :at WHERE new_status = :new'),
+                         {'at': self.later(20), 'new': 'completed'})
+        self.digester.flush(now=self.later(20))
+        self.assertEqual(len(self.dispatcher.messages), 2)
+
+        # Past the ops window: a single order gets the regular notification
+        self.digester.flush(now=self.later(80))
+        self.assertEqual(self.sent_to('ops@test.com')[-1].html, 'Order 3: delivering -> completed')
+        self.assertEqual(len(self.sent_to('boss@test.com')), 1)
+
+        self.digester.flush(now=self.later(3700))
+        self.assertEqual(len(self.sent_to('boss@test.com')), 2)
+
+    def test_digest_interval_is_one_of_the_choices(self):
+        with self.engine.begin() as conn:
+            self.assertEqual(set_digest_minutes(conn, 1, '240'), 240)
+            for bad in (7, -15, 'hourly', None):
+                with self.assertRaises(ValueError):
+                    set_digest_minutes(conn, 1, bad)
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.execute(text('SELECT notification_digest_minutes FROM "user" WHERE id = 1')).scalar(),
+                             240)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+from flask import Flask, render_template_string, session
+from sqlalchemy import Column, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils.page_cache import PageCache, _listen, cache_fragment, cached_page, page_cache
+
+Base = declarative_base()
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    shop_id = Column(Integer, ForeignKey('shop.id'))
+
+class PageCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        page_cache.clear()
+        self.renders = 0
+        self.shops = {1: 'Dhaka Fresh Mart'}
+        app = Flask(__name__)
+        app.secret_key = 'test'
+        app.jinja_env.globals['cache_fragment'] = cache_fragment
+
+        @app.route('/shop/<int:shop_id>')
+        @cached_page('shops', 'shop:{shop_id}')
+        def view(shop_id):
+            self.renders += 1
+            return f'<h2>{self.shops[shop_id]}</h2>'
+
+        @app.route('/login')
+        def login():
+            session['_user_id'] = '5'
+            return 'ok'
+
+        @app.route('/grid/<int:shop_id>')
+        def grid(shop_id):
+            return render_template_string(
+                "{{ user }}:{% call cache_fragment('grid:%d' % shop_id, 'shop:%d' % shop_id) %}"
+                "<li>{{ products() }}</li>{% endcall %}",
+                user=session.get('_user_id', 'anon'), shop_id=shop_id, products=self.product_grid)
+
+        self.app = app
+        self.client = app.test_client()
+
+    def product_grid(self):
+        self.renders += 1
+        return 'Miniket Rice'
+
+    def test_anonymous_pages_cached_until_scope_invalidated(self):
+        first = self.client.get('/shop/1')
+        self.assertEqual(self.client.get('/shop/1').data, b'<h2>Dhaka Fresh Mart</h2>')
+        self.assertEqual(self.renders, 1)
+        self.assertTrue(first.headers['ETag'])
+        self.assertTrue(first.headers['Last-Modified'])
+        self.assertIn('no-cache', first.headers['Cache-Control'])
+
+        self.shops[1] = 'Dhaka Fresh Mart & Bakery'
+        page_cache.invalidate('shop:2')
+        self.assertEqual(self.client.get('/shop/1').data, b'<h2>Dhaka Fresh Mart</h2>')
+        page_cache.invalidate('shop:1')
+        self.assertEqual(self.client.get('/shop/1').data, b'<h2>Dhaka Fresh Mart & Bakery</h2>')
+        self.assertEqual(self.renders, 2)
+
+    def test_conditional_get(self):
+        etag = self.client.get('/shop/1').headers['ETag']
+        response = self.client.get('/shop/1', headers={'If-None-Match': etag})
+        self.assertEqual((response.status_code, response.data), (304, b''))
+
+        # Signed-in pages are rendered every time but still revalidate
+        self.client.get('/login')
+        response = self.client.get('/shop/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('Last-Modified', response.headers)
+        self.assertEqual(self.renders, 2)
+
+    def test_fragment_shared_across_users(self):
+        self.assertEqual(self.client.get('/grid/1').data, b'anon:<li>Miniket Rice</li>')
+        self.client.get('/login')
+        self.assertEqual(self.client.get('/grid/1').data, b'5:<li>Miniket Rice</li>')
+        self.assertEqual(self.renders, 1)
+
+    def test_unreachable_backend_renders(self):
+        class Down:
+            errors = (ConnectionError,)
+
+            def versions(self, scopes):
+                raise ConnectionError
+
+            def bump(self, scopes):
+                raise ConnectionError
+
+        cache = PageCache(Down())
+        self.assertEqual(cache.lookup('page:/', ['shops']), (None, None))
+        cache.invalidate('shops')
+        self.assertEqual(cache.errors, 2)
+
+class InvalidationTestCase(unittest.TestCase):
+    def setUp(self):
+        page_cache.clear()
+        _listen(Shop, Product)
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+
+    def versions(self):
+        return page_cache.backend.versions(['shops', 'shop:1'])
+
+    def test_writes_invalidate_after_commit(self):
+        with Session(self.engine) as session:
+            session.add(Shop(id=1, name='Rahim Grocery'))
+            session.flush()
+            self.assertEqual(self.versions(), [0, 0])
+            session.commit()
+        self.assertEqual(self.versions(), [1, 1])
+
+        with Session(self.engine) as session:
+            session.add(Product(name='Masoor Dal', shop_id=1))
+            session.commit()
+        self.assertEqual(self.versions(), [1, 2])
+
+        with Session(self.engine) as session:
+            session.add(Product(name='Mishti Doi', shop_id=1))
+            session.flush()
+            session.rollback()
+        self.assertEqual(self.versions(), [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
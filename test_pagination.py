@@ -0,0 +1,107 @@
+import unittest
+from datetime import datetime, timedelta
+from sqlalchemy import Column, DateTime, Integer, String, create_engine, event
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils.pagination import CountCache, decode_cursor, keyset_paginate, keyset_slice, order_status_counts
+
+Base = declarative_base()
+
+class Order(Base):
+    __tablename__ = 'order'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+def walk(fetch):
+    """Follow next cursors from the first page; returns every page"""
+    pages = [fetch(None)]
+    while pages[-1].has_next:
+        pages.append(fetch(pages[-1].next_cursor))
+    return pages
+
+class KeysetPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        self.session = Session(self.engine)
+        start = datetime(2025, 3, 1, 9, 0)
+        # Three orders share each timestamp, so the id breaks ties
+        self.session.add_all([
+            Order(id=n, customer_id=1 if n % 4 else 2, status='completed' if n % 3 else 'pending',
+                  created_at=start + timedelta(minutes=n // 3))
+            for n in range(1, 101)
+        ])
+        self.session.commit()
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, parameters, *args: self.statements.append(
+                         (statement, parameters)))
+
+    def tearDown(self):
+        self.session.close()
+
+    def page(self, cursor, per_page=7, descending=True):
+        return keyset_paginate(
+            self.session.query(Order).filter(Order.customer_id == 1),
+            [Order.created_at, Order.id], cursor=cursor, per_page=per_page, descending=descending
+        )
+
+    def expected(self, descending=True):
+        orders = self.session.query(Order).filter(Order.customer_id == 1).all()
+        return sorted((o.id for o in orders), key=lambda i: (self.session.get(Order, i).created_at, i),
+                      reverse=descending)
+
+    def test_forward_pages_cover_every_row_once(self):
+        for descending in (True, False):
+            pages = walk(lambda cursor: self.page(cursor, descending=descending))
+            ids = [order.id for page in pages for order in page]
+            self.assertEqual(ids, self.expected(descending))
+            self.assertFalse(pages[0].has_prev)
+            self.assertTrue(all(page.has_prev for page in pages[1:]))
+
+    def test_previous_cursor_returns_the_same_page(self):
+        pages = walk(self.page)
+        for earlier, later in zip(pages, pages[1:]):
+            back = self.page(later.prev_cursor)
+            self.assertEqual([o.id for o in back], [o.id for o in earlier])
+            self.assertEqual(back.has_prev, earlier.has_prev)
+            self.assertTrue(back.has_next)
+
+    def test_deep_pages_never_offset(self):
+        pages = walk(self.page)
+        self.assertEqual(len(self.statements), len(pages))
+        # SQLite renders LIMIT as "LIMIT ? OFFSET ?"; the offset never moves
+        self.assertEqual({parameters[-1] for statement, parameters in self.statements}, {0})
+        self.assertEqual({parameters[-2] for statement, parameters in self.statements}, {8})
+
+    def test_mangled_cursor_starts_over(self):
+        self.assertEqual(decode_cursor('not-a-cursor'), (None, False))
+        self.assertEqual([o.id for o in self.page('not-a-cursor')], [o.id for o in self.page(None)])
+
+    def test_status_counts_are_cached(self):
+        cache = CountCache()
+        conn = self.session.connection()
+        counts = order_status_counts(conn, 'customer_id', 1, cache=cache)
+        self.assertEqual(counts['all'], 75)
+        self.assertEqual(counts['pending'] + counts['completed'], 75)
+        self.assertEqual(counts['cancelled'], 0)
+        self.assertIs(order_status_counts(conn, 'customer_id', 1, cache=cache), counts)
+        self.assertEqual(cache.hits, 1)
+        with self.assertRaises(ValueError):
+            order_status_counts(conn, 'status', 'pending', cache=cache)
+
+class KeysetSliceTestCase(unittest.TestCase):
+    def test_distance_ties_split_by_id(self):
+        matches = sorted([(shop_id, round(shop_id / 10) * 0.5) for shop_id in range(1, 48)],
+                         key=lambda match: (match[1], match[0]))
+        key = lambda match: (match[1], match[0])
+        pages = walk(lambda cursor: keyset_slice(matches, key, cursor, per_page=5))
+        self.assertEqual([match for page in pages for match in page], matches)
+        self.assertEqual(pages[0].total, 47)
+
+        back = keyset_slice(matches, key, pages[3].prev_cursor, per_page=5)
+        self.assertEqual(back.items, pages[2].items)
+
+if __name__ == '__main__':
+    unittest.main()
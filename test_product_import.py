@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from sqlalchemy import create_engine, text
+from ecommerce.utils.product_import import import_products
+from ecommerce.utils.search_index import ensure_search_index, suggest, SuggestionCache
+
+def catalog_csv(rows):
+    lines = ['name,description,price,stock,category,min_price,max_discount,image']
+    lines += [','.join(str(value) for value in row) for row in rows]
+    return io.BytesIO(('\n'.join(lines) + '\n').encode())
+
+class ProductImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.conn = self.engine.connect()
+        self.conn.execute(text(
+            'CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL, description TEXT, '
+            'price FLOAT NOT NULL, stock INTEGER NOT NULL, shop_id INTEGER NOT NULL, image_url VARCHAR(255), '
+            'category VARCHAR(50), created_at DATETIME, min_price FLOAT, max_discount_percentage FLOAT)'
+        ))
+        ensure_search_index(self.conn)
+        self.folder = tempfile.mkdtemp()
+        self.images = os.path.join(self.folder, 'import')
+        self.products_dir = os.path.join(self.folder, 'products')
+        os.makedirs(self.images)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.folder)
+
+    def save_image(self, name, color, size=(2000, 1500)):
+        Image.new('RGB', size, color).save(os.path.join(self.images, name))
+
+    def test_streams_valid_rows_in_chunks(self):
+        rows = [(f'Miniket Rice {n}', 'Premium', 420 + n, 10, 'Grocery', '', '', '') for n in range(2500)]
+        rows[10] = ('', 'No name', 10, 1, '', '', '', '')
+        rows[20] = ('Broken Price', '', 'abc', 1, '', '', '', '')
+        rows[30] = ('Cheap Floor', '', 10, 1, '', 12, '', '')
+        rows[40] = ('Hilsa Fish 1kg', 'Padma', 1400, 5, 'Fish', 1100, 15, '')
+
+        report = import_products(self.conn, 7, catalog_csv(rows), chunk_size=300)
+        self.assertEqual(report.inserted, 2497)
+        self.assertEqual([(e.line, e.message) for e in report.errors], [
+            (12, 'name is required'), (22, 'price must be a number'), (32, 'min_price is above price'),
+        ])
+        hilsa = self.conn.execute(text(
+            "SELECT shop_id, min_price, max_discount_percentage FROM product WHERE name = 'Hilsa Fish 1kg'"
+        )).one()
+        self.assertEqual(tuple(hilsa), (7, 1100.0, 15.0))
+        names = [row['name'] for row in suggest(self.conn, 'hilsa', cache=SuggestionCache())]
+        self.assertEqual(names, ['Hilsa Fish 1kg'])
+
+    def test_jsonl(self):
+        lines = [
+            json.dumps({'name': 'Fresh Milk 1L', 'price': 90, 'stock': 40, 'category': 'Dairy'}),
+            'not json',
+            json.dumps({'name': 'Mishti Doi', 'price': 120, 'stock': 12, 'min_price': 100}),
+        ]
+        report = import_products(self.conn, 1, io.BytesIO('\n'.join(lines).encode()), fmt='jsonl')
+        self.assertEqual(report.inserted, 2)
+        self.assertEqual(report.errors[0].line, 2)
+        self.assertEqual(self.conn.execute(text(
+            "SELECT max_discount_percentage FROM product WHERE name = 'Mishti Doi'"
+        )).scalar(), 20.0)
+
+    def test_images_normalized_and_deduplicated(self):
+        self.save_image('rice.png', 'white')
+        shutil.copy(os.path.join(self.images, 'rice.png'), os.path.join(self.images, 'rice-copy.png'))
+        self.save_image('dal.png', 'orange', size=(400, 800))
+        with open(os.path.join(self.images, 'broken.jpg'), 'wb') as f:
+            f.write(b'not an image')
+        rows = [
+            ('Miniket Rice', '', 420, 5, '', '', '', 'rice.png'),
+            ('Chinigura Rice', '', 160, 5, '', '', '', 'rice-copy.png'),
+            ('Masoor Dal', '', 135, 5, '', '', '', 'dal.png'),
+            ('Broken', '', 1, 1, '', '', '', 'broken.jpg'),
+            ('Escape', '', 1, 1, '', '', '', '../../etc/passwd'),
+            ('No Image', '', 1, 1, '', '', '', ''),
+            ('Basmati Rice', '', 250, 5, '', '', '', 'rice.png'),
+        ]
+        report = import_products(self.conn, 1, catalog_csv(rows), image_root=self.images,
+                                 products_dir=self.products_dir, workers=2)
+        self.assertEqual(report.inserted, 5)
+        self.assertEqual(report.images, 4)
+        self.assertEqual(sorted(e.line for e in report.errors), [5, 6])
+
+        urls = dict(self.conn.execute(text('SELECT name, image_url FROM product')).fetchall())
+        self.assertEqual(urls['Miniket Rice'], urls['Chinigura Rice'])
+        self.assertEqual(urls['Miniket Rice'], urls['Basmati Rice'])
+        self.assertNotEqual(urls['Miniket Rice'], urls['Masoor Dal'])
+        self.assertIsNone(urls['No Image'])
+
+        stored = sorted(os.path.relpath(os.path.join(root, name), self.products_dir)
+                        for root, _, names in os.walk(self.products_dir) for name in names)
+        self.assertEqual(len(stored), 6)  # two images x (webp, thumbnail, jpeg), no temp files left
+        with Image.open(os.path.join(self.products_dir, urls['Miniket Rice'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (1200, 900)))
+        with Image.open(os.path.join(self.products_dir, urls['Masoor Dal'][:-5] + '_thumb.webp')) as image:
+            self.assertEqual(image.size, (150, 300))
+
+if __name__ == '__main__':
+    unittest.main()
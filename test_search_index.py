@@ -0,0 +1,118 @@
+import unittest
+from sqlalchemy import Boolean, Column, Float, Integer, String, create_engine, event, text
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils import search_index
+from ecommerce.utils.query_counter import QueryCounter
+from ecommerce.utils.search_index import SuggestionCache, rebuild_search_index, suggest
+
+Base = declarative_base()
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    is_active = Column(Boolean, default=True)
+
+class Product(Base):
+    __tablename__ = 'product'
+    id = Column(Integer, primary_key=True)
+    shop_id = Column(Integer)
+    name = Column(String(100))
+    category = Column(String(50))
+    price = Column(Float)
+    stock = Column(Integer)
+
+class SearchIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        self.conn = self.engine.connect()
+        self.conn.execute(text('CREATE TABLE shop (id INTEGER PRIMARY KEY, name TEXT, is_active BOOLEAN)'))
+        self.conn.execute(text(
+            'CREATE TABLE product (id INTEGER PRIMARY KEY, shop_id INTEGER, name TEXT, category TEXT, price FLOAT)'
+        ))
+        self.conn.execute(text('INSERT INTO shop VALUES (:id, :name, :active)'), [
+            {'id': 1, 'name': 'Rahim Grocery', 'active': True},
+            {'id': 2, 'name': 'Dhaka Fresh Mart', 'active': True},
+            {'id': 3, 'name': 'Closed Grocer', 'active': False},
+        ])
+        self.conn.execute(text('INSERT INTO product VALUES (:id, :shop_id, :name, :category, :price)'), [
+            {'id': 1, 'shop_id': 1, 'name': 'Miniket Rice 5kg', 'category': 'Grocery', 'price': 420.0},
+            {'id': 2, 'shop_id': 2, 'name': 'Chinigura Rice', 'category': 'Grocery', 'price': 160.0},
+            {'id': 3, 'shop_id': 2, 'name': 'Fresh Milk', 'category': 'Dairy', 'price': 90.0},
+        ])
+        self.assertEqual(rebuild_search_index(self.conn), 5)
+        self.cache = SuggestionCache()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def names(self, query, **kwargs):
+        return [row['name'] for row in suggest(self.conn, query, cache=self.cache, **kwargs)]
+
+    def test_prefix_matches_products_and_shops(self):
+        self.assertEqual(self.names('ric'), ['Chinigura Rice', 'Miniket Rice 5kg'])
+        self.assertEqual(self.names('gro'), ['Rahim Grocery', 'Chinigura Rice', 'Miniket Rice 5kg'])
+        self.assertEqual(self.names('fresh mi'), ['Fresh Milk'])
+
+    def test_shop_filter(self):
+        self.assertEqual(self.names('rice', shop_id=1), ['Miniket Rice 5kg'])
+        self.assertEqual(self.names('dhaka', shop_id=2), [])
+
+    def test_inactive_shops_are_not_suggested(self):
+        self.assertNotIn('Closed Grocer', self.names('clos'))
+
+    def test_cache_is_invalidated(self):
+        self.names('milk')
+        self.assertEqual(self.names('milk'), ['Fresh Milk'])
+        self.assertEqual(self.cache.hits, 1)
+        self.cache.invalidate()
+        self.names('milk')
+        self.assertEqual(self.cache.hits, 1)
+
+class IndexHooksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(text("INSERT INTO product VALUES (1, 1, 'Fresh Milk', 'Dairy', 90.0, 10)"))
+            rebuild_search_index(conn)
+        hooks = [(Product, 'after_insert', search_index._index_product),
+                 (Product, 'after_update', search_index._reindex_product),
+                 (Session, 'after_commit', search_index._invalidate_committed),
+                 (Session, 'after_rollback', search_index._forget_rolled_back)]
+        for target, name, fn in hooks:
+            event.listen(target, name, fn)
+            self.addCleanup(event.remove, target, name, fn)
+        self.addCleanup(self.engine.dispose)
+
+    def names(self, query):
+        with self.engine.connect() as conn:
+            return [row['name'] for row in suggest(conn, query)]
+
+    def test_stock_updates_skip_the_index(self):
+        self.names('milk')
+        with Session(self.engine) as session:
+            with QueryCounter(self.engine) as counter:
+                session.get(Product, 1).stock = 9
+                session.commit()
+        # The SELECT and the UPDATE, no FTS writes; cached suggestions stay valid
+        self.assertEqual(counter.count, 2)
+        hits = search_index.suggestion_cache.hits
+        self.names('milk')
+        self.assertEqual(search_index.suggestion_cache.hits, hits + 1)
+
+    def test_renames_invalidate_on_commit(self):
+        self.assertEqual(self.names('milk'), ['Fresh Milk'])
+        with Session(self.engine) as session:
+            session.get(Product, 1).name = 'Pasteurised Milk'
+            session.flush()
+            session.rollback()
+        self.assertEqual(self.names('milk'), ['Fresh Milk'])
+
+        with Session(self.engine) as session:
+            session.get(Product, 1).name = 'Pasteurised Milk'
+            session.commit()
+        self.assertEqual(self.names('milk'), ['Pasteurised Milk'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+import numpy as np
+from sqlalchemy import Boolean, Column, Float, Integer, String, create_engine, event
+from sqlalchemy.orm import Session, declarative_base
+from ecommerce.utils import spatial_index
+from ecommerce.utils.distance import calculate_distance
+from ecommerce.utils.spatial_index import SpatialIndex, cell_key, cells_within
+
+Base = declarative_base()
+
+class Shop(Base):
+    __tablename__ = 'shop'
+    id = Column(Integer, primary_key=True)
+    location_lat = Column(Float)
+    location_lng = Column(Float)
+    is_active = Column(Boolean, default=True)
+    geo_cell = Column(String(32))
+
+class SpatialIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.points = {
+            i: (23.78 + lat, 90.41 + lng)
+            for i, (lat, lng) in enumerate(rng.uniform(-0.4, 0.4, (2000, 2)))
+        }
+        self.index = SpatialIndex()
+        for item_id, (lat, lng) in self.points.items():
+            self.index.update(item_id, lat, lng)
+        self.origin = (23.7808, 90.4093)
+
+    def brute_force(self):
+        return sorted(
+            (calculate_distance(*self.origin, lat, lng), item_id)
+            for item_id, (lat, lng) in self.points.items()
+        )
+
+    def test_within_radius_matches_brute_force(self):
+        expected = [item_id for distance, item_id in self.brute_force() if distance <= 5]
+        found = [item_id for item_id, _ in self.index.within_radius(*self.origin, 5)]
+        self.assertEqual(found, expected)
+
+    def test_nearest_matches_brute_force(self):
+        expected = [item_id for _, item_id in self.brute_force()[:8]]
+        found = [item_id for item_id, _ in self.index.nearest(*self.origin, 8)]
+        self.assertEqual(found, expected)
+
+    def test_incremental_moves(self):
+        self.index.update(0, *self.origin)
+        self.assertEqual(self.index.nearest(*self.origin, 1)[0][0], 0)
+
+        self.index.update(0, 24.5, 91.5)
+        self.assertNotIn(0, [item_id for item_id, _ in self.index.within_radius(*self.origin, 5)])
+
+        self.index.update(0, None, None)
+        self.assertNotIn(0, self.index)
+        self.assertEqual(len(self.index), len(self.points) - 1)
+
+    def test_cell_keys_cover_radius(self):
+        lat, lng = self.points[42]
+        self.assertIn(cell_key(lat, lng), cells_within(*self.origin, 100))
+        self.assertIsNone(cell_key(None, 90.4))
+
+class IndexHooksTestCase(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Base.metadata.create_all(self.engine)
+        hooks = [(Shop, 'after_insert', spatial_index._sync_shop),
+                 (Shop, 'after_update', spatial_index._sync_shop),
+                 (Session, 'after_commit', spatial_index._apply_committed),
+                 (Session, 'after_rollback', spatial_index._forget_rolled_back)]
+        for target, name, fn in hooks:
+            event.listen(target, name, fn)
+            self.addCleanup(event.remove, target, name, fn)
+        spatial_index.shop_index.clear()
+        self.addCleanup(spatial_index.shop_index.clear)
+
+    def test_moves_apply_on_commit_only(self):
+        with Session(self.engine) as session:
+            shop = Shop(id=1, location_lat=23.78, location_lng=90.41)
+            session.add(shop)
+            session.flush()
+            self.assertNotIn(1, spatial_index.shop_index)
+            session.commit()
+            self.assertEqual(spatial_index.shop_index.position(1), (23.78, 90.41))
+
+            shop.is_active = False
+            session.flush()
+            session.rollback()
+            self.assertEqual(spatial_index.shop_index.position(1), (23.78, 90.41))
+
+    def test_stale_index_reloads(self):
+        self.addCleanup(setattr, spatial_index, '_loaded', spatial_index._loaded)
+        self.addCleanup(setattr, spatial_index, '_reload_after', spatial_index._reload_after)
+        spatial_index._loaded, spatial_index._reload_after = True, 60
+        spatial_index._loaded_at = spatial_index.time.monotonic()
+        self.assertFalse(spatial_index._stale())
+        spatial_index._loaded_at -= 61
+        self.assertTrue(spatial_index._stale())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import current_user, login_required
+from ecommerce import db
+from ecommerce.utils.location_ingest import MAX_BATCH_SIZE, parse_fix
+from ecommerce.utils.location_stream import load_courier_position, may_track, position_store
+
+tracking_bp = Blueprint('tracking', __name__)
+
+@tracking_bp.route('/api/delivery/location/<int:delivery_person_id>/stream')
+@login_required
+def delivery_location_stream(delivery_person_id):
+    """Server-sent-events feed of a delivery person's position"""
+    allowed = may_track(db.session.connection(), current_user.id, current_user.role, delivery_person_id)
+    # Don't hold a pooled connection for as long as the stream stays open
+    db.session.remove()
+    if not allowed:
+        return jsonify({'status': 'error', 'message': 'You cannot track this delivery person'}), 403
+
+    if not position_store.reserve(current_app.config.get('LOCATION_STREAM_LIMIT')):
+        # The tracking page falls back to polling when the stream is refused
+        response = jsonify({'status': 'error', 'message': 'Too many live trackers, poll instead'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    try:
+        stream = position_store.subscribe(delivery_person_id, loader=load_courier_position)
+        response = Response(
+            stream_with_context(stream),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+            }
+        )
+        # Runs when the server closes the response, including after a failed iteration
+        response.call_on_close(position_store.release)
+    except Exception:
+        position_store.release()
+        raise
+    return response
+
+@tracking_bp.route('/api/delivery/location', methods=['POST'])
+@login_required
+def report_delivery_location():
+    """Accept one GPS fix, or a batch of them under `fixes`, from a delivery person"""
+    if current_user.role != 'delivery':
+        return jsonify({'status': 'error', 'message': 'Only delivery persons can report locations'}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'message': 'Send a JSON object'}), 400
+    raw_fixes = data.get('fixes', [data])
+    if not isinstance(raw_fixes, list) or len(raw_fixes) > MAX_BATCH_SIZE:
+        return jsonify({'status': 'error', 'message': f'Send at most {MAX_BATCH_SIZE} fixes per request'}), 400
+
+    try:
+        fixes = [parse_fix(fix) for fix in raw_fixes]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid location data'}), 400
+
+    # Buffered in memory; written to the database in the next bulk flush
+    accepted = current_app.extensions['location_ingestor'].submit_batch(current_user.id, fixes)
+    return jsonify({'status': 'success', 'accepted': accepted}), 202
@@ -1,11 +1,10 @@
 from ecommerce import create_app, db
+from ecommerce.utils.migrations import run_migrations
 
 app = create_app()
 
 with app.app_context():
-    # Add the new column
-    with db.engine.connect() as conn:
-        conn.execute('ALTER TABLE user ADD COLUMN email_notifications BOOLEAN DEFAULT TRUE')
-        conn.commit()
+    # Schema changes are versioned in ecommerce.utils.migrations
+    run_migrations(db.engine, log=print)
 
 print("Database updated successfully!")